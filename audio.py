@@ -1,20 +1,17 @@
 import threading
-import asyncio
 import warnings
 import ollama 
-import whisper
-import speech_recognition as sr
-import numpy as np
 import torch
-import json
-from datetime import datetime, timedelta
+from datetime import datetime
+from functools import partial
 from queue import Queue
-from time import sleep
-import pyaudio
-from text import transliterate_text
+from capture import AudioCapture, iter_events
 from text_to_speech import text_to_speech
-from ollamaHelper import init_responder, responder
-from threatHelper import init_threat_responder, threat_responder
+from pipeline import CallPipeline
+from session import sessions
+from threatHelper import ticket_fields
+from tracing import set_call
+from transcriber import StreamingTranscriber
 
 warnings.filterwarnings("ignore", category=FutureWarning, module="whisper")
 warnings.filterwarnings("ignore", category=UserWarning, module="whisper")
@@ -27,17 +24,28 @@ class AudioHandler:
         self.is_running = False
         self.data_queue = Queue()
         self.audio_thread = None
-        self.recorder = None
-        self.stop_listening = None
+        self.capture = None
+        # Anything with AudioCapture's interface; benchmarks feed recorded audio through it
+        self.capture_factory = AudioCapture
+        # Plays the greeting and each reply sentence; the call server sends them to the caller instead
+        self.speaker = text_to_speech
+        # listener(kind, **fields) hears transcripts, replies and the end of the call
+        self.listener = None
         self.user_id = ""
-        self.ticket = {}
+        self.session = None
+        self.pipeline = None
+
+    def _notify(self, kind, **fields):
+        if self.listener:
+            self.listener(kind, **fields)
         
     def start_audio(self):
         if self.is_running:
             return
         
-        self.user_id = datetime.now().strftime("%Y%m%d%H%M%S%f")[:17]
-        self.ticket[self.user_id] = []
+        self.session = sessions.create("audio")
+        self.user_id = self.session.call_id
+        self.data_queue = Queue()
         self.is_running = True
         self.audio_thread = threading.Thread(target=self._audio_process)
         self.audio_thread.daemon = True
@@ -48,104 +56,86 @@ class AudioHandler:
             return
             
         self.is_running = False
-        if self.stop_listening:
-            self.stop_listening(wait_for_stop=False)
-        if self.audio_thread:
+        if self.capture:
+            self.capture.stop()
+        # The consumer blocks on the queue; the sentinel wakes it so the join returns at once
+        self.data_queue.put(None)
+        if self.audio_thread and threading.current_thread() != self.audio_thread:
             self.audio_thread.join(timeout=1.0)
-        self.data_queue.queue.clear()
-        
-        # Save final ticket state if there are any threats
-        if self.ticket[self.user_id]:
-            with open("ticket_log.json", "w+") as f:
-                json.dump(self.ticket, f, indent=2)
-                
-        self.ticket = {}
+        sessions.end(self.user_id)
                                         
     def _audio_process(self):
         # Filter out warnings
         warnings.filterwarnings("ignore", category=UserWarning)
         torch.set_warn_always(False)
 
-        # Load Whisper
-        whisper_model = whisper.load_model("base")
-        phrase_time = None
-        
-        self.recorder = sr.Recognizer()
-        self.recorder.energy_threshold = 1000
-        self.recorder.dynamic_energy_threshold = False
-
-        source = sr.Microphone(sample_rate=16000)
-        
-        with source:
-            self.recorder.adjust_for_ambient_noise(source)
+        session = self.session
+        set_call(session.call_id)
+        # Shared Whisper instance, loaded once per process
+        whisper_model = session.whisper_model
 
-        def callback_record(_, audio: sr.AudioData) -> None:
+        def callback_record(event):
             if self.is_running:
-                data = audio.get_raw_data()
-                self.data_queue.put(data)
+                self.data_queue.put(event)
 
-        self.stop_listening = self.recorder.listen_in_background(source, callback_record, phrase_time_limit=5)
+        # VAD endpointing replaces the fixed energy threshold and phrase timeout
+        self.capture = self.capture_factory(callback_record)
+        self.capture.start()
 
-        phrase_timeout = 3
-        transcription = ['']
+        transcriber = StreamingTranscriber(whisper_model, service=session.transcription)
+        # Bind this call's session so threat scores that finish after the call ends still land on its ticket
+        pipeline = CallPipeline(session, on_threat=partial(self._record_threat, session), speaker=self.speaker)
+        self.pipeline = pipeline
         
         print("\n\n Recording started \n\n")
-        threat_response = init_threat_responder()
-        initial_response = init_responder()
+        initial_response = session.start()
         if initial_response[0]:
-            text_to_speech(initial_response[1])
+            self._notify("reply", text=initial_response[1], end_call=False)
+            self.speaker(initial_response[1])
+        reason = "stopped"
 
-        while self.is_running:
+        events = iter_events(self.data_queue, lambda: self.is_running,
+                             partial(pipeline.timings.record, "handoff"))
+        for event in events:
             try:
-                now = datetime.utcnow()
-                
-                if not self.data_queue.empty():
-                    phrase_complete = False
-                    if phrase_time and now - phrase_time > timedelta(seconds=phrase_timeout):
-                        phrase_complete = True
-
-                    phrase_time = now
-                    audio_data = b''.join(self.data_queue.queue)
-                    self.data_queue.queue.clear()
-
-                    audio_np = np.frombuffer(audio_data, dtype=np.int16).astype(np.float32) / 32768.0
-
-                    result = whisper_model.transcribe(audio_np)
-                    text = result['text'].strip()
-
-                    if phrase_complete and len(text) > 0:
-                        print("\n**  "+text+"  **", flush=True)
-                        val = responder(text)
-                        if val[0] == False:
-                            self.stop_audio()
-                            break
-
-                        tranliterated_text = transliterate_text(val[1])
-                        text_to_speech(tranliterated_text)
-                        
-                        # Process threat and update ticket
-                        threat = asyncio.run(threat_responder(text))
-                        if threat[0] == True:
-                            # Format the ticket entry
-                            ticket_entry = {
-                                "type": "audio_threat",
-                                "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S.%f"),
-                                "message": text,
-                                "details": threat[1]
-                            }
-                            self.ticket[self.user_id].append(ticket_entry)
-                            
-                            # Save ticket immediately
-                            with open("ticket_log.json", "w+") as f:
-                                json.dump(self.ticket, f, indent=2)
-                            # print("******** TICKET:", self.ticket[self.user_id], "********")
-
-                    print('', end='', flush=True)
-                    
-                else:
-                    sleep(0.25)
+                if event.kind != "end":
+                    transcriber.feed(event.audio)
+                    continue
+
+                # The caller stopped talking
+                with pipeline.timings.measure("transcribe"):
+                    text = transcriber.finalize().text
+
+                if len(text) > 0:
+                    print("\n**  "+text+"  **", flush=True)
+                    self._notify("transcript", text=text)
+                    # Threat scoring runs alongside the reply and writes its own ticket
+                    val = pipeline.process(text)
+                    self._notify("reply", text=val[1], end_call=not val[0])
+                    if val[0] == False:
+                        reason = "responder"
+                        self.stop_audio()
+                        break
+
+                print('', end='', flush=True)
             except Exception as e:
                 print(f"Error in audio processing: {e}")
+                reason = "error"
                 break
 
-        print("\n\n Recording stopped \n\n")
\ No newline at end of file
+        pipeline.close()
+        print("Stage timings:", pipeline.timings.summary())
+        self._notify("ended", reason=reason, timings=pipeline.timings.summary())
+        print("\n\n Recording stopped \n\n")
+
+    def _record_threat(self, session, text, threat):
+        if threat[0] == True:
+            # Format the ticket entry
+            ticket_entry = {
+                "type": "audio_threat",
+                "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S.%f"),
+                "message": text,
+                **ticket_fields(threat[1])
+            }
+            # Save ticket immediately
+            session.record_ticket(ticket_entry)
\ No newline at end of file
@@ -0,0 +1,139 @@
+"""
+Concurrent callers against the call server.
+
+    python -m benchmarks.call_server --callers 1,4,16 --turns 5
+    python -m benchmarks.call_server --audio benchmarks/fixtures/fire.wav --callers 4
+
+Starts a call server in this process (or joins --server host:port) with the
+models behind a stand-in Ollama, then runs N text callers at once, each
+typing the caller lines, or N audio callers streaming a WAV file as PCM in
+real time (times --speed). Reports reply latency p50/p95 per concurrency
+level: for text, from sending a line to its reply; for audio, from the
+end of each utterance's transcript to its reply.
+"""
+import argparse
+import json
+import os
+import tempfile
+import threading
+import time
+
+
+def text_caller(address, turns, latencies, errors):
+    from benchmarks.context_latency import CALLER_LINES
+    from callClient import CallClient
+    try:
+        client = CallClient(address)
+        client.start("text")
+        client.next_reply()
+        for turn in range(turns):
+            start = time.perf_counter()
+            reply = client.ask(CALLER_LINES[turn % len(CALLER_LINES)])
+            if reply is None or reply["type"] != "reply":
+                raise RuntimeError(f"call ended early: {reply}")
+            latencies.append(time.perf_counter() - start)
+        client.end()
+    except Exception as e:
+        errors.append(str(e))
+
+
+def audio_caller(address, pcm, speed, latencies, errors):
+    from callClient import CallClient
+    transcribed = []
+
+    def on_message(header, payload):
+        if header["type"] == "transcript":
+            transcribed.append(time.perf_counter())
+        elif header["type"] == "reply" and transcribed:
+            latencies.append(time.perf_counter() - transcribed.pop())
+
+    try:
+        client = CallClient(address, on_message=on_message)
+        client.start("audio")
+        chunk = 16000 * 2 * 30 // 1000
+        for offset in range(0, len(pcm), chunk):
+            client.send_audio(pcm[offset:offset + chunk])
+            time.sleep(0.03 / speed)
+        # Silence so the last utterance ends, then time for its reply
+        client.send_audio(bytes(16000 * 2))
+        deadline = time.monotonic() + 30
+        while transcribed and time.monotonic() < deadline:
+            time.sleep(0.05)
+        client.end()
+    except Exception as e:
+        errors.append(str(e))
+
+
+def run(address, callers, args, pcm=None):
+    from latency import percentile
+    latencies, errors = [], []
+    if pcm is None:
+        targets = [(text_caller, (address, args.turns, latencies, errors)) for _ in range(callers)]
+    else:
+        targets = [(audio_caller, (address, pcm, args.speed, latencies, errors)) for _ in range(callers)]
+    threads = [threading.Thread(target=target, args=target_args) for target, target_args in targets]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return {
+        "callers": callers,
+        "replies": len(latencies),
+        "errors": errors,
+        "wall_seconds": time.perf_counter() - started,
+        "reply_p50": percentile(latencies, 50),
+        "reply_p95": percentile(latencies, 95),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--callers", default="1,4,16", help="comma-separated concurrency levels")
+    parser.add_argument("--turns", type=int, default=5, help="lines each text caller types")
+    parser.add_argument("--audio", help="WAV file each caller streams instead of typing")
+    parser.add_argument("--speed", type=float, default=1.0)
+    parser.add_argument("--server", help="host:port of a running call server")
+    parser.add_argument("--first-token", type=float, default=0.3, help="stand-in latency to first token")
+    parser.add_argument("--per-token", type=float, default=0.02, help="stand-in latency per token")
+    parser.add_argument("--json", help="write the results to this file")
+    args = parser.parse_args()
+
+    fake = server = None
+    address = args.server
+    if address is None:
+        from benchmarks.fake_ollama import FakeOllama
+        fake = FakeOllama(first_token=args.first_token, per_token=args.per_token).start()
+        # Read by the Ollama client when it is first created
+        os.environ["OLLAMA_HOST"] = fake.url
+        os.environ["TICKET_LOG"] = os.path.join(tempfile.mkdtemp(prefix="bench-"), "tickets.jsonl")
+        os.environ.setdefault("TTS_AUDIO_SINK", "null")
+        from callServer import CallServer
+        server = CallServer("127.0.0.1", 0).start_background()
+        address = server.address
+
+    pcm = None
+    if args.audio:
+        from benchmarks.end_to_end import load_wav
+        pcm = load_wav(args.audio)
+
+    try:
+        results = [run(address, int(callers), args, pcm) for callers in args.callers.split(",")]
+    finally:
+        if server:
+            server.stop()
+        if fake:
+            fake.stop()
+
+    for result in results:
+        p50, p95 = result["reply_p50"], result["reply_p95"]
+        print(f"{result['callers']:>3} callers: {result['replies']} replies  "
+              f"p50 {p50 if p50 is None else round(p50, 3)}  p95 {p95 if p95 is None else round(p95, 3)}  "
+              f"wall {result['wall_seconds']:.1f}s  errors {len(result['errors'])}")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""
+Two-model (responder + threat) vs combined single-request turns.
+
+    python -m benchmarks.combined_mode --turns 20 --json combined.json
+    python -m benchmarks.combined_mode --fake --prompt-rate 2000
+
+Each mode runs the same caller lines through a GUI-style text call
+(CallPipeline without speech). Reports reply and threat-ticket latency,
+model requests per turn, and Ollama's prompt/output token throughput.
+Talks to OLLAMA_HOST and needs the `responder` and `threat` models, or
+uses the stand-in server with --fake. Threat pre-triage is off unless
+--triage is given, so the two-model path asks the threat model every turn.
+
+Without speech, combined reply_total runs until the whole JSON object
+(reply and assessment) is done, so compare it with the two-model
+threat_total as well as its reply_total.
+"""
+import argparse
+import json
+import os
+import time
+
+
+def run(mode, turns, triage):
+    from benchmarks.context_latency import CALLER_LINES
+    from ollamaClient import reset_stats, usage_stats
+    from latency import percentile
+    from pipeline import CallPipeline
+    from session import CallSession
+
+    session = CallSession(mode="benchmark", triage=triage)
+    tickets = []
+    pipeline = CallPipeline(session, on_threat=lambda text, threat: tickets.append(threat), speak=False,
+                            shouldPrint=False, combined=mode == "combined")
+    session.start(False)
+    reset_stats()
+    started = time.perf_counter()
+    for turn in range(turns):
+        pipeline.process(CALLER_LINES[turn % len(CALLER_LINES)])
+    pipeline.close()
+    wall = time.perf_counter() - started
+
+    samples = pipeline.timings.samples()
+    usage = usage_stats()
+    requests = sum(values["requests"] for values in usage.values())
+    return {
+        "mode": mode,
+        "turns": turns,
+        "wall_seconds": wall,
+        "requests_per_turn": requests / turns,
+        "prompt_tokens_per_turn": sum(values["prompt_tokens"] for values in usage.values()) / turns,
+        "tickets": len(tickets),
+        "latency": {
+            stage: {"p50": percentile(samples[stage], 50), "p95": percentile(samples[stage], 95)}
+            for stage in ("reply_total", "threat_total", "ticket_write") if samples.get(stage)
+        },
+        "usage": usage,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--turns", type=int, default=20)
+    parser.add_argument("--modes", default="two-model,combined")
+    parser.add_argument("--triage", action="store_true", help="keep local threat pre-triage on")
+    parser.add_argument("--fake", action="store_true", help="use the stand-in Ollama server")
+    parser.add_argument("--first-token", type=float, default=0.3, help="stand-in latency to first token")
+    parser.add_argument("--per-token", type=float, default=0.02, help="stand-in latency per token")
+    parser.add_argument("--prompt-rate", type=float, default=2000.0, help="stand-in prompt tokens/second")
+    parser.add_argument("--json", help="write the results to this file")
+    args = parser.parse_args()
+
+    server = None
+    if args.fake:
+        from benchmarks.fake_ollama import FakeOllama
+        server = FakeOllama(first_token=args.first_token, per_token=args.per_token,
+                            prompt_rate=args.prompt_rate).start()
+        # Read by the Ollama client when it is first created
+        os.environ["OLLAMA_HOST"] = server.url
+    try:
+        results = [run(mode, args.turns, args.triage) for mode in args.modes.split(",")]
+    finally:
+        if server:
+            server.stop()
+
+    for result in results:
+        latency = "  ".join(f"{stage} p50 {values['p50']:.3f} p95 {values['p95']:.3f}"
+                            for stage, values in result["latency"].items())
+        print(f"{result['mode']:>10}: {result['requests_per_turn']:.2f} requests/turn  "
+              f"{result['prompt_tokens_per_turn']:.0f} prompt tokens/turn  wall {result['wall_seconds']:.1f}s  {latency}")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+"""
+Per-turn responder latency over a long call, with and without the bounded
+conversation context.
+
+    python -m benchmarks.context_latency --turns 60 --json context.json
+
+Talks to the Ollama server in OLLAMA_HOST and needs the `responder` model.
+"""
+import argparse
+import json
+import time
+from conversationContext import estimate_tokens
+from ollamaHelper import responder
+from session import CallSession
+
+CALLER_LINES = [
+    "There's a fire in the apartment next to mine.",
+    "I'm on the third floor, the smoke is coming under the door.",
+    "My address is 1420 Pine Street, apartment 3B.",
+    "There are two kids with me, they're scared.",
+    "I can hear people shouting in the hallway.",
+    "The smoke is getting thicker, what should I do?",
+    "Okay, I put wet towels under the door.",
+    "I think I hear sirens now.",
+]
+
+
+def run(mode, turns):
+    session = CallSession(mode="benchmark")
+    rows = []
+    for turn in range(turns):
+        text = CALLER_LINES[turn % len(CALLER_LINES)]
+        start = time.perf_counter()
+        if mode == "bounded":
+            session.respond(text, shouldPrint=False)
+            prompt_tokens = session.context.last_prompt_tokens
+        else:
+            responder(text, False, history=session.messages)
+            prompt_tokens = estimate_tokens(session.messages)
+        rows.append({"turn": turn, "seconds": time.perf_counter() - start, "prompt_tokens": prompt_tokens})
+        print(f"{mode:8} turn {turn:3}  {rows[-1]['seconds']:6.2f}s  ~{prompt_tokens} prompt tokens", flush=True)
+    return rows
+
+
+def trend(rows, window=10):
+    head = [r["seconds"] for r in rows[:window]]
+    tail = [r["seconds"] for r in rows[-window:]]
+    return {"first_mean": sum(head) / len(head), "last_mean": sum(tail) / len(tail)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--turns", type=int, default=40)
+    parser.add_argument("--modes", default="full,bounded")
+    parser.add_argument("--json", help="write per-turn results to this file")
+    args = parser.parse_args()
+
+    results = {}
+    for mode in args.modes.split(","):
+        rows = run(mode, args.turns)
+        results[mode] = {"turns": rows, "trend": trend(rows)}
+        print(f"{mode}: first 10 turns {results[mode]['trend']['first_mean']:.2f}s, "
+              f"last 10 turns {results[mode]['trend']['last_mean']:.2f}s")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,435 @@
+"""
+End-to-end per-stage latency: recorded calls go through the same code as a
+live call and every stage reports p50/p95/p99.
+
+    python -m benchmarks.end_to_end --fixtures benchmarks/fixtures --json e2e.json
+    python -m benchmarks.end_to_end --json e2e-new.json --baseline e2e.json
+
+Scenarios:
+  audio  every *.wav in --fixtures is played into AudioHandler in real time
+         (or --speed times faster) in place of the microphone
+  video  every *.mp4/*.avi/*.mov clip is played into VideoHandler in place of
+         the camera, with the audio from a .wav of the same name if present
+  chat   the caller lines are typed into a GUI-style text session, and the
+         replies are transliterated and synthesized as in a voice call
+
+Without fixtures, audio and video use a synthetic call: voiced harmonic
+bursts the VAD picks up as utterances (Whisper transcribes little of
+them, but every stage still runs) and a moving block as the camera.
+
+The models are served by a local stand-in for Ollama (benchmarks.fake_ollama)
+with --first-token / --per-token latency, TTS output goes to a null audio
+sink, and tickets go to a throwaway log. Whisper runs for real (--whisper).
+With --tts fake, synthesis is a fixed --tts-latency sleep instead of gTTS.
+Stages: vad, transcribe, responder, transliterate, tts, threat, ticket_write
+and the call-level totals. All durations are in seconds.
+"""
+import argparse
+import glob
+import json
+import os
+import subprocess
+import tempfile
+import threading
+import time
+import wave
+import numpy as np
+
+SAMPLE_RATE = 16000
+STAGES = ["vad", "transcribe", "responder", "transliterate", "tts", "threat", "ticket_write"]
+
+
+def load_wav(path, sample_rate=SAMPLE_RATE):
+    """16-bit mono PCM bytes at `sample_rate` from a 16-bit WAV file"""
+    with wave.open(path, "rb") as f:
+        if f.getsampwidth() != 2:
+            raise ValueError(f"{path}: only 16-bit WAV files are supported")
+        channels, rate = f.getnchannels(), f.getframerate()
+        samples = np.frombuffer(f.readframes(f.getnframes()), dtype=np.int16)
+    samples = samples.reshape(-1, channels).mean(axis=1)
+    if rate != sample_rate:
+        positions = np.arange(0, len(samples), rate / sample_rate)
+        samples = np.interp(positions, np.arange(len(samples)), samples)
+    return samples.astype(np.int16).tobytes()
+
+
+class FixtureCapture:
+    """
+    Drop-in for AudioCapture that plays a recording through the VAD at
+    `speed` times real time, then a second of silence so the last utterance
+    ends. VAD time per block goes to `timings` as "vad".
+    """
+
+    def __init__(self, on_event, pcm, timings, speed=1.0, frame_ms=30):
+        from vad import VoiceActivityDetector
+        self.on_event = on_event
+        self.pcm = pcm + bytes(SAMPLE_RATE * 2)
+        self.timings = timings
+        self.speed = speed
+        self.frame_bytes = SAMPLE_RATE * frame_ms // 1000 * 2
+        self.vad = VoiceActivityDetector(sample_rate=SAMPLE_RATE, frame_ms=frame_ms)
+        self.utterances = 0
+        self.done = threading.Event()
+        self._stopped = False
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        block_seconds = self.frame_bytes / 2 / SAMPLE_RATE / self.speed
+        started = time.monotonic()
+        for index, offset in enumerate(range(0, len(self.pcm), self.frame_bytes)):
+            if self._stopped:
+                break
+            delay = started + index * block_seconds - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            with self.timings.measure("vad"):
+                events = self.vad.process(self.pcm[offset:offset + self.frame_bytes])
+            for event in events:
+                self.utterances += event.kind == "end"
+                self.on_event(event)
+        self.done.set()
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stopped = True
+
+
+def synthetic_speech(utterances=3, voiced=1.5, silence=0.8, sample_rate=SAMPLE_RATE):
+    """Speech-like 16-bit PCM: harmonic bursts with a gliding pitch and syllable-rate loudness"""
+    rng = np.random.default_rng(0)
+    # Leading silence lets the VAD settle its noise floor
+    parts = [np.zeros(int(silence * sample_rate))]
+    for index in range(utterances):
+        t = np.arange(int(voiced * sample_rate)) / sample_rate
+        pitch = 120 + 40 * np.sin(2 * np.pi * 0.7 * t + index)
+        phase = 2 * np.pi * np.cumsum(pitch) / sample_rate
+        voice = sum(np.sin(k * phase) / k for k in range(1, 12))
+        envelope = 0.55 + 0.45 * np.sin(2 * np.pi * 4 * t)
+        parts += [3000 * voice * envelope, np.zeros(int(silence * sample_rate))]
+    samples = np.concatenate(parts) + rng.normal(0, 30, sum(len(part) for part in parts))
+    return np.clip(samples, -32768, 32767).astype(np.int16).tobytes()
+
+
+def write_wav(path, pcm, sample_rate=SAMPLE_RATE):
+    with wave.open(path, "wb") as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(sample_rate)
+        f.writeframes(pcm)
+    return path
+
+
+class SyntheticCamera:
+    """
+    Drop-in for cv2.VideoCapture showing a block that jumps to a new place
+    every second, so scene-change gating sends some frames and skips the
+    rest. Plays `seconds` of frames at `fps` (times `speed`), then holds the
+    last frame and sets `done`, like ClipCamera.
+    """
+
+    def __init__(self, seconds=6.0, fps=15, speed=1.0, size=(240, 320)):
+        self.interval = 1.0 / fps / speed
+        self.total = int(seconds * fps)
+        self.fps = fps
+        self.size = size
+        self.frames = 0
+        self.done = threading.Event()
+        self._last = None
+        self._next_due = None
+
+    def isOpened(self):
+        return True
+
+    def read(self):
+        now = time.monotonic()
+        self._next_due = now if self._next_due is None else self._next_due
+        if self._next_due > now:
+            time.sleep(self._next_due - now)
+        self._next_due += self.interval
+        if self.frames < self.total:
+            height, width = self.size
+            frame = np.full((height, width, 3), 40, dtype=np.uint8)
+            step = self.frames // self.fps
+            top, left = (step * 53) % (height - 80), (step * 97) % (width - 80)
+            frame[top:top + 80, left:left + 80] = ((60 + 50 * step) % 256, 200, (255 - 30 * step) % 256)
+            self.frames += 1
+            self._last = frame
+        else:
+            self.done.set()
+        return self._last is not None, self._last
+
+    def release(self):
+        pass
+
+
+class ClipCamera:
+    """
+    Drop-in for cv2.VideoCapture that plays a clip at its own frame rate
+    (times `speed`). After the last frame it keeps returning that frame, as a
+    still camera would, and sets `done`.
+    """
+
+    def __init__(self, path, speed=1.0):
+        import cv2
+        self._cap = cv2.VideoCapture(path)
+        fps = self._cap.get(cv2.CAP_PROP_FPS) or 30.0
+        self.interval = 1.0 / fps / speed
+        self.frames = 0
+        self.done = threading.Event()
+        self._last = None
+        self._next_due = None
+
+    def isOpened(self):
+        return self._cap.isOpened()
+
+    def read(self):
+        now = time.monotonic()
+        self._next_due = now if self._next_due is None else self._next_due
+        if self._next_due > now:
+            time.sleep(self._next_due - now)
+        self._next_due += self.interval
+        if not self.done.is_set():
+            ok, frame = self._cap.read()
+            if ok:
+                self.frames += 1
+                self._last = frame
+            else:
+                self.done.set()
+        return self._last is not None, self._last
+
+    def release(self):
+        self._cap.release()
+
+
+def _finish_audio(handler, capture):
+    # Everything the fixture produced is queued ahead of the sentinel, so the
+    # consumer handles all of it and then leaves its loop on its own
+    capture.done.wait()
+    handler.data_queue.put(None)
+    handler.audio_thread.join()
+
+
+def run_audio(path, args):
+    from audio import AudioHandler
+    from pipeline import StageTimings
+    vad_timings = StageTimings()
+    handler = AudioHandler()
+    captures = []
+
+    def capture_factory(on_event):
+        captures.append(FixtureCapture(on_event, load_wav(path), vad_timings, args.speed))
+        return captures[-1]
+
+    handler.capture_factory = capture_factory
+    started = time.perf_counter()
+    handler.start_audio()
+    while not captures:
+        time.sleep(0.01)
+    _finish_audio(handler, captures[0])
+    handler.stop_audio()
+    return {
+        "fixture": os.path.basename(path),
+        "utterances": captures[0].utterances,
+        "wall_seconds": time.perf_counter() - started,
+        "samples": dict(handler.pipeline.timings.samples(), **vad_timings.samples()),
+    }
+
+
+def run_video(path, args, audio_path=None):
+    """Play the clip at `path`, or a SyntheticCamera when it is None"""
+    from pipeline import StageTimings
+    from video import VideoHandler
+    vad_timings = StageTimings()
+    handler = VideoHandler()
+    audio_path = audio_path or os.path.splitext(path)[0] + ".wav"
+    pcm = load_wav(audio_path) if os.path.exists(audio_path) else b""
+    cameras, captures = [], []
+
+    def camera_factory(source):
+        cameras.append(ClipCamera(source, args.speed) if path else SyntheticCamera(speed=args.speed))
+        return cameras[-1]
+
+    def capture_factory(on_event):
+        captures.append(FixtureCapture(on_event, pcm, vad_timings, args.speed))
+        return captures[-1]
+
+    handler.camera_factory = camera_factory
+    handler.capture_factory = capture_factory
+    started = time.perf_counter()
+    if not handler.start_video(None, source=path or 0):
+        raise RuntimeError(f"cannot open {path}")
+    _finish_audio(handler, captures[0])
+    cameras[0].done.wait()
+    handler.stop_video()
+    return {
+        "fixture": os.path.basename(path) if path else "synthetic",
+        "frames": cameras[0].frames,
+        "utterances": captures[0].utterances,
+        "wall_seconds": time.perf_counter() - started,
+        "vision": handler.vision_stats(),
+        "samples": dict(handler.pipeline.timings.samples(), **vad_timings.samples()),
+    }
+
+
+def run_chat(args):
+    from datetime import datetime
+    from functools import partial
+    from benchmarks.context_latency import CALLER_LINES
+    from pipeline import CallPipeline
+    from session import sessions
+    from threatHelper import ticket_fields
+
+    def record(session, message, threat):
+        # Same ticket the GUI writes for a chat threat
+        if threat[0]:
+            session.record_ticket({"type": "chat_threat", "timestamp": str(datetime.now()),
+                                   "message": message, **ticket_fields(threat[1])})
+
+    session = sessions.create("text")
+    # Speech goes to the null audio sink, so transliteration and TTS are timed too
+    pipeline = CallPipeline(session, on_threat=partial(record, session), shouldPrint=False)
+    started = time.perf_counter()
+    session.start(False)
+    for turn in range(args.turns):
+        pipeline.process(CALLER_LINES[turn % len(CALLER_LINES)])
+    pipeline.close()
+    sessions.end(session.call_id)
+    return {
+        "turns": args.turns,
+        "wall_seconds": time.perf_counter() - started,
+        "samples": pipeline.timings.samples(),
+    }
+
+
+def _commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(current, baseline):
+    """Per-stage p50/p95/p99 change against an earlier run's JSON"""
+    rows = {}
+    for stage, now in current["stages"].items():
+        before = baseline.get("stages", {}).get(stage)
+        if before:
+            rows[stage] = {pct: now[pct] - before[pct] for pct in ("p50", "p95", "p99")}
+    return rows
+
+
+def _configure(args):
+    # Must run before the app modules are imported: the Ollama client, the
+    # ticket store and the Whisper registry read these at import time
+    os.environ["OLLAMA_HOST"] = args.ollama_url
+    os.environ["TICKET_LOG"] = os.path.join(tempfile.mkdtemp(prefix="bench-"), "tickets.jsonl")
+    os.environ["TTS_AUDIO_SINK"] = "null"
+    if args.whisper:
+        os.environ["WHISPER_MODEL"] = args.whisper
+
+    import text_to_speech
+    text_to_speech.set_audio_sink(text_to_speech.null_sink)
+    if args.tts == "fake":
+        def fake_engine(mytext, language, voice):
+            time.sleep(args.tts_latency)
+            return mytext.encode("utf-8")
+        text_to_speech.set_engine(fake_engine)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--fixtures", default=os.path.join(os.path.dirname(__file__), "fixtures"),
+                        help="directory with *.wav calls and video clips")
+    parser.add_argument("--scenarios", default="audio,video,chat")
+    parser.add_argument("--speed", type=float, default=1.0, help="playback speed; 1 is real time")
+    parser.add_argument("--turns", type=int, default=20, help="chat turns")
+    parser.add_argument("--whisper", help="Whisper model size (default: WHISPER_MODEL or base)")
+    parser.add_argument("--ollama-url", help="use this server instead of the built-in stand-in")
+    parser.add_argument("--first-token", type=float, default=0.3, help="stand-in latency to first token")
+    parser.add_argument("--per-token", type=float, default=0.02, help="stand-in latency per streamed token")
+    parser.add_argument("--cold-load", type=float, default=0.0, help="stand-in model load on first request")
+    parser.add_argument("--warmup", action="store_true", help="warm the pinned models first, as the app does")
+    parser.add_argument("--tts", choices=["fake", "gtts"], default="fake")
+    parser.add_argument("--tts-latency", type=float, default=0.15, help="seconds per fake synthesis")
+    parser.add_argument("--json", help="write the results to this file")
+    parser.add_argument("--baseline", help="JSON from an earlier run to compare against")
+    args = parser.parse_args()
+
+    server = None
+    if not args.ollama_url:
+        from benchmarks.fake_ollama import FakeOllama
+        server = FakeOllama(first_token=args.first_token, per_token=args.per_token,
+                            cold_load=args.cold_load).start()
+        args.ollama_url = server.url
+    _configure(args)
+    if args.warmup:
+        from ollamaClient import warmup
+        print("Ollama warmup:", warmup())
+
+    scenarios = args.scenarios.split(",")
+    wavs = sorted(glob.glob(os.path.join(args.fixtures, "*.wav")))
+    clips = sorted(p for ext in ("mp4", "avi", "mov") for p in glob.glob(os.path.join(args.fixtures, f"*.{ext}")))
+    clip_audio = {os.path.splitext(p)[0] + ".wav" for p in clips}
+    synthetic = None
+    if not (wavs or clips) and {"audio", "video"} & set(scenarios):
+        print(f"No fixtures in {args.fixtures}; using a synthetic call")
+        synthetic = write_wav(os.path.join(tempfile.mkdtemp(prefix="bench-"), "synthetic.wav"), synthetic_speech())
+        wavs = [synthetic]
+    runs = []
+    try:
+        if "audio" in scenarios:
+            runs += [("audio", run_audio(path, args)) for path in wavs if path not in clip_audio]
+        if "video" in scenarios:
+            runs += [("video", run_video(path, args)) for path in clips]
+            if synthetic:
+                runs.append(("video", run_video(None, args, audio_path=synthetic)))
+        if "chat" in scenarios:
+            runs.append(("chat", run_chat(args)))
+    finally:
+        if server:
+            server.stop()
+
+    from ollamaClient import latency_stats, usage_stats
+    from pipeline import StageTimings
+    from transcriptionService import service_stats
+    # Pooled across runs and summarized by the same code as a live call's timings
+    pooled = StageTimings(maxlen=None)
+    for _, run in runs:
+        for stage, values in run.pop("samples").items():
+            for seconds in values:
+                pooled.record(stage, seconds)
+    result = {
+        "commit": _commit(),
+        "config": {key: value for key, value in vars(args).items() if key not in ("json", "baseline")},
+        "runs": [dict(run, scenario=name) for name, run in runs],
+        "stages": pooled.summary(),
+        "ollama": latency_stats(),
+        # Requests whose num_ctx differed from the model's previous one, each a reload
+        "reloads": {model: int(usage.get("num_ctx_changes", 0)) for model, usage in usage_stats().items()},
+        "whisper_batching": service_stats(),
+    }
+
+    for stage in STAGES + sorted(set(result["stages"]) - set(STAGES)):
+        row = result["stages"].get(stage)
+        if row:
+            print(f"{stage:>14}: n={row['count']:<5} p50 {row['p50']:.3f}  p95 {row['p95']:.3f}  p99 {row['p99']:.3f}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            result["delta"] = compare(result, json.load(f))
+        for stage, delta in result["delta"].items():
+            print(f"{stage:>14}: " + "  ".join(f"{pct} {value:+.3f}" for pct, value in delta.items()))
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(result, f, indent=2)
+    reloaded = {model: n for model, n in result["reloads"].items() if n}
+    if args.warmup and reloaded:
+        # Warmup has to load each model the way the call's requests use it
+        raise SystemExit(f"Models reloaded after warmup: {reloaded}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,179 @@
+"""
+Stand-in for the Ollama server: answers POST /api/chat like Ollama does,
+streaming or not, after a configurable delay, so benchmarks can drive the
+real client code without a GPU.
+
+    python -m benchmarks.fake_ollama --port 11435 --first-token 0.3 --per-token 0.02
+
+then point the app at it with OLLAMA_HOST=http://127.0.0.1:11435.
+"""
+import argparse
+import json
+import threading
+import time
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+REPLIES = {
+    "responder": "I understand. Help is on the way. Please stay on the line and tell me if anything changes.",
+    "threat": '{"score": 6, "category": "medical", "rationale": "Caller reports an active emergency; dispatch recommended.", "end_call": false}',
+    "vision": "[SAFE] The frame shows an indoor room with no visible hazards.",
+}
+
+
+class FakeOllama:
+    """
+    Threaded HTTP server imitating Ollama's /api/chat. Replies are canned per
+    model (frames get the "vision" reply); `first_token` is the delay before
+    the first token and `per_token` the delay between streamed tokens. The
+    first request for each model also waits `cold_load` and reports it as
+    load_duration, like a model being loaded into memory, and so does any
+    request whose num_ctx differs from the loaded one (counted in `reloads`). With `prompt_rate`
+    (tokens/second) the prompt is "processed" before the first token too.
+    """
+
+    def __init__(self, host="127.0.0.1", port=0, first_token=0.3, per_token=0.02, cold_load=0.0, prompt_rate=0.0,
+                 replies=None):
+        self.first_token = first_token
+        self.per_token = per_token
+        self.cold_load = cold_load
+        self.prompt_rate = prompt_rate
+        # Model -> num_ctx it is loaded with
+        self.loaded = {}
+        self.reloads = 0
+        self.replies = dict(REPLIES, **(replies or {}))
+        self.requests = 0
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._handler())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def reply_for(self, request):
+        messages = request.get("messages") or []
+        if any(message.get("images") for message in messages):
+            return self.replies["vision"]
+        if request.get("format") and request.get("model") != "threat":
+            # Combined reply + threat request
+            threat = json.loads(self.replies["threat"])
+            return json.dumps({"reply": self.replies["responder"], "threat_score": threat["score"],
+                               "category": threat["category"], "assessment": threat["rationale"],
+                               "end_call": False})
+        return self.replies.get(request.get("model"), self.replies["responder"])
+
+    def _handler(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                pass
+
+            def do_POST(self):
+                if self.path != "/api/chat":
+                    self.send_error(404)
+                    return
+                request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+                with fake._lock:
+                    fake.requests += 1
+                    model = request.get("model")
+                    num_ctx = (request.get("options") or {}).get("num_ctx")
+                    load = 0.0 if model in fake.loaded and fake.loaded[model] == num_ctx else fake.cold_load
+                    fake.reloads += model in fake.loaded and fake.loaded[model] != num_ctx
+                    fake.loaded[model] = num_ctx
+                time.sleep(load)
+                request["load_duration"] = int(load * 1e9)
+                if not request.get("messages"):
+                    # Ollama only loads the model for an empty chat
+                    self._send(json.dumps(fake._chunk(request, "", done=True)).encode("utf-8"))
+                    return
+                content = fake.reply_for(request)
+                # Rough token counts so clients can compute throughput
+                request["prompt_eval_count"] = sum(len(str(m.get("content", ""))) for m in request["messages"]) // 4
+                request["eval_count"] = len(content.split(" "))
+                request["eval_duration"] = int((fake.first_token + fake.per_token * request["eval_count"]) * 1e9)
+                prompt_seconds = request["prompt_eval_count"] / fake.prompt_rate if fake.prompt_rate else 0.0
+                request["prompt_eval_duration"] = int(prompt_seconds * 1e9)
+                time.sleep(prompt_seconds + fake.first_token)
+                if request.get("stream", True):
+                    self._stream(request, content)
+                else:
+                    self._send(json.dumps(fake._chunk(request, content, done=True)).encode("utf-8"))
+
+            def _send(self, body):
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def _stream(self, request, content):
+                self.send_response(200)
+                self.send_header("Content-Type", "application/x-ndjson")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                tokens = [word + " " for word in content.split(" ")]
+                tokens[-1] = tokens[-1].rstrip()
+                for index, token in enumerate(tokens):
+                    if index:
+                        time.sleep(fake.per_token)
+                    self._write_chunk(fake._chunk(request, token, done=False))
+                self._write_chunk(fake._chunk(request, "", done=True))
+                self.wfile.write(b"0\r\n\r\n")
+
+            def _write_chunk(self, payload):
+                line = json.dumps(payload).encode("utf-8") + b"\n"
+                self.wfile.write(f"{len(line):x}\r\n".encode("ascii") + line + b"\r\n")
+                self.wfile.flush()
+
+        return Handler
+
+    def _chunk(self, request, content, done):
+        chunk = {
+            "model": request.get("model", ""),
+            "created_at": datetime.now(timezone.utc).isoformat(),
+            "message": {"role": "assistant", "content": content},
+            "done": done,
+        }
+        if done:
+            chunk["done_reason"] = "stop"
+            for key in ("load_duration", "prompt_eval_count", "prompt_eval_duration", "eval_count", "eval_duration"):
+                chunk[key] = request.get(key, 0)
+        return chunk
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11435)
+    parser.add_argument("--first-token", type=float, default=0.3, help="seconds before the first token")
+    parser.add_argument("--per-token", type=float, default=0.02, help="seconds between streamed tokens")
+    parser.add_argument("--cold-load", type=float, default=0.0, help="extra seconds for each model's first request")
+    parser.add_argument("--prompt-rate", type=float, default=0.0, help="prompt tokens/second; 0 is instant")
+    args = parser.parse_args()
+
+    server = FakeOllama(args.host, args.port, args.first_token, args.per_token, args.cold_load,
+                        args.prompt_rate).start()
+    print(f"Fake Ollama listening on {server.url}")
+    try:
+        server._thread.join()
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
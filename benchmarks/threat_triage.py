@@ -0,0 +1,89 @@
+"""
+Threat pre-triage quality and cost on labeled call transcripts.
+
+    python -m benchmarks.threat_triage --json triage.json
+
+Each call in the fixture is replayed through a fresh ThreatTriage. Reports
+precision/recall of the provisional "urgent" level against the labels,
+how many urgent utterances were neither flagged nor sent to the threat
+model (missed), the share of utterances that still reach the threat model,
+and triage latency. Set THREAT_CLASSIFIER to include the transformers
+classifier. Runs offline.
+"""
+import argparse
+import json
+import os
+import time
+from latency import percentile
+from threatTriage import ThreatTriage, get_classifier
+
+FIXTURE = os.path.join(os.path.dirname(__file__), "fixtures", "threat_transcripts.jsonl")
+
+
+def load(path):
+    calls = {}
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                row = json.loads(line)
+                calls.setdefault(row["call"], []).append(row)
+    return calls
+
+
+def run(calls, classifier=None):
+    rows, latencies = [], []
+    for call, utterances in calls.items():
+        triage = ThreatTriage(classifier=classifier)
+        for utterance in utterances:
+            start = time.perf_counter()
+            result = triage.assess(utterance["text"])
+            latencies.append(time.perf_counter() - start)
+            rows.append({"call": call, "text": utterance["text"], "urgent": utterance["urgent"],
+                         "urgency": result.urgency, "level": result.level, "reason": result.reason})
+
+    flagged = [row for row in rows if row["level"] == "urgent"]
+    urgent = [row for row in rows if row["urgent"]]
+    true_positives = sum(row["urgent"] for row in flagged)
+    missed = [row for row in urgent if row["level"] != "urgent" and row["reason"] is None]
+    return {
+        "utterances": len(rows),
+        "precision": true_positives / len(flagged) if flagged else None,
+        "recall": true_positives / len(urgent) if urgent else None,
+        # Urgent utterances the threat model still saw or the triage flagged itself
+        "coverage": 1 - len(missed) / len(urgent) if urgent else None,
+        "missed": [row["text"] for row in missed],
+        "llm_call_rate": sum(row["reason"] is not None for row in rows) / len(rows),
+        "latency_us": {
+            "p50": percentile(latencies, 50) * 1e6,
+            "p95": percentile(latencies, 95) * 1e6,
+            "p99": percentile(latencies, 99) * 1e6,
+        },
+        "rows": rows,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--fixture", default=FIXTURE)
+    parser.add_argument("--json", help="write the report, including per-utterance rows, to this file")
+    args = parser.parse_args()
+
+    calls = load(args.fixture)
+    report = {"keywords": run(calls)}
+    classifier = get_classifier()
+    if classifier is not None:
+        report["classifier"] = run(calls, classifier)
+
+    for name, result in report.items():
+        print(f"{name}: precision {result['precision']:.2f}  recall {result['recall']:.2f}  "
+              f"coverage {result['coverage']:.2f}  threat model calls {result['llm_call_rate']:.0%}  "
+              f"latency p50 {result['latency_us']['p50']:.0f} us  p99 {result['latency_us']['p99']:.0f} us")
+        for text in result["missed"]:
+            print(f"  missed: {text}")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+"""
+Batched Whisper transcription with concurrent calls.
+
+    python -m benchmarks.transcription --fixtures benchmarks/fixtures --callers 1,4,8,16 --max-batch 1,4,8
+
+Each caller submits utterances back to back through one TranscriptionService,
+as concurrent calls do. Utterances are --utterance second cuts of every
+*.wav in --fixtures, or noise if there are none. With --max-batch 1 the
+service runs one utterance at a time, which is the unbatched baseline.
+Reports per-utterance latency p50/p95, throughput in audio seconds per wall
+second, and the mean batch size the service formed.
+"""
+import argparse
+import glob
+import json
+import os
+import threading
+import time
+import numpy as np
+
+
+def load_utterances(fixtures, seconds, sample_rate=16000):
+    from benchmarks.end_to_end import load_wav
+    from transcriber import pcm_to_float
+    step = int(seconds * sample_rate)
+    utterances = []
+    for path in sorted(glob.glob(os.path.join(fixtures, "*.wav"))):
+        audio = pcm_to_float(load_wav(path))
+        utterances += [audio[i:i + step] for i in range(0, len(audio) - step // 2, step)]
+    if not utterances:
+        print(f"No *.wav in {fixtures}; using noise, which Whisper decodes poorly")
+        rng = np.random.default_rng(0)
+        utterances = [rng.normal(0, 0.05, step).astype(np.float32) for _ in range(8)]
+    return utterances
+
+
+def run(model, callers, max_batch, utterances, args):
+    from latency import percentile
+    from transcriptionService import TranscriptionService
+    service = TranscriptionService(model, max_batch=max_batch, max_wait=args.max_wait / 1000)
+    latencies = []
+    audio_seconds = [0.0] * callers
+
+    def caller(index):
+        for turn in range(args.per_caller):
+            audio = utterances[(index + turn) % len(utterances)]
+            start = time.perf_counter()
+            service.transcribe(audio, language=args.language)
+            latencies.append(time.perf_counter() - start)
+            audio_seconds[index] += len(audio) / 16000
+
+    threads = [threading.Thread(target=caller, args=(index,)) for index in range(callers)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall = time.perf_counter() - started
+    service.close()
+    stats = service.stats()
+    return {
+        "callers": callers,
+        "max_batch": max_batch,
+        "utterances": len(latencies),
+        "wall_seconds": wall,
+        "audio_seconds_per_second": sum(audio_seconds) / wall,
+        "latency_p50": percentile(latencies, 50),
+        "latency_p95": percentile(latencies, 95),
+        "mean_batch": stats["mean_batch"],
+        "fallbacks": stats["fallbacks"],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--fixtures", default=os.path.join(os.path.dirname(__file__), "fixtures"))
+    parser.add_argument("--whisper", default="base", help="Whisper model size")
+    parser.add_argument("--callers", default="1,4,8,16", help="comma-separated concurrency levels")
+    parser.add_argument("--max-batch", default="1,4,8", help="comma-separated batch size limits")
+    parser.add_argument("--max-wait", type=float, default=10.0, help="batch fill wait in milliseconds")
+    parser.add_argument("--per-caller", type=int, default=4, help="utterances each caller submits")
+    parser.add_argument("--utterance", type=float, default=4.0, help="utterance length in seconds")
+    parser.add_argument("--language", default="en", help="fixed language; empty to detect")
+    parser.add_argument("--json", help="write the results to this file")
+    args = parser.parse_args()
+    args.language = args.language or None
+
+    from whisperHelper import get_model, warmup
+    model = get_model(args.whisper)
+    warmup(args.whisper)
+    utterances = load_utterances(args.fixtures, args.utterance)
+
+    results = []
+    for max_batch in (int(value) for value in args.max_batch.split(",")):
+        for callers in (int(value) for value in args.callers.split(",")):
+            result = run(model, callers, max_batch, utterances, args)
+            results.append(result)
+            print(f"max_batch {max_batch:>2}  {callers:>3} callers: {result['audio_seconds_per_second']:6.1f} audio s/s  "
+                  f"latency p50 {result['latency_p50']:.3f}  p95 {result['latency_p95']:.3f}  "
+                  f"mean batch {result['mean_batch']:.1f}  fallbacks {result['fallbacks']}")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+"""
+Transliteration micro-benchmark: the previous per-call Arabic and Tamil code
+against the compiled transliterators, and transliterate_text vs
+transliterate_many for every supported script.
+
+    python -m benchmarks.transliteration --repeat 2000 --json translit.json
+
+The compiled Arabic table runs about 1.1-2x and the Tamil dict lookup about
+1.6x faster than the old code on the samples here; run-to-run noise is
+large, so compare a few runs.
+
+Runs offline; needs the packages from requirements.txt.
+"""
+import argparse
+import json
+import timeit
+import unidecode
+from text import (ARABIC_MAP, TAMIL_CONSONANTS, TAMIL_CONSONANT_STEMS, TAMIL_SPECIAL, TAMIL_VOWEL_MARKERS,
+                  TAMIL_VOWELS, TRANSLITERATORS, transliterate_many, transliterate_text)
+
+SAMPLES = {
+    "ru": "Пожар в соседней квартире, дым идёт из-под двери.",
+    "ar": "هناك حريق في الشقة المجاورة والدخان يدخل من تحت الباب",
+    "hi": "बगल वाले फ्लैट में आग लगी है, दरवाज़े के नीचे से धुआँ आ रहा है",
+    "bn": "পাশের ফ্ল্যাটে আগুন লেগেছে, দরজার নিচ দিয়ে ধোঁয়া আসছে",
+    "ta": "பக்கத்து வீட்டில் தீ பிடித்துள்ளது, கதவின் கீழே புகை வருகிறது",
+    "te": "పక్క ఫ్లాట్‌లో మంటలు వచ్చాయి, తలుపు కింద నుండి పొగ వస్తోంది",
+    "kn": "ಪಕ್ಕದ ಮನೆಯಲ್ಲಿ ಬೆಂಕಿ ಬಿದ್ದಿದೆ, ಬಾಗಿಲಿನ ಕೆಳಗಿನಿಂದ ಹೊಗೆ ಬರುತ್ತಿದೆ",
+    "ml": "അടുത്ത ഫ്ലാറ്റിൽ തീപിടിച്ചു, വാതിലിനടിയിലൂടെ പുക വരുന്നു",
+    "gu": "બાજુના ફ્લેટમાં આગ લાગી છે, દરવાજા નીચેથી ધુમાડો આવે છે",
+    "or": "ପାଖ ଫ୍ଲାଟରେ ନିଆଁ ଲାଗିଛି, କବାଟ ତଳୁ ଧୂଆଁ ଆସୁଛି",
+    "zh-cn": "隔壁公寓着火了，烟从门下面进来了。",
+    "el": "Υπάρχει φωτιά στο διπλανό διαμέρισμα.",
+}
+
+
+def legacy_arabic(text):
+    transliteration_map = dict(ARABIC_MAP)
+    return ''.join(transliteration_map.get(char, char) for char in text)
+
+
+def legacy_tamil(text):
+    consonants = dict(TAMIL_CONSONANTS)
+    consonant_vowel_markers = dict(TAMIL_CONSONANT_STEMS)
+    vowels = dict(TAMIL_VOWELS)
+    vowel_markers = dict(TAMIL_VOWEL_MARKERS)
+    special = dict(TAMIL_SPECIAL)
+
+    transliterated_text = ""
+    i = 0
+    while i < len(text):
+        char = text[i]
+        if char in consonants:
+            if i + 1 < len(text) and text[i + 1] in vowel_markers:
+                transliterated_text += consonant_vowel_markers[char]
+                transliterated_text += vowel_markers[text[i + 1]]
+                i += 1
+            else:
+                transliterated_text += consonants[char]
+        elif char in vowels:
+            transliterated_text += vowels[char]
+        elif char in special:
+            transliterated_text += special[char]
+        else:
+            transliterated_text += char
+        i += 1
+    return transliterated_text
+
+
+LEGACY = {"ar": legacy_arabic, "ta": legacy_tamil}
+
+
+def per_call_us(fn, repeat):
+    return min(timeit.repeat(fn, number=repeat, repeat=3)) / repeat * 1e6
+
+
+def run(repeat, batch):
+    rows = []
+    for language, text in SAMPLES.items():
+        convert = TRANSLITERATORS.get(language, unidecode.unidecode)
+        texts = [text] * batch
+        row = {
+            "language": language,
+            "compiled_us": per_call_us(lambda: convert(text), repeat),
+            # Both include script detection
+            "single_us": per_call_us(lambda: transliterate_text(text), repeat),
+            "batch_us": per_call_us(lambda: transliterate_many(texts), max(1, repeat // batch)) / batch,
+        }
+        if language in LEGACY:
+            assert LEGACY[language](text) == convert(text), language
+            row["legacy_us"] = per_call_us(lambda: LEGACY[language](text), repeat)
+            row["speedup"] = row["legacy_us"] / row["compiled_us"]
+        rows.append(row)
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=2000)
+    parser.add_argument("--batch", type=int, default=32, help="texts per transliterate_many call")
+    parser.add_argument("--json", help="write the results to this file")
+    args = parser.parse_args()
+
+    rows = run(args.repeat, args.batch)
+    for row in rows:
+        legacy = f"legacy {row['legacy_us']:8.1f} us  x{row['speedup']:.1f}  " if "legacy_us" in row else ""
+        print(f"{row['language']:>6}: {legacy}"
+              f"compiled {row['compiled_us']:8.1f} us  "
+              f"detect+convert {row['single_us']:8.1f} us  batch {row['batch_us']:8.1f} us/text")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(rows, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,301 @@
+import queue
+import socket
+import threading
+import time
+import cv2
+from callProtocol import encode, read_message_from, server_address
+from capture import RawAudioCapture
+from frameBuffer import encode_for_model
+from text_to_speech import text_to_speech
+
+
+class CallClient:
+    """
+    One call on a call server. Every message from the server goes to
+    `on_message(header, payload)` on the client's reader thread; start(),
+    ask() and end() wait for the answer they need.
+    """
+
+    def __init__(self, address=None, on_message=None, timeout=10.0):
+        self.address = server_address(address)
+        self.on_message = on_message
+        self.mode = None
+        self.call_id = None
+        self.end_message = None
+        self.ended = threading.Event()
+        self._responses = queue.Queue()
+        self._send_lock = threading.Lock()
+        self._sock = socket.create_connection(self.address, timeout=timeout)
+        self._sock.settimeout(None)
+        # Audio chunks are small and latency matters more than packet count
+        self._sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self._stream = self._sock.makefile("rb")
+        self._reader = threading.Thread(target=self._read, daemon=True)
+        self._reader.start()
+
+    def _read(self):
+        try:
+            while True:
+                message = read_message_from(self._stream)
+                if message is None:
+                    break
+                header, payload = message
+                kind = header["type"]
+                if kind == "ended":
+                    self.end_message = header
+                # Replies are only waited for in text calls; elsewhere they would pile up
+                if kind in ("started", "error", "ended") or (kind == "reply" and self.mode == "text"):
+                    self._responses.put(header)
+                if self.on_message:
+                    try:
+                        self.on_message(header, payload)
+                    except Exception as e:
+                        print(f"Error handling {kind} message: {e}")
+        except (OSError, ValueError) as e:
+            if not self.ended.is_set():
+                print(f"Call server connection lost: {e}")
+        finally:
+            self.ended.set()
+            self._responses.put(None)
+            self._stream.close()
+            self._sock.close()
+
+    def _send(self, kind, payload=b"", **fields):
+        data = encode(kind, payload, **fields)
+        with self._send_lock:
+            self._sock.sendall(data)
+
+    def _wait(self, kinds, timeout=None):
+        """Next response of one of `kinds`; an error or the end of the call comes back as is"""
+        while True:
+            header = self._responses.get(timeout=timeout)
+            if header is None or header["type"] in kinds or header["type"] in ("error", "ended"):
+                return header
+
+    def start(self, mode, timeout=60.0):
+        """Start the call; returns the server's "started" message"""
+        self.mode = mode
+        self._send("start", mode=mode)
+        header = self._wait(("started",), timeout)
+        if header is None or header["type"] != "started":
+            raise ConnectionError(header.get("message", "call ended") if header else "call server closed the connection")
+        self.call_id = header["call_id"]
+        return header
+
+    def next_reply(self, timeout=None):
+        """The next "reply" message of a text call, or the "ended"/"error" message, or None"""
+        return self._wait(("reply",), timeout)
+
+    def ask(self, text, timeout=None):
+        """Send a typed message and wait for its reply (see next_reply)"""
+        self._send("text", text=text)
+        return self.next_reply(timeout)
+
+    def send_audio(self, pcm):
+        self._send("audio", pcm)
+
+    def send_frame(self, jpeg, captured_at=None):
+        self._send("frame", jpeg, captured_at=time.time() if captured_at is None else captured_at)
+
+    def hang_up(self):
+        """
+        Ask the server to end the call and return at once. The server finishes
+        in-flight threat scoring first; its "ended" message then goes to
+        on_message and sets `ended`.
+        """
+        if not self.ended.is_set():
+            try:
+                self._send("end")
+            except OSError:
+                pass
+
+    def end(self, timeout=30.0):
+        """Hang up and wait for the server's "ended" message; returns it"""
+        self.hang_up()
+        self.ended.wait(timeout)
+        self.close()
+        return self.end_message
+
+    def close(self):
+        try:
+            self._sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+
+
+class SpeechPlayer:
+    """Plays sentences in order on its own thread, so reading from the server never waits on audio"""
+
+    def __init__(self, speak=text_to_speech):
+        self.speak = speak
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def say(self, text):
+        self._queue.put(text)
+
+    def _run(self):
+        while True:
+            text = self._queue.get()
+            if text is None:
+                return
+            try:
+                self.speak(text)
+            except Exception as e:
+                print(f"Error playing reply: {e}")
+
+    def stop(self):
+        self._queue.put(None)
+
+
+class AudioCall:
+    """
+    Audio call through a call server: microphone PCM goes to the server and
+    the sentences it sends back are played here. Same interface as
+    AudioHandler, which runs the call itself. `on_end(message)` is called
+    on the client's reader thread with the "ended" message, whichever side
+    hung up. Stopping never waits for it, so a UI thread can stop a call.
+    """
+
+    def __init__(self, address=None):
+        self.address = address
+        self.capture_factory = RawAudioCapture
+        self.on_end = None
+        self.is_running = False
+        self.client = None
+        self.capture = None
+        self.player = None
+        self.user_id = ""
+        self._lock = threading.Lock()
+
+    def _start_call(self, mode):
+        self.player = SpeechPlayer()
+        try:
+            self.client = CallClient(self.address, on_message=self._on_message)
+            self.user_id = self.client.start(mode)["call_id"]
+        except Exception:
+            self.player.stop()
+            raise
+        self.is_running = True
+        self.capture = self.capture_factory(self._send_audio)
+        self.capture.start()
+
+    def start_audio(self):
+        if self.is_running:
+            return
+        self._start_call("audio")
+
+    def _send_audio(self, pcm):
+        if self.is_running:
+            try:
+                self.client.send_audio(pcm)
+            except OSError:
+                pass
+
+    def _on_message(self, header, payload):
+        kind = header["type"]
+        if kind == "speak":
+            self.player.say(header["text"])
+        elif kind == "transcript":
+            print("\n**  "+header["text"]+"  **", flush=True)
+        elif kind == "reply":
+            print(header["text"], flush=True)
+        elif kind == "ticket":
+            print("******** TICKET:", header["ticket"], "********")
+        elif kind == "error":
+            print(f"Call server error: {header['message']}")
+        elif kind == "ended":
+            # Either the answer to stop_audio() or the server hanging up, e.g. the responder ended the call
+            self._teardown()
+            if self.on_end:
+                self.on_end(header)
+
+    def _teardown(self):
+        with self._lock:
+            if not self.is_running:
+                return False
+            self.is_running = False
+        if self.capture:
+            self.capture.stop()
+        self.player.stop()
+        return True
+
+    def stop_audio(self):
+        if self._teardown():
+            self.client.hang_up()
+
+
+class VideoCall(AudioCall):
+    """
+    Video call through a call server: besides the microphone, camera frames
+    are shown in `frame_label` and sent to the server, downscaled to what the
+    vision model uses and at most `max_fps` a second. The server decides which
+    frames to analyze. Same interface as VideoHandler.
+    """
+
+    def __init__(self, address=None, max_fps=10):
+        super().__init__(address)
+        self.camera_factory = cv2.VideoCapture
+        self.max_fps = max_fps
+        self.cap = None
+        self.preview = None
+        self.video_thread = None
+
+    def start_video(self, frame_label, source=0):
+        if self.is_running:
+            return False
+
+        # `source` is a camera index or a video file
+        self.cap = self.camera_factory(source)
+        if not self.cap.isOpened():
+            print("Cannot open camera")
+            return False
+        if frame_label is not None:
+            # Tk is only needed for a preview; run.py and benchmarks have none
+            from preview import PreviewRenderer
+            self.preview = PreviewRenderer(frame_label)
+        else:
+            self.preview = None
+        try:
+            self._start_call("video")
+        except Exception:
+            self.cap.release()
+            raise
+        self.video_thread = threading.Thread(target=self._video_process, daemon=True)
+        self.video_thread.start()
+        return True
+
+    def _video_process(self):
+        interval = 1.0 / self.max_fps
+        next_send = 0.0
+        try:
+            while self.is_running:
+                ret, frame = self.cap.read()
+                if not ret:
+                    print("Failed to grab frame")
+                    continue
+                if self.preview is not None:
+                    self.preview.submit(frame)
+                now = time.time()
+                if now >= next_send:
+                    next_send = now + interval
+                    self.client.send_frame(encode_for_model(frame), now)
+        except Exception as e:
+            if self.is_running:
+                print(f"Error in video processing: {e}")
+        finally:
+            self.cap.release()
+
+    def _teardown(self):
+        if not super()._teardown():
+            return False
+        if self.preview:
+            self.preview.stop()
+        if self.video_thread and threading.current_thread() is not self.video_thread:
+            self.video_thread.join(timeout=1.0)
+        return True
+
+    def stop_video(self):
+        if self._teardown():
+            self.client.hang_up()
@@ -0,0 +1,82 @@
+"""
+Wire format between the call server and its clients.
+
+Every message is one line of JSON, followed by `size` raw bytes when the
+header has a size (PCM audio, JPEG frames). Headers always carry `type`.
+
+Client -> server:
+  start  {"mode": "audio" | "video" | "text"}      first message of a call
+  audio  {"size": n} + 16 kHz 16-bit mono PCM     any chunk length
+  frame  {"size": n, "captured_at": t} + JPEG     camera frame
+  text   {"text": ...}                            typed message (text calls)
+  end    {}                                       hang up
+
+Server -> client:
+  started     {"call_id", "mode"}
+  speak       {"text"}        one sentence to play, already transliterated
+  transcript  {"text"}        what the caller said
+  reply       {"text", "end_call"}
+  vision      {"frame", "text"}
+  ticket      {"ticket"}      a ticket entry as stored
+  ended       {"reason", "timings"}
+  error       {"message"}
+"""
+import json
+import os
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+# Larger than any frame or audio chunk a client has reason to send
+MAX_PAYLOAD = 8 * 1024 * 1024
+MAX_HEADER = 64 * 1024
+MODES = ("audio", "video", "text")
+
+
+def server_address(address=None):
+    """(host, port) from "host:port", CALL_SERVER, or the defaults"""
+    address = address or os.environ.get("CALL_SERVER") or f"{DEFAULT_HOST}:{DEFAULT_PORT}"
+    host, _, port = address.rpartition(":")
+    return host or DEFAULT_HOST, int(port)
+
+
+def encode(kind, payload=b"", **fields):
+    header = dict(fields, type=kind)
+    if payload:
+        header["size"] = len(payload)
+    return json.dumps(header, ensure_ascii=False).encode("utf-8") + b"\n" + payload
+
+
+def _decode(line):
+    header = json.loads(line)
+    if not isinstance(header, dict) or "type" not in header:
+        raise ValueError("message header without a type")
+    size = header.get("size", 0)
+    if not isinstance(size, int) or not 0 <= size <= MAX_PAYLOAD:
+        raise ValueError(f"bad payload size {size!r}")
+    return header, size
+
+
+async def read_message(reader):
+    """(header, payload) from an asyncio StreamReader, or None at end of stream"""
+    line = await reader.readline()
+    if not line:
+        return None
+    if len(line) > MAX_HEADER:
+        raise ValueError("message header too long")
+    header, size = _decode(line)
+    payload = await reader.readexactly(size) if size else b""
+    return header, payload
+
+
+def read_message_from(stream):
+    """Blocking read_message() for a binary file object such as socket.makefile("rb")"""
+    line = stream.readline(MAX_HEADER + 1)
+    if not line:
+        return None
+    if len(line) > MAX_HEADER:
+        raise ValueError("message header too long")
+    header, size = _decode(line)
+    payload = stream.read(size) if size else b""
+    if len(payload) < size:
+        return None
+    return header, payload
@@ -0,0 +1,391 @@
+"""
+Headless call server: many concurrent callers over TCP, one call per
+connection, each with its own CallSession.
+
+    python callServer.py --port 8765
+
+Audio and video calls run through the same AudioHandler / VideoHandler as
+a local call, with the microphone and camera replaced by what the client
+sends and speech sent back instead of played. Text calls run a CallPipeline
+like the GUI chat. Transcripts, replies, frame analyses and tickets are
+streamed back as they happen. See callProtocol for the wire format.
+"""
+import argparse
+import asyncio
+import threading
+import time
+from datetime import datetime
+from functools import partial
+import cv2
+import numpy as np
+from audio import AudioHandler
+from callProtocol import MAX_HEADER, MODES, encode, read_message, server_address
+from ollamaClient import latency_stats, warmup
+from pipeline import CallPipeline
+from session import sessions
+from text import warm_language_detection
+from threatHelper import ticket_fields
+from ticketStore import get_store
+from transcriptionService import service_stats
+from vad import VoiceActivityDetector
+from video import VideoHandler
+from whisperHelper import preload
+import tracing
+
+
+class PushedAudio:
+    """
+    Drop-in for AudioCapture fed by the client: `push(pcm)` runs the VAD on
+    each chunk as it arrives. Events from before the handler connects are
+    held until it does.
+    """
+
+    def __init__(self, vad=None):
+        self.vad = vad or VoiceActivityDetector()
+        self.on_event = None
+        self._pending = []
+        self._lock = threading.Lock()
+
+    def connect(self, on_event):
+        # Used as the handler's capture_factory
+        with self._lock:
+            self.on_event = on_event
+            for event in self._pending:
+                on_event(event)
+            self._pending = []
+        return self
+
+    def push(self, pcm, timestamp=None):
+        events = self.vad.process(pcm, timestamp)
+        with self._lock:
+            for event in events:
+                if self.on_event is None:
+                    self._pending.append(event)
+                else:
+                    self.on_event(event)
+
+    def start(self):
+        pass
+
+    def stop(self):
+        pass
+
+
+class PushedCamera:
+    """
+    Drop-in for cv2.VideoCapture fed by the client: `push(jpeg)` hands over
+    the newest frame and read() blocks until there is one. A frame the
+    handler hasn't read yet is replaced, not queued.
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._jpeg = None
+        self._closed = False
+        self.dropped = 0
+
+    def push(self, jpeg):
+        with self._cond:
+            if self._jpeg is not None:
+                self.dropped += 1
+            self._jpeg = jpeg
+            self._cond.notify()
+
+    def isOpened(self):
+        return not self._closed
+
+    def read(self):
+        with self._cond:
+            self._cond.wait_for(lambda: self._jpeg is not None or self._closed)
+            jpeg, self._jpeg = self._jpeg, None
+        if jpeg is None:
+            return False, None
+        frame = cv2.imdecode(np.frombuffer(jpeg, dtype=np.uint8), cv2.IMREAD_COLOR)
+        return frame is not None, frame
+
+    def release(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    # VideoHandler closes a camera before joining its reader; this one has no device to free
+    close = release
+
+
+class CallConnection:
+    """
+    One client connection carrying one call. Handler threads report back
+    through send(), which is safe to call from any thread; a single writer
+    task keeps the messages in order.
+    """
+
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+        self.loop = asyncio.get_running_loop()
+        self._loop_thread = threading.current_thread()
+        self.outbox = asyncio.Queue()
+        self.mode = None
+        self.handler = None
+        self.audio = None
+        self.camera = None
+        self.session = None
+        self.pipeline = None
+        self._ended = False
+
+    def send(self, kind, payload=b"", **fields):
+        data = encode(kind, payload, **fields)
+        try:
+            if threading.current_thread() is self._loop_thread:
+                self.outbox.put_nowait(data)
+            else:
+                self.loop.call_soon_threadsafe(self.outbox.put_nowait, data)
+        except RuntimeError:
+            # The server loop is already gone
+            pass
+
+    def _on_event(self, kind, **fields):
+        # Handler listener; runs on the handler's threads
+        if kind == "ended":
+            self.loop.call_soon_threadsafe(partial(self._end_call, **fields))
+        else:
+            self.send(kind, **fields)
+
+    def _on_ticket(self, record):
+        self.send("ticket", ticket=record)
+
+    def _end_call(self, reason="stopped", timings=None):
+        # Last message of the call; closing the writer also ends the read loop
+        if self._ended:
+            return
+        self._ended = True
+        self.send("ended", reason=reason, timings=timings or {})
+        self.outbox.put_nowait(None)
+
+    async def _write(self):
+        try:
+            while True:
+                data = await self.outbox.get()
+                if data is None:
+                    break
+                self.writer.write(data)
+                await self.writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            self.writer.close()
+
+    async def run(self):
+        writer_task = self.loop.create_task(self._write())
+        try:
+            message = await read_message(self.reader)
+            if message is None:
+                return
+            header, _ = message
+            if header["type"] != "start" or header.get("mode") not in MODES:
+                self.send("error", message=f"a call starts with a start message; mode is one of {', '.join(MODES)}")
+                return
+            await self._start(header["mode"])
+            while not self._ended:
+                message = await read_message(self.reader)
+                if message is None:
+                    break
+                header, payload = message
+                if header["type"] == "end":
+                    break
+                await self._handle(header, payload)
+        except RuntimeError as e:
+            # e.g. SessionManager is at its call limit
+            self.send("error", message=str(e))
+        except (ValueError, ConnectionError, asyncio.IncompleteReadError) as e:
+            self.send("error", message=f"bad message: {e}")
+        finally:
+            await self._stop()
+            self._end_call()
+            await writer_task
+
+    async def _start(self, mode):
+        self.mode = mode
+        if mode == "text":
+            self.session = sessions.create("text")
+            self.pipeline = CallPipeline(self.session, on_threat=partial(self._record_chat_threat, self.session),
+                                         speak=False, shouldPrint=False)
+            self.session.ticket_listeners.append(self._on_ticket)
+            greeting = await asyncio.to_thread(self.session.start, False)
+            self.send("started", call_id=self.session.call_id, mode=mode)
+            if greeting[0]:
+                self.send("reply", text=greeting[1], end_call=False)
+            return
+
+        self.audio = PushedAudio()
+        self.handler = AudioHandler() if mode == "audio" else VideoHandler()
+        self.handler.capture_factory = self.audio.connect
+        self.handler.speaker = lambda text: self.send("speak", text=text)
+        self.handler.listener = self._on_event
+        # Started on the loop thread, so "started" is queued before anything the handler sends
+        if mode == "audio":
+            self.handler.start_audio()
+        else:
+            self.camera = PushedCamera()
+            self.handler.camera_factory = lambda source: self.camera
+            if not self.handler.start_video(None):
+                raise RuntimeError("video call could not start")
+        self.session = self.handler.session
+        self.session.ticket_listeners.append(self._on_ticket)
+        self.send("started", call_id=self.session.call_id, mode=mode)
+
+    async def _handle(self, header, payload):
+        kind = header["type"]
+        if kind == "audio" and self.audio:
+            self.audio.push(payload, time.time())
+        elif kind == "frame" and self.camera:
+            self.camera.push(payload)
+        elif kind == "text" and self.pipeline:
+            val = await asyncio.to_thread(self.pipeline.process, header.get("text", ""))
+            self.send("reply", text=val[1], end_call=not val[0])
+            if not val[0]:
+                await self._stop()
+                self._end_call("responder", self.pipeline.timings.summary())
+        else:
+            self.send("error", message=f"unexpected {kind} message in a {self.mode} call")
+
+    def _record_chat_threat(self, session, message, threat):
+        """Same ticket the GUI chat used to write; runs on the pipeline's worker thread"""
+        if threat[0] == True:
+            session.record_ticket({
+                "type": "chat_threat",
+                "timestamp": str(datetime.now()),
+                "message": message,
+                **ticket_fields(threat[1])
+            })
+            if threat[1].end_call:
+                # The threat monitor ended the call
+                self.loop.call_soon_threadsafe(partial(self._end_call, "threat", self.pipeline.timings.summary()))
+
+    async def _stop(self):
+        if self.handler is not None:
+            handler, self.handler = self.handler, None
+            await asyncio.to_thread(handler.stop_audio if self.mode == "audio" else handler.stop_video)
+            # The handler reports "ended" with its timings once its audio thread has finished
+            if handler.audio_thread:
+                await asyncio.to_thread(handler.audio_thread.join, 30)
+        elif self.pipeline is not None and self.session.active:
+            await asyncio.to_thread(self.pipeline.close)
+            sessions.end(self.session.call_id)
+
+
+class CallServer:
+    """
+    Accepts calls on (host, port); port 0 picks a free one. Run it with
+    `await serve()`, or on a background thread with start_background().
+    """
+
+    def __init__(self, host="127.0.0.1", port=8765):
+        self.host = host
+        self.port = port
+        # CallConnection -> the task serving it
+        self.connections = {}
+        self.loop = None
+        self._server = None
+        self._thread = None
+
+    @property
+    def address(self):
+        host, port = self._server.sockets[0].getsockname()[:2]
+        return f"{host}:{port}"
+
+    async def _accept(self, reader, writer):
+        connection = CallConnection(reader, writer)
+        self.connections[connection] = asyncio.current_task()
+        try:
+            await connection.run()
+        except Exception as e:
+            print(f"Error in call connection: {e}")
+        finally:
+            self.connections.pop(connection, None)
+
+    async def start(self):
+        self.loop = asyncio.get_running_loop()
+        self._server = await asyncio.start_server(self._accept, self.host, self.port, limit=MAX_HEADER + 1)
+        return self
+
+    async def serve(self):
+        await self.start()
+        print(f"Call server listening on {self.address}")
+        async with self._server:
+            await self._server.serve_forever()
+
+    def start_background(self):
+        """Serve on a daemon thread; returns once the server is accepting calls"""
+        started = threading.Event()
+
+        def run():
+            loop = asyncio.new_event_loop()
+            loop.run_until_complete(self.start())
+            started.set()
+            loop.run_forever()
+
+        self._thread = threading.Thread(target=run, daemon=True)
+        self._thread.start()
+        started.wait()
+        return self
+
+    def stop(self, timeout=30):
+        """Stop accepting calls and hang up the ones in progress"""
+        async def close():
+            self._server.close()
+            tasks = list(self.connections.values())
+            for connection in list(self.connections):
+                # Hung up like a client would, so the call still reports how it ended
+                connection.reader.feed_eof()
+            # Each call winds down its handler and writes its last tickets
+            if tasks:
+                await asyncio.wait(tasks, timeout=timeout)
+
+        if self._thread is not None:
+            asyncio.run_coroutine_threadsafe(close(), self.loop).result(timeout)
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            self._thread.join(timeout=1.0)
+
+
+def prepare():
+    """Load and warm everything a call needs so the first caller doesn't wait for it"""
+    # TRACE_FILE / METRICS_PORT turn on per-stage tracing; off by default
+    tracing.configure_from_env()
+    print(preload())
+    warm_language_detection()
+    # Load responder and threat now and keep them resident between calls
+    print("Ollama warmup:", warmup())
+
+
+def report():
+    # Keep ticket_log.json current for tools that read the old format
+    get_store().export_json()
+    print("Ollama latency (cold vs warm):", latency_stats())
+    print("Whisper batching:", service_stats())
+
+
+def serve_in_background(port=0):
+    """Warm the models and run a call server on this machine for the local GUI / CLI"""
+    prepare()
+    return CallServer("127.0.0.1", port).start_background()
+
+
+def main():
+    host, port = server_address()
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default=host)
+    parser.add_argument("--port", type=int, default=port)
+    args = parser.parse_args()
+
+    prepare()
+    try:
+        asyncio.run(CallServer(args.host, args.port).serve())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        report()
+
+
+if __name__ == "__main__":
+    main()
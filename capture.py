@@ -0,0 +1,112 @@
+import queue
+import time
+import pyaudio
+from vad import VADEvent, VoiceActivityDetector
+
+SAMPLE_RATE = 16000
+
+
+class AudioCapture:
+    """
+    Continuous microphone capture with voice activity detection.
+
+    Audio is read in `frame_ms` blocks on PyAudio's callback thread and run
+    through the VAD there, so `on_event(VADEvent)` fires as soon as an
+    utterance starts, for each voiced block, and as soon as it ends.
+    """
+
+    def __init__(self, on_event, vad=None, sample_rate=SAMPLE_RATE, frame_ms=30, device_index=None):
+        self.on_event = on_event
+        # vad=False: no endpointing here (RawAudioCapture)
+        self.vad = VoiceActivityDetector(sample_rate=sample_rate, frame_ms=frame_ms) if vad is None else vad
+        self.sample_rate = sample_rate
+        self.frames_per_buffer = sample_rate * frame_ms // 1000
+        self.device_index = device_index
+        self._audio = None
+        self._stream = None
+
+    def _callback(self, in_data, frame_count, time_info, status):
+        try:
+            for event in self.vad.process(in_data):
+                self.on_event(event)
+        except Exception as e:
+            print(f"Error in audio capture: {e}")
+        return (None, pyaudio.paContinue)
+
+    def start(self):
+        self._audio = pyaudio.PyAudio()
+        self._stream = self._audio.open(
+            format=pyaudio.paInt16,
+            channels=1,
+            rate=self.sample_rate,
+            input=True,
+            input_device_index=self.device_index,
+            frames_per_buffer=self.frames_per_buffer,
+            stream_callback=self._callback,
+        )
+        self._stream.start_stream()
+
+    def stop(self):
+        if self._stream is not None:
+            self._stream.stop_stream()
+            self._stream.close()
+            self._stream = None
+        if self._audio is not None:
+            self._audio.terminate()
+            self._audio = None
+
+
+class RawAudioCapture(AudioCapture):
+    """
+    Microphone capture without VAD for call-server clients: `on_chunk(pcm)`
+    gets every `frame_ms` block of 16-bit mono PCM, and the server endpoints.
+    """
+
+    def __init__(self, on_chunk, sample_rate=SAMPLE_RATE, frame_ms=30, device_index=None):
+        super().__init__(on_chunk, vad=False, sample_rate=sample_rate, frame_ms=frame_ms, device_index=device_index)
+
+    def _callback(self, in_data, frame_count, time_info, status):
+        try:
+            self.on_event(in_data)
+        except Exception as e:
+            print(f"Error in audio capture: {e}")
+        return (None, pyaudio.paContinue)
+
+
+def iter_events(event_queue, is_running=lambda: True, on_handoff=None, timeout=1.0):
+    """
+    Yield VAD events from `event_queue` as soon as they arrive, blocking on
+    the queue instead of polling it. Audio that piled up while the consumer
+    was busy is merged into one "audio" event. A `None` sentinel ends the
+    iteration; `timeout` only bounds how long a stopped consumer can linger.
+    `on_handoff(seconds)` gets the capture-to-consumer delay of each batch.
+    """
+    while is_running():
+        try:
+            event = event_queue.get(timeout=timeout)
+        except queue.Empty:
+            continue
+        if event is None:
+            return
+
+        batch = [event]
+        stopping = False
+        while batch[-1].kind != "end":
+            try:
+                event = event_queue.get_nowait()
+            except queue.Empty:
+                break
+            if event is None:
+                stopping = True
+                break
+            batch.append(event)
+
+        if on_handoff:
+            on_handoff(time.time() - batch[0].timestamp)
+        audio = [e for e in batch if e.kind != "end"]
+        if audio:
+            yield VADEvent("audio", b"".join(e.audio for e in audio), audio[0].timestamp)
+        if batch[-1].kind == "end":
+            yield batch[-1]
+        if stopping:
+            return
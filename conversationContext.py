@@ -0,0 +1,133 @@
+import threading
+
+# Rough token estimate for llama-family tokenizers on English text
+CHARS_PER_TOKEN = 4
+MESSAGE_OVERHEAD_TOKENS = 4
+# llama3.2-vision spends up to four 560x560 tiles of ~1600 tokens on an image
+IMAGE_TOKENS = 1601
+
+SUMMARY_TAG = "[SUMMARY OF THE CALL SO FAR]"
+
+# Prompt tokens a call's requests are trimmed to, and room left for the reply
+BUDGET_TOKENS = 6000
+REPLY_TOKENS = 1024
+
+
+def estimate_tokens(messages):
+    total = 0
+    for message in messages:
+        total += MESSAGE_OVERHEAD_TOKENS + len(message.get('content') or '') // CHARS_PER_TOKEN
+        total += IMAGE_TOKENS * len(message.get('images') or [])
+    return total
+
+
+def context_size(budget_tokens=BUDGET_TOKENS, reply_tokens=REPLY_TOKENS, images=1):
+    """
+    num_ctx for the worst-case request: a full budget, a reply and `images`
+    frames on top, rounded up to a multiple of 1024
+    """
+    needed = budget_tokens + reply_tokens + images * IMAGE_TOKENS
+    return -(-needed // 1024) * 1024
+
+
+# Sent with every responder request, including warmup and the greeting
+RESPONDER_NUM_CTX = context_size()
+
+
+class ConversationContext:
+    """
+    Token-budgeted view of a responder history.
+
+    Leading system messages and the last `keep_turns` turns are sent verbatim.
+    Older turns are removed from the history and folded into a running
+    summary by `summarizer(summary, evicted, options)`, off the request path:
+    until a fold finishes, the evicted turns are still sent verbatim, so
+    nothing is lost in between.
+
+    Ollama reloads a model whenever num_ctx changes, so every request sends
+    the same `num_ctx`, sized once for the worst case (see context_size);
+    only the trimming varies per request. Calls sharing a model should use
+    the same budget, so they don't force each other's reloads either.
+    """
+
+    def __init__(self, summarizer=None, budget_tokens=BUDGET_TOKENS, keep_turns=6, reply_tokens=REPLY_TOKENS,
+                 num_ctx=None):
+        self.summarizer = summarizer
+        self.budget_tokens = budget_tokens
+        self.keep_turns = keep_turns
+        self.reply_tokens = reply_tokens
+        self.num_ctx = num_ctx or context_size(budget_tokens, reply_tokens)
+        self.summary = ""
+        self.folds = 0
+        self.last_prompt_tokens = 0
+        self._pending = []
+        self._folding = False
+        self._lock = threading.Lock()
+
+    def _prefix(self):
+        prefix = []
+        if self.summary:
+            prefix.append({'role': 'user', 'content': f"{SUMMARY_TAG} {self.summary}"})
+        return prefix + self._pending
+
+    def prepare(self, history):
+        """
+        Evict old turns from `history` (in place) and return the messages and
+        options to send for this request. Callers hold the history's lock.
+        """
+        with self._lock:
+            pinned = 0
+            while pinned < len(history) and history[pinned].get('role') == 'system':
+                pinned += 1
+            starts = [i for i in range(pinned, len(history)) if history[i].get('role') == 'user']
+
+            keep = max(0, len(starts) - self.keep_turns)
+            # Drop further turns while over budget, but always send the latest one
+            while keep < len(starts) - 1 and estimate_tokens(self._prefix() + history[starts[keep]:]) > self.budget_tokens:
+                keep += 1
+
+            cut = starts[keep] if starts and keep > 0 else pinned
+            evicted = history[pinned:cut]
+            if evicted:
+                del history[pinned:cut]
+                self._pending.extend(evicted)
+
+            payload = history[:pinned] + self._prefix() + history[pinned:]
+            self.last_prompt_tokens = estimate_tokens(payload)
+            options = {'num_ctx': self.num_ctx}
+
+            if self._pending and self.summarizer and not self._folding:
+                self._folding = True
+                threading.Thread(target=self._fold, args=(dict(options),), daemon=True).start()
+
+        return payload, options
+
+    def _fold(self, options):
+        while True:
+            with self._lock:
+                batch = list(self._pending)
+                summary = self.summary
+                if not batch:
+                    self._folding = False
+                    return
+            try:
+                summary = self.summarizer(summary, batch, options)
+            except Exception as e:
+                print(f"Error summarizing conversation: {e}")
+                with self._lock:
+                    self._folding = False
+                return
+            with self._lock:
+                self.summary = summary
+                del self._pending[:len(batch)]
+                self.folds += 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                "summary_tokens": estimate_tokens([{'content': self.summary}]) if self.summary else 0,
+                "pending_messages": len(self._pending),
+                "folds": self.folds,
+                "last_prompt_tokens": self.last_prompt_tokens,
+                "num_ctx": self.num_ctx,
+            }
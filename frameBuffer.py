@@ -0,0 +1,95 @@
+import os
+import queue
+import threading
+from collections import deque, namedtuple
+import cv2
+
+# llama3.2-vision tiles images at 560x560; anything larger is downscaled by the model anyway
+VISION_MAX_SIDE = 560
+VISION_JPEG_QUALITY = 80
+
+EncodedFrame = namedtuple("EncodedFrame", ["frame_id", "captured_at", "jpeg"])
+
+
+def encode_for_model(frame, max_side=VISION_MAX_SIDE, quality=VISION_JPEG_QUALITY):
+    """JPEG bytes at the size and quality the vision model actually uses"""
+    height, width = frame.shape[:2]
+    scale = max_side / max(height, width)
+    if scale < 1.0:
+        frame = cv2.resize(frame, (int(width * scale), int(height * scale)), interpolation=cv2.INTER_AREA)
+    ok, buffer = cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, quality])
+    if not ok:
+        raise ValueError("JPEG encoding failed")
+    return buffer.tobytes()
+
+
+class FrameRing:
+    """Bounded ring of the frames one call actually used: analyzed or archived"""
+
+    def __init__(self, maxlen=60):
+        self._frames = deque(maxlen=maxlen)
+        self._lock = threading.Lock()
+        self._next_id = 0
+
+    def add(self, frame, captured_at):
+        """Encode `frame` once and keep it; returns the EncodedFrame"""
+        jpeg = encode_for_model(frame)
+        with self._lock:
+            encoded = EncodedFrame(f"frame_{self._next_id}", captured_at, jpeg)
+            self._next_id += 1
+            self._frames.append(encoded)
+        return encoded
+
+    def latest(self):
+        with self._lock:
+            return self._frames[-1] if self._frames else None
+
+    def frames(self):
+        with self._lock:
+            return list(self._frames)
+
+
+class FrameArchive:
+    """
+    Optional on-disk copy of encoded frames, written on a background thread.
+    Keeps at most `max_files` files; frames are dropped rather than queued
+    without bound if the disk can't keep up.
+    """
+
+    def __init__(self, directory, max_files=300, max_pending=32):
+        self.directory = directory
+        self.max_files = max_files
+        self.dropped = 0
+        os.makedirs(directory, exist_ok=True)
+        self._written = deque()
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def path_for(self, encoded):
+        return os.path.join(self.directory, f"{encoded.frame_id}.jpg")
+
+    def add(self, encoded):
+        try:
+            self._queue.put_nowait(encoded)
+        except queue.Full:
+            self.dropped += 1
+
+    def _run(self):
+        while True:
+            encoded = self._queue.get()
+            if encoded is None:
+                return
+            try:
+                path = self.path_for(encoded)
+                with open(path, "wb") as f:
+                    f.write(encoded.jpeg)
+                self._written.append(path)
+                while len(self._written) > self.max_files:
+                    os.remove(self._written.popleft())
+            except OSError as e:
+                print(f"Error archiving frame: {e}")
+
+    def close(self, timeout=1.0):
+        self._queue.put(None)
+        self._thread.join(timeout)
@@ -0,0 +1,67 @@
+import time
+import cv2
+import numpy as np
+
+
+class FrameSampler:
+    """
+    Decides which camera frames are worth sending to the vision model.
+
+    Each frame is reduced to a small grayscale thumbnail. A frame is
+    forwarded when it is novel compared with the last analyzed frame
+    (difference-hash distance) or shows large motion compared with the
+    previous frame (mean absolute difference), but never more often than
+    `min_interval` and at least every `max_interval` seconds.
+    """
+
+    def __init__(self, min_interval=2.0, max_interval=30.0, hash_threshold=10,
+                 motion_threshold=18.0, thumb_size=(32, 32)):
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.hash_threshold = hash_threshold
+        self.motion_threshold = motion_threshold
+        self.thumb_size = thumb_size
+        self.last_analyzed_at = None
+        self._last_hash = None
+        self._prev_thumb = None
+        self.stats = {"frames": 0, "analyzed": 0, "novel": 0, "motion": 0, "interval": 0}
+
+    def _features(self, frame):
+        gray = frame if frame.ndim == 2 else cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        thumb = cv2.resize(gray, self.thumb_size, interpolation=cv2.INTER_AREA).astype(np.float32)
+        # dHash: 8x8 bits of "is the pixel brighter than its right neighbour"
+        small = cv2.resize(gray, (9, 8), interpolation=cv2.INTER_AREA).astype(np.int16)
+        dhash = small[:, 1:] > small[:, :-1]
+        return thumb, dhash
+
+    def should_analyze(self, frame, now=None):
+        """True if `frame` should go to the vision model; call on every captured frame"""
+        now = time.time() if now is None else now
+        self.stats["frames"] += 1
+        thumb, dhash = self._features(frame)
+
+        motion = 0.0
+        if self._prev_thumb is not None:
+            motion = float(np.mean(np.abs(thumb - self._prev_thumb)))
+        self._prev_thumb = thumb
+
+        if self.last_analyzed_at is None:
+            reason = "interval"
+        else:
+            since = now - self.last_analyzed_at
+            if since < self.min_interval:
+                return False
+            if since >= self.max_interval:
+                reason = "interval"
+            elif np.count_nonzero(dhash != self._last_hash) >= self.hash_threshold:
+                reason = "novel"
+            elif motion >= self.motion_threshold:
+                reason = "motion"
+            else:
+                return False
+
+        self.last_analyzed_at = now
+        self._last_hash = dhash
+        self.stats["analyzed"] += 1
+        self.stats[reason] += 1
+        return True
@@ -1,22 +1,22 @@
-import asyncio
-from datetime import datetime
-import json
+import os
 import tkinter as tk
 from tkinter import messagebox, scrolledtext
-from audio import AudioHandler
-from threatHelper import init_threat_responder, threat_responder
-from video import VideoHandler
-from ollamaHelper import init_responder, responder, clear_messages
+from callClient import AudioCall, CallClient, VideoCall
+from callServer import report, serve_in_background
+from ollamaHelper import init_responder
+from text_to_speech import COMMON_PHRASES, presynthesize
 
 class EmergencyGUI:
-    def __init__(self, root):
+    def __init__(self, root, address=None):
         self.root = root
+        # Calls run on the call server at `address`; this window only captures and plays
+        self.address = address
         self.root.title("911")
         self.root.geometry("600x400")
         
         # Initialize handlers
-        self.audio_handler = AudioHandler()
-        self.video_handler = VideoHandler()
+        self.audio_handler = AudioCall(address)
+        self.video_handler = VideoCall(address)
         
         # Create frames
         self.root_frame = tk.Frame(root)
@@ -28,7 +28,7 @@ class EmergencyGUI:
         self.chat_started = False
         self.is_running = False
         self.user_id = ""
-        self.ticket = {}
+        self.chat_client = None
         
         # Set up frames
         self.setup_audio_frame()
@@ -129,24 +129,26 @@ class EmergencyGUI:
         
     def start_chat(self):
         """Initialize and start the chat session with threat monitoring"""
+        # The server runs the responder and threat monitor and writes the tickets
+        try:
+            self.chat_client = CallClient(self.address, on_message=self.process_server_message)
+            self.user_id = self.chat_client.start("text")["call_id"]
+        except (OSError, ConnectionError) as e:
+            messagebox.showerror("Call server", f"Cannot start chat: {e}")
+            return
         self.chat_started = True
         self.is_running = True
-        self.user_id = datetime.now().strftime("%Y%m%d%H%M%S%f")[:17]
-        self.ticket[self.user_id] = []
         
         self.toggle_chat_controls(True)
         self.chat_display.delete(1.0, tk.END)
         
-        # Initialize both responder and threat monitor
-        clear_messages()
-        init_threat_responder()
-        response = init_responder(False)
+        response = self.chat_client.next_reply()
         
-        if response[0]:
-            self.display_message("Assistant", response[1])
+        if response and response["type"] == "reply":
+            self.display_message("Assistant", response["text"])
             
     def end_chat(self):
-        """End the chat session and save ticket if needed"""
+        """End the chat session; tickets were already persisted as threats came in"""
         if not self.chat_started:
             return
             
@@ -154,13 +156,8 @@ class EmergencyGUI:
         self.is_running = False
         self.toggle_chat_controls(False)
         self.display_message("System", "\nChat session ended\n")
-        
-        # Save ticket if there were any threats detected
-        if self.ticket[self.user_id]:
-            with open("ticket_log.json", "w+") as f:
-                json.dump(self.ticket, f, indent=2)
-        
-        self.ticket = {}
+        # Doesn't wait for the server to finish scoring; the connection closes once it has
+        self.chat_client.hang_up()
         
     def send_message(self, event):
         """Handle sending messages with threat monitoring"""
@@ -175,22 +172,19 @@ class EmergencyGUI:
         self.display_message("You", message)
         self.chat_input.delete(0, tk.END)
         
-        # Check for threats
-        continue_chat = asyncio.run(self.process_threat(message))
+        # Threat check runs alongside the assistant response
+        response = self.chat_client.ask(message)
         
-        if not continue_chat:
-            self.display_message("System", "\nEmergency detected. Chat ended for safety.\n")
+        if response is None:  # Lost the call server
             self.end_chat()
+        elif response["type"] != "reply":
+            # Ended by the threat monitor; process_server_message handles it
             return
-            
-        # Get and display assistant response
-        response = responder(message, False)
-        
-        if not response[0]:  # Chat ended by assistant
-            self.display_message("Assistant", response[1])
+        elif response["end_call"]:  # Chat ended by assistant
+            self.display_message("Assistant", response["text"])
             self.end_chat()
         else:
-            self.display_message("Assistant", response[1])
+            self.display_message("Assistant", response["text"])
             
     def display_message(self, sender, message):
         """Display a message in the chat window"""
@@ -199,7 +193,11 @@ class EmergencyGUI:
         
         
     def start_audio(self):
-        self.audio_handler.start_audio()
+        try:
+            self.audio_handler.start_audio()
+        except (OSError, ConnectionError) as e:
+            messagebox.showerror("Call server", f"Cannot start call: {e}")
+            return
         self.audio_start_button.config(state='disabled')
         
     def end_audio(self):
@@ -208,7 +206,12 @@ class EmergencyGUI:
         self.go_to_page(self.root_frame)
         
     def start_video(self):
-        if self.video_handler.start_video(self.camera_label):
+        try:
+            started = self.video_handler.start_video(self.camera_label)
+        except (OSError, ConnectionError) as e:
+            messagebox.showerror("Call server", f"Cannot start call: {e}")
+            return
+        if started:
             self.video_start_button.config(state='disabled')
         
     def end_video(self):
@@ -219,6 +222,8 @@ class EmergencyGUI:
     def exit_action(self):
         self.audio_handler.stop_audio()
         self.video_handler.stop_video()
+        if self.chat_started:
+            self.end_chat()
         self.root.quit()
 
     def back_to_menu(self):
@@ -231,28 +236,28 @@ class EmergencyGUI:
 
     
         
-    async def process_threat(self, message):
-        """Process message for threats and update ticket"""
-        threat = await threat_responder(message)
-        
-        if threat[0] == True:  # Threat detected
-            self.ticket[self.user_id].append({
-                "type": "chat_threat",
-                "timestamp": str(datetime.now()),
-                "message": message,
-                "details": threat[1]
-            })
-            # print("******** CHAT TICKET:", self.ticket[self.user_id], "********")
-            
-            # Save ticket whenever a threat is detected
-            with open("ticket_log.json", "w+") as f:
-                json.dump(self.ticket, f, indent=2)
-                
-        return threat[0]  # Return whether to continue the chat
+    def process_server_message(self, header, payload):
+        """Messages for the chat call; runs on the client's reader thread"""
+        if header["type"] == "ended" and header.get("reason") == "threat":
+            # Threat monitor ended the call; Tk widgets must be touched on the main thread
+            self.root.after(0, self.end_chat_for_safety)
+
+    def end_chat_for_safety(self):
+        if self.chat_started:
+            self.display_message("System", "\nEmergency detected. Chat ended for safety.\n")
+            self.end_chat()
         
     
 
 if __name__ == "__main__":
+    # CALL_SERVER=host:port joins a running call server (python callServer.py);
+    # without it a call server is started in this process, with its models warmed first
+    server = None if os.environ.get("CALL_SERVER") else serve_in_background()
+    # Replies are synthesized here; the greeting is known up front when the server is local
+    presynthesize(COMMON_PHRASES + ([init_responder(False)[1]] if server else []))
     root = tk.Tk()
-    app = EmergencyGUI(root)
-    root.mainloop()
\ No newline at end of file
+    app = EmergencyGUI(root, os.environ.get("CALL_SERVER") or server.address)
+    root.mainloop()
+    if server:
+        server.stop()
+        report()
\ No newline at end of file
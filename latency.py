@@ -0,0 +1,7 @@
+def percentile(samples, pct):
+    """Nearest-rank `pct` percentile of `samples`, or None if there are none"""
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
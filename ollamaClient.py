@@ -0,0 +1,178 @@
+import asyncio
+import os
+import threading
+import time
+import weakref
+from collections import defaultdict, deque
+import httpx
+import ollama
+from conversationContext import RESPONDER_NUM_CTX
+from latency import percentile
+from tracing import count, span
+
+# Models every call uses; they are warmed at startup and kept resident
+PINNED_MODELS = ["responder", "threat"]
+# How long Ollama keeps a pinned model loaded after its last request ("-1" = forever)
+KEEP_ALIVE = os.environ.get("OLLAMA_KEEP_ALIVE", "30m")
+# Options that change how a model is loaded; warmup sends the same ones as real requests
+LOAD_OPTIONS = {"responder": {"num_ctx": RESPONDER_NUM_CTX}}
+# A request whose model load took longer than this counts as cold
+COLD_LOAD_SECONDS = 0.5
+# Connections kept open to the server, shared by every call in the process
+POOL_LIMITS = httpx.Limits(max_connections=16, max_keepalive_connections=8, keepalive_expiry=300)
+
+_client = None
+_client_lock = threading.Lock()
+# httpx async connections belong to one event loop, so each loop gets its own client
+_async_clients = weakref.WeakKeyDictionary()
+_latencies = defaultdict(lambda: deque(maxlen=1000))
+_usage = defaultdict(lambda: defaultdict(float))
+_latencies_lock = threading.Lock()
+# Last num_ctx sent per model; a different one makes Ollama reload the model
+_num_ctx = {}
+
+
+def get_client():
+    """Process-wide ollama.Client over a pooled keep-alive HTTP connection"""
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = ollama.Client(limits=POOL_LIMITS)
+        return _client
+
+
+def get_async_client():
+    """ollama.AsyncClient for the running event loop, pooled like get_client()"""
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None:
+        client = _async_clients[loop] = ollama.AsyncClient(limits=POOL_LIMITS)
+    return client
+
+
+def _with_keep_alive(kwargs):
+    if kwargs.get('keep_alive') is None and kwargs.get('model') in PINNED_MODELS:
+        kwargs['keep_alive'] = KEEP_ALIVE
+    _check_num_ctx(kwargs.get('model'), kwargs.get('options'))
+    return kwargs
+
+
+def _check_num_ctx(model, options):
+    num_ctx = (options or {}).get('num_ctx')
+    with _latencies_lock:
+        changed = model in _num_ctx and _num_ctx[model] != num_ctx
+        if changed:
+            _usage[model]["num_ctx_changes"] += 1
+        _num_ctx[model] = num_ctx
+    if changed:
+        # Each one is a full model reload on the server
+        count("ollama.num_ctx_changes")
+
+
+def _record(model, response, seconds):
+    load = (getattr(response, 'load_duration', None) or 0) / 1e9
+    kind = "cold" if load > COLD_LOAD_SECONDS else "warm"
+    with _latencies_lock:
+        _latencies[(model, kind)].append(seconds)
+        # Token counts and durations Ollama reports on the final response
+        usage = _usage[model]
+        usage["requests"] += 1
+        usage["prompt_tokens"] += getattr(response, 'prompt_eval_count', None) or 0
+        usage["prompt_seconds"] += (getattr(response, 'prompt_eval_duration', None) or 0) / 1e9
+        usage["output_tokens"] += getattr(response, 'eval_count', None) or 0
+        usage["output_seconds"] += (getattr(response, 'eval_duration', None) or 0) / 1e9
+
+
+def chat(**kwargs):
+    """
+    ollama.chat on the shared client, with keep-alive for the pinned models.
+    For a stream the latency and tracing span last until it is consumed.
+    """
+    kwargs = _with_keep_alive(kwargs)
+    if kwargs.get('stream'):
+        return _chat_stream(kwargs)
+    with span("ollama.chat", model=kwargs.get('model')):
+        start = time.perf_counter()
+        response = get_client().chat(**kwargs)
+    _record(kwargs.get('model'), response, time.perf_counter() - start)
+    return response
+
+
+def _chat_stream(kwargs):
+    with span("ollama.chat", model=kwargs.get('model'), stream=True):
+        start = time.perf_counter()
+        chunk = None
+        for chunk in get_client().chat(**kwargs):
+            yield chunk
+    # Ollama reports the load time on the final chunk
+    _record(kwargs.get('model'), chunk, time.perf_counter() - start)
+
+
+async def aclose():
+    """Close the running loop's async client; call before the loop shuts down"""
+    client = _async_clients.pop(asyncio.get_running_loop(), None)
+    if client is not None:
+        await client.close()
+
+
+async def achat(**kwargs):
+    """Async chat() for code already on an event loop; no worker thread needed"""
+    kwargs = _with_keep_alive(kwargs)
+    with span("ollama.chat", model=kwargs.get('model')):
+        start = time.perf_counter()
+        response = await get_async_client().chat(**kwargs)
+    _record(kwargs.get('model'), response, time.perf_counter() - start)
+    return response
+
+
+def warmup(models=None, keep_alive=None):
+    """
+    Load `models` (default: the pinned ones) and set their keep-alive with an
+    empty chat, which loads a model without generating anything. Returns
+    {model: seconds} or {model: error} for models that failed.
+    """
+    results = {}
+    for model in models or PINNED_MODELS:
+        start = time.perf_counter()
+        try:
+            with span("ollama.warmup", model=model):
+                options = LOAD_OPTIONS.get(model)
+                _check_num_ctx(model, options)
+                get_client().chat(model=model, messages=[], options=options, keep_alive=keep_alive or KEEP_ALIVE)
+            results[model] = time.perf_counter() - start
+        except Exception as e:
+            results[model] = f"error: {e}"
+    return results
+
+
+def latency_stats():
+    """Request latency (seconds) per model, split into cold and warm loads"""
+    with _latencies_lock:
+        samples = {key: list(values) for key, values in _latencies.items()}
+    stats = defaultdict(dict)
+    for (model, kind), values in sorted(samples.items()):
+        stats[model][kind] = {
+            "count": len(values),
+            "mean": sum(values) / len(values),
+            "p50": percentile(values, 50),
+            "p95": percentile(values, 95),
+        }
+    return dict(stats)
+
+
+def usage_stats():
+    """Requests, tokens, tokens/second and num_ctx changes (reloads) per model, as reported by Ollama"""
+    with _latencies_lock:
+        usage = {model: dict(values) for model, values in _usage.items()}
+    for values in usage.values():
+        for kind in ("prompt", "output"):
+            seconds = values.get(f"{kind}_seconds")
+            values[f"{kind}_tokens_per_second"] = values.get(f"{kind}_tokens", 0) / seconds if seconds else None
+    return usage
+
+
+def reset_stats():
+    with _latencies_lock:
+        _latencies.clear()
+        _usage.clear()
+        _num_ctx.clear()
@@ -1,32 +1,148 @@
-import asyncio
-import ollama
+import json
+import os
+import re
+import threading
+from collections import deque
+from conversationContext import RESPONDER_NUM_CTX
+from ollamaClient import achat, chat
+from threatHelper import RATIONALE_CHARS, THREAT_CATEGORIES, parse_threat
+
+# A sentence ends at ., ! or ? (optionally followed by a quote/bracket) and whitespace
+SENTENCE_END = re.compile(r'(?<=[.!?])\s+|(?<=[.!?]["\')\]])\s+')
+
+# Prefix for a processed frame whose raw image was replaced by the model's description
+FRAME_CAPTION_TAG = "[CAMERA FRAME]"
+
+# Combined mode: one responder request returns the reply and the threat assessment.
+# The instruction rides on the caller's turn in the request only; a system
+# message would replace the responder persona, and the history keeps plain text.
+COMBINED_INSTRUCTION = (
+    "Answer as JSON. \"reply\": what you say to the caller. \"threat_score\": urgency and distress "
+    "of the call so far from 1 (least urgent) to 10 (most). \"category\": the kind of emergency. "
+    "\"assessment\": one short factual sentence for the authorities; do not make anything up. "
+    "\"end_call\": true only if the call is over."
+)
+COMBINED_FORMAT = {
+    "type": "object",
+    "properties": {
+        # First, so it can be spoken while the rest is generated
+        "reply": {"type": "string"},
+        "threat_score": {"type": "integer", "minimum": 1, "maximum": 10},
+        "category": {"type": "string", "enum": THREAT_CATEGORIES},
+        "assessment": {"type": "string", "maxLength": RATIONALE_CHARS},
+        "end_call": {"type": "boolean"},
+    },
+    "required": ["reply", "threat_score", "category", "assessment", "end_call"],
+}
+_JSON_ESCAPES = {'"': '"', '\\': '\\', '/': '/', 'b': '\b', 'f': '\f', 'n': '\n', 'r': '\r', 't': '\t'}
+
+_greeting = None
 
 def init_responder(shouldPrint=True):
-    response = ollama.chat(
-        model="responder",
-        messages=[{
-            'role': 'user',
-            'content': "**START CALL**"
-        }],
-    )
+    # The greeting is generated once per process so its audio can be pre-synthesized
+    global _greeting
+    if _greeting is None:
+        response = chat(
+            model="responder",
+            messages=[{
+                'role': 'user',
+                'content': "**START CALL**"
+            }],
+            # Same num_ctx as the call's requests, so the first turn doesn't reload the model
+            options={'num_ctx': RESPONDER_NUM_CTX},
+        )
+        _greeting = response['message']['content']
 
     if shouldPrint:
-        print(response['message']['content'], end = "", flush=True)
+        print(_greeting, end = "", flush=True)
 
-    return [True,response['message']['content']]
+    return [True,_greeting]
 
 
+# Default history for single-call scripts; concurrent calls pass their CallSession's list and lock
 messages=[]
-def responder(user_input, shouldPrint = True):
-    messages.append({
-                'role': 'user',
-                'content': user_input 
-            })
-    response = ollama.chat(
+messages_lock = threading.Lock()
+_payloads = deque(maxlen=1000)
+_payloads_lock = threading.Lock()
+
+def _image_size(image):
+    if isinstance(image, (bytes, bytearray)):
+        return len(image)
+    if isinstance(image, str) and os.path.exists(image):
+        # ollama reads paths and sends them base64-encoded
+        return (os.path.getsize(image) + 2) // 3 * 4
+    return len(image) if isinstance(image, str) else 0
+
+def payload_size(payload):
+    """Approximate request body size in bytes, including base64 images"""
+    text = json.dumps([{k: v for k, v in m.items() if k != 'images'} for m in payload], default=str)
+    return len(text.encode('utf-8')) + sum(_image_size(i) for m in payload for i in (m.get('images') or []))
+
+def payload_stats():
+    """Size of recent responder requests, to measure what history trimming saves"""
+    with _payloads_lock:
+        sizes = [size for size, _ in _payloads]
+        images = [count for _, count in _payloads]
+    if not sizes:
+        return {"requests": 0}
+    return {
+        "requests": len(sizes),
+        "last_bytes": sizes[-1],
+        "mean_bytes": sum(sizes) / len(sizes),
+        "max_bytes": max(sizes),
+        "last_images": images[-1],
+    }
+
+def _request(history, context, lock):
+    # With a ConversationContext, old turns are folded into a summary and num_ctx is the pinned size
+    with lock:
+        if context is None:
+            payload, options = list(history), {'num_ctx': RESPONDER_NUM_CTX}
+        else:
+            payload, options = context.prepare(history)
+    with _payloads_lock:
+        _payloads.append((payload_size(payload), sum(len(m.get('images') or []) for m in payload)))
+    return payload, options
+
+def _index(history, message):
+    return next((i for i, m in enumerate(history) if m is message), None)
+
+def strip_images(history, frames, keep_images=0):
+    """
+    Replace all but the last `keep_images` of `frames`, the (frame message,
+    reply message) pairs image_responder added to `history`, with the
+    description the model gave, so later requests don't resend the images.
+    Messages are found by identity: another thread's turn can land between
+    a frame and its reply.
+    """
+    while len(frames) > keep_images:
+        frame, reply = frames.pop(0)
+        i = _index(history, frame)
+        if i is not None:
+            history[i] = {'role': 'user', 'content': f"{FRAME_CAPTION_TAG} {reply['content']}".strip()}
+        # The caption now lives in the frame message itself
+        i = _index(history, reply)
+        if i is not None:
+            del history[i]
+
+def responder(user_input, shouldPrint = True, history=None, context=None, lock=None):
+    if history is None:
+        history = messages
+    if lock is None:
+        lock = messages_lock
+    with lock:
+        history.append({
+                    'role': 'user',
+                    'content': user_input 
+                })
+    payload, options = _request(history, context, lock)
+    response = chat(
             model="responder",
-            messages=messages,
+            messages=payload,
+            options=options,
     )
-    messages.append(response)
+    with lock:
+        history.append({'role': 'assistant', 'content': response['message']['content']})
     if shouldPrint:
         print(response['message']['content'], end = "", flush=True)
 
@@ -34,21 +150,210 @@ def responder(user_input, shouldPrint = True):
         return [False, response['message']['content']]
     return [True, response['message']['content']]
 
-async def image_responder(images , shouldPrint = True):
-    await asyncio.sleep(1)
-    messages.append({
+def stream_responder(user_input, shouldPrint = True, history=None, context=None, lock=None):
+    """
+    Streaming variant of `responder`: yields tokens as they are generated.
+    The full reply is appended to the history once the stream finishes, and the
+    generator's return value is the same [continue, text] pair `responder` returns.
+    """
+    if history is None:
+        history = messages
+    if lock is None:
+        lock = messages_lock
+    with lock:
+        history.append({
+                    'role': 'user',
+                    'content': user_input 
+                })
+    payload, options = _request(history, context, lock)
+    parts = []
+    for chunk in chat(model="responder", messages=payload, options=options, stream=True):
+        token = chunk['message']['content']
+        if shouldPrint:
+            print(token, end = "", flush=True)
+        parts.append(token)
+        yield token
+
+    content = ''.join(parts)
+    with lock:
+        history.append({'role': 'assistant', 'content': content})
+
+    if "**END CALL**" in content:
+        return [False, content]
+    return [True, content]
+
+def split_sentences(tokens):
+    """
+    Group a token stream into sentences so speech can start on the first one.
+    The generator's return value is whatever `tokens` returned.
+    """
+    buffer = ""
+    iterator = iter(tokens)
+    while True:
+        try:
+            buffer += next(iterator)
+        except StopIteration as stop:
+            if buffer.strip():
+                yield buffer.strip()
+            return stop.value
+        parts = SENTENCE_END.split(buffer)
+        for sentence in parts[:-1]:
+            if sentence.strip():
+                yield sentence.strip()
+        buffer = parts[-1]
+
+async def image_responder(images , shouldPrint = True, history=None, context=None, keep_images=0, lock=None,
+                          frames=None):
+    """
+    Describe `images` as a frame message in `history`. `frames` holds the
+    frames still kept raw (see strip_images) and persists across calls when
+    keep_images is set.
+    """
+    if history is None:
+        history = messages
+    if lock is None:
+        lock = messages_lock
+    if frames is None:
+        frames = []
+    frame = {
                 'role': 'SYSTEM',
                 'content': "The caller is sharing image feed while they are in distress, use this to update your knowledge base and describe the captured frames. I want you to also summarise what you see in the images and also what you hear from the caller.",
                 'images': images
-            })
-    response = ollama.chat(
+            }
+    with lock:
+        history.append(frame)
+    payload, options = _request(history, context, lock)
+    response = await achat(
             model="responder",
-            messages=messages,
+            messages=payload,
+            options=options,
     )
-    messages.append(response)
+    reply = {'role': 'assistant', 'content': response['message']['content']}
+    with lock:
+        history.append(reply)
+        frames.append((frame, reply))
+        strip_images(history, frames, keep_images)
     if shouldPrint:
         print(response['message']['content'], end = "", flush=True)
     return response['message']['content']
 
+def summarize_history(summary, evicted, options=None):
+    """Fold evicted turns into the running call summary"""
+    transcript = "\n".join(f"{m['role']}: {m.get('content') or ''}" for m in evicted)
+    response = chat(
+            model="responder",
+            messages=[{
+                # A system message here replaces the responder persona for this one request
+                'role': 'system',
+                'content': "You maintain a running summary of a 911 call for the dispatcher agent. "
+                           "Merge the new transcript into the existing summary. Keep locations, names, "
+                           "injuries, threats and what has already been asked. Reply with the summary only."
+            }, {
+                'role': 'user',
+                'content': f"Existing summary:\n{summary or '(none)'}\n\nNew transcript:\n{transcript}"
+            }],
+            options=options,
+    )
+    return response['message']['content'].strip()
+
+def json_string_field(tokens, field):
+    """
+    Yield the decoded value of the top-level string `field` from a stream of
+    JSON text as it arrives. The generator's return value is the whole JSON text.
+    """
+    start = re.compile(r'"%s"\s*:\s*"' % re.escape(field))
+    raw = ""
+    pos = None
+    done = False
+    for token in tokens:
+        raw += token
+        if done:
+            continue
+        if pos is None:
+            match = start.search(raw)
+            if not match:
+                continue
+            pos = match.end()
+        out = []
+        while pos < len(raw):
+            char = raw[pos]
+            if char == '"':
+                done = True
+                break
+            if char != '\\':
+                out.append(char)
+                pos += 1
+                continue
+            # Escapes are decoded once complete; a partial one waits for the next token
+            if pos + 1 >= len(raw):
+                break
+            if raw[pos + 1] != 'u':
+                out.append(_JSON_ESCAPES.get(raw[pos + 1], raw[pos + 1]))
+                pos += 2
+                continue
+            width = 12 if 0xD800 <= int(raw[pos + 2:pos + 6] or "0", 16) < 0xDC00 else 6
+            if pos + width > len(raw):
+                break
+            out.append(json.loads('"' + raw[pos:pos + width] + '"'))
+            pos += width
+        if out:
+            yield ''.join(out)
+    return raw
+
+def combined_responder(user_input, shouldPrint = True, history=None, context=None, lock=None):
+    """
+    One request for both the reply and the threat assessment. Yields reply
+    text as it streams; the generator returns ([continue, reply], threat),
+    where threat is [True, ThreatAssessment] like threat_responder's, or None
+    if the output had no usable score.
+    """
+    if history is None:
+        history = messages
+    if lock is None:
+        lock = messages_lock
+    turn = {
+                'role': 'user',
+                'content': user_input 
+            }
+    with lock:
+        history.append(turn)
+    payload, options = _request(history, context, lock)
+    # Found by identity: a frame caption from the vision worker can land after the caller's turn
+    instructed = dict(turn, content=f"{user_input}\n\n{COMBINED_INSTRUCTION}")
+    index = _index(payload, turn)
+    if index is None:
+        payload.append(instructed)
+    else:
+        payload[index] = instructed
+    stream = chat(model="responder", messages=payload, options=options, format=COMBINED_FORMAT, stream=True)
+    pieces = json_string_field((chunk['message']['content'] for chunk in stream), "reply")
+    while True:
+        try:
+            piece = next(pieces)
+        except StopIteration as stop:
+            raw = stop.value
+            break
+        if shouldPrint:
+            print(piece, end = "", flush=True)
+        yield piece
+
+    try:
+        result = json.loads(raw)
+        reply = str(result.get('reply', '')).strip()
+    except ValueError:
+        print(f"Error parsing combined response: {raw[:200]}")
+        result, reply = {}, ""
+    with lock:
+        history.append({'role': 'assistant', 'content': reply})
+
+    threat = None
+    # end_call here is the responder's, already returned with the reply
+    assessment = parse_threat(json.dumps(dict(result, end_call=False)), source="combined")
+    if assessment.score is not None:
+        threat = [True, assessment]
+    if result.get('end_call') or "**END CALL**" in reply:
+        return [False, reply], threat
+    return [True, reply], threat
+
 def clear_messages():
-    messages = []
+    messages.clear()
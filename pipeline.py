@@ -0,0 +1,226 @@
+import asyncio
+import os
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from latency import percentile
+from text import transliterate_text
+from text_to_speech import text_to_speech
+from ollamaClient import aclose
+from ollamaHelper import split_sentences
+from tracing import count, set_call
+
+# CALL_MODE=combined makes one responder request return the reply and the threat score
+COMBINED_MODE = os.environ.get("CALL_MODE") == "combined"
+# The responder's end-of-call marker, a control token rather than something to read out
+END_CALL = "**END CALL**"
+
+
+def finish(generator):
+    """Run a generator to the end and return its return value"""
+    while True:
+        try:
+            next(generator)
+        except StopIteration as stop:
+            return stop.value
+
+
+class StageTimings:
+    """Rolling per-stage durations (seconds) for one call"""
+
+    def __init__(self, maxlen=1000):
+        self._samples = defaultdict(lambda: deque(maxlen=maxlen))
+        self._lock = threading.Lock()
+
+    def record(self, stage, seconds):
+        with self._lock:
+            self._samples[stage].append(seconds)
+
+    @contextmanager
+    def measure(self, stage):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(stage, time.perf_counter() - start)
+
+    def samples(self):
+        """Raw durations per stage, e.g. to pool several calls"""
+        with self._lock:
+            return {stage: list(values) for stage, values in self._samples.items()}
+
+    def summary(self):
+        samples = self.samples()
+        return {
+            stage: {
+                "count": len(values),
+                "mean": sum(values) / len(values),
+                "p50": percentile(values, 50),
+                "p95": percentile(values, 95),
+                "p99": percentile(values, 99),
+                "max": max(values),
+            }
+            for stage, values in samples.items() if values
+        }
+
+
+class CallPipeline:
+    """
+    Per-utterance stages for one CallSession, run on a persistent event loop.
+
+    Threat scoring starts as soon as the utterance arrives and runs alongside
+    the responder -> transliteration -> speech chain. `on_threat(text, threat)`
+    is called the moment a score comes back, so tickets are written without
+    waiting for the reply to finish playing.
+
+    With `stream=True` the reply is spoken sentence by sentence while the rest
+    is still being generated. With `combined=True` (default: CALL_MODE) there
+    is no separate threat request: the responder returns the threat score with
+    its reply, and `on_threat` runs once the reply is complete.
+
+    `speaker(text)` plays one transliterated sentence; it defaults to
+    text_to_speech, and the call server passes one that sends it to the client.
+    """
+
+    def __init__(self, session, on_threat=None, speak=True, prefix="", shouldPrint=True, stream=True,
+                 combined=None, speaker=None):
+        self.session = session
+        self.on_threat = on_threat
+        self.speak = speak
+        self.speaker = speaker or text_to_speech
+        self.stream = stream
+        self.combined = COMBINED_MODE if combined is None else combined
+        self.prefix = prefix
+        self.shouldPrint = shouldPrint
+        self.timings = StageTimings()
+        self._threat_tasks = set()
+        self._spoke = False
+
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self._thread.start()
+        # Threat history is a conversation, so utterances are scored in order
+        self._threat_lock = self._run(self._make_lock())
+
+    def _run(self, coro, timeout=None):
+        return asyncio.run_coroutine_threadsafe(coro, self.loop).result(timeout)
+
+    async def _make_lock(self):
+        return asyncio.Lock()
+
+    async def _timed(self, stage, awaitable):
+        start = time.perf_counter()
+        try:
+            return await awaitable
+        finally:
+            self.timings.record(stage, time.perf_counter() - start)
+
+    def process(self, text, timeout=None):
+        """Run one utterance; returns the responder result once the reply has been spoken"""
+        return self._run(self._process(text), timeout)
+
+    async def _process(self, text):
+        start = time.perf_counter()
+        # Tasks get their own context; helpers started with to_thread inherit it
+        set_call(self.session.call_id)
+        count("utterances")
+        self._spoke = False
+        if self.combined:
+            val = await self._combined_reply(text, start)
+            self.timings.record("reply_total", time.perf_counter() - start)
+            return val
+
+        task = self.loop.create_task(self._score_threat(text))
+        self._threat_tasks.add(task)
+        task.add_done_callback(self._threat_tasks.discard)
+
+        if self.speak and self.stream:
+            val = await self._stream_reply(self.session.stream_respond(self.prefix + text, self.shouldPrint), start)
+        else:
+            val = await self._timed("responder", asyncio.to_thread(self.session.respond, self.prefix + text, self.shouldPrint))
+            if self.speak:
+                await self._speak(val[1], start)
+
+        self.timings.record("reply_total", time.perf_counter() - start)
+        return val
+
+    async def _speak(self, sentence, start):
+        # Whatever shares a sentence with the marker is still spoken
+        sentence = sentence.replace(END_CALL, "").strip()
+        if not sentence:
+            return
+        spoken = await self._timed("transliterate", asyncio.to_thread(transliterate_text, sentence, self.session.language_cache))
+        if not self._spoke:
+            self._spoke = True
+            self.timings.record("first_audio", time.perf_counter() - start)
+        await self._timed("tts", asyncio.to_thread(self.speaker, spoken))
+
+    def _produce_sentences(self, tokens, queue):
+        # Runs on a worker thread; hands each finished sentence to the loop
+        sentences = split_sentences(tokens)
+        while True:
+            try:
+                sentence = next(sentences)
+            except StopIteration as stop:
+                return stop.value
+            self.loop.call_soon_threadsafe(queue.put_nowait, sentence)
+
+    async def _speak_sentences(self, queue, start):
+        while True:
+            sentence = await queue.get()
+            if sentence is None:
+                return
+            await self._speak(sentence, start)
+
+    async def _stream_reply(self, tokens, start):
+        queue = asyncio.Queue()
+        speaker = self.loop.create_task(self._speak_sentences(queue, start))
+        try:
+            return await self._timed("responder", asyncio.to_thread(self._produce_sentences, tokens, queue))
+        finally:
+            queue.put_nowait(None)
+            await speaker
+
+    async def _combined_reply(self, text, start):
+        tokens = self.session.combined_respond(self.prefix + text, self.shouldPrint)
+        if self.speak:
+            val, threat = await self._stream_reply(tokens, start)
+        else:
+            val, threat = await self._timed("responder", asyncio.to_thread(finish, tokens))
+        if threat is not None and self.on_threat:
+            await self._timed("ticket_write", asyncio.to_thread(self.on_threat, text, threat))
+        return val
+
+    async def _score_threat(self, text):
+        start = time.perf_counter()
+        set_call(self.session.call_id)
+        try:
+            async with self._threat_lock:
+                threat = await self._timed("threat", self.session.score_threat(text))
+            if self.on_threat:
+                await self._timed("ticket_write", asyncio.to_thread(self.on_threat, text, threat))
+            self.timings.record("threat_total", time.perf_counter() - start)
+            return threat
+        except Exception as e:
+            print(f"Error in threat processing: {e}")
+
+    async def _drain(self):
+        if self._threat_tasks:
+            await asyncio.gather(*list(self._threat_tasks), return_exceptions=True)
+        # Connections of this loop's Ollama client can't be reused by another loop
+        await aclose()
+
+    def close(self, timeout=30):
+        """Let in-flight threat scoring finish, then stop the loop"""
+        if not self.loop.is_running():
+            return
+        try:
+            self._run(self._drain(), timeout)
+        except Exception as e:
+            print(f"Error waiting for threat processing: {e}")
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        if threading.current_thread() is not self._thread:
+            self._thread.join(timeout=1.0)
+            if not self._thread.is_alive():
+                self.loop.close()
@@ -0,0 +1,71 @@
+import threading
+import time
+import cv2
+import numpy as np
+from PIL import Image, ImageTk
+
+
+class PreviewRenderer:
+    """
+    Camera preview for a Tk label at a fixed target FPS.
+
+    Frames arriving faster than `fps`, or while the previous update is still
+    waiting for the Tk thread, are dropped instead of queued. Resize and
+    colour conversion write into preallocated buffers, and the Tk image is
+    created once and updated in place with `paste`.
+    """
+
+    def __init__(self, label, size=(400, 300), fps=15):
+        self.label = label
+        self.size = size
+        self.interval = 1.0 / fps
+        width, height = size
+        self._small = np.empty((height, width, 3), dtype=np.uint8)
+        self._rgb = np.empty((height, width, 3), dtype=np.uint8)
+        self._photo = None
+        self._pending = False
+        self._next_due = 0.0
+        self._lock = threading.Lock()
+        self.active = True
+        self.rendered = 0
+        self.dropped = 0
+
+    def submit(self, frame, now=None):
+        """Called from the capture thread with every frame; returns True if it will be shown"""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            if not self.active or self._pending or now < self._next_due:
+                self.dropped += 1
+                return False
+            # The buffers are ours until _flush clears the flag
+            self._pending = True
+            self._next_due = now + self.interval
+
+        cv2.resize(frame, self.size, dst=self._small, interpolation=cv2.INTER_AREA)
+        cv2.cvtColor(self._small, cv2.COLOR_BGR2RGB, dst=self._rgb)
+        self.label.after(0, self._flush)
+        return True
+
+    def _flush(self):
+        # Tk thread
+        try:
+            if not self.active:
+                return
+            # Wraps the buffer without copying; paste copies it into Tk
+            image = Image.frombuffer("RGB", self.size, self._rgb, "raw", "RGB", 0, 1)
+            if self._photo is None:
+                self._photo = ImageTk.PhotoImage(image=image)
+                self.label.imgtk = self._photo
+                self.label.configure(image=self._photo)
+            else:
+                self._photo.paste(image)
+            self.rendered += 1
+        except Exception as e:
+            print(f"Error updating frame: {e}")
+        finally:
+            with self._lock:
+                self._pending = False
+
+    def stop(self):
+        with self._lock:
+            self.active = False
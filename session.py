@@ -0,0 +1,163 @@
+import threading
+from collections import deque
+from datetime import datetime
+from conversationContext import BUDGET_TOKENS, ConversationContext
+from ollamaHelper import (combined_responder, image_responder, init_responder, responder, stream_responder,
+                          summarize_history)
+from threatHelper import ThreatAssessment, init_threat_responder, threat_responder
+from threatTriage import ThreatTriage
+from ticketStore import get_store
+from transcriptionService import get_service
+from whisperHelper import DEFAULT_MODEL, get_model
+
+
+class CallSession:
+    """
+    Everything that belongs to one call: responder and threat histories, the
+    ticket, and handles to the shared models. The responder history is kept
+    within a token budget by its ConversationContext, and both histories are
+    hard-capped at `max_messages` so a long call can't grow memory without bound.
+    """
+
+    def __init__(self, call_id=None, mode="audio", whisper_size=DEFAULT_MODEL,
+                 max_messages=200, max_ticket_entries=500, context_tokens=BUDGET_TOKENS, keep_turns=6,
+                 keep_images=0, triage=True):
+        self.call_id = call_id or datetime.now().strftime("%Y%m%d%H%M%S%f")[:17]
+        self.mode = mode
+        self.whisper_size = whisper_size
+        self.max_messages = max_messages
+        # Raw frames kept in history; older ones are replaced by their captions
+        self.keep_images = keep_images
+        self.started_at = datetime.now()
+        self.messages = []
+        # Held for every change to `messages`: the vision worker and the responder share it
+        self.lock = threading.Lock()
+        # Frames still in `messages` as raw images, with their replies
+        self.frames = []
+        self.threat_conversation = []
+        # Local pre-triage decides which utterances the threat model actually sees
+        self.triage = ThreatTriage() if triage else None
+        self.urgency = None
+        self.context = ConversationContext(summarize_history, budget_tokens=context_tokens, keep_turns=keep_turns)
+        # Recent entries only; the full ticket lives in the ticket store
+        self.ticket = deque(maxlen=max_ticket_entries)
+        # Called with every stored ticket record, e.g. to stream it to a remote client
+        self.ticket_listeners = []
+        # Script -> language for replies whose script alone doesn't decide it
+        self.language_cache = {}
+        self.active = True
+
+    @property
+    def whisper_model(self):
+        # Shared registry instance; sessions never load their own copy
+        return get_model(self.whisper_size)
+
+    @property
+    def transcription(self):
+        # Shared inference thread that batches this call's decodes with other calls'
+        return get_service(self.whisper_size)
+
+    def _trim(self, history):
+        with self.lock:
+            excess = len(history) - self.max_messages
+            if excess > 0:
+                del history[:excess]
+
+    def start(self, shouldPrint=True):
+        """Start a fresh threat conversation and return the greeting; the models are kept warm by ollamaClient"""
+        init_threat_responder(self.threat_conversation)
+        return init_responder(shouldPrint)
+
+    def respond(self, text, shouldPrint=True):
+        val = responder(text, shouldPrint, history=self.messages, context=self.context, lock=self.lock)
+        self._trim(self.messages)
+        return val
+
+    def stream_respond(self, text, shouldPrint=True):
+        val = yield from stream_responder(text, shouldPrint, history=self.messages, context=self.context,
+                                          lock=self.lock)
+        self._trim(self.messages)
+        return val
+
+    def combined_respond(self, text, shouldPrint=True):
+        """Reply and threat assessment from one request; returns (val, threat)"""
+        val, threat = yield from combined_responder(text, shouldPrint, history=self.messages, context=self.context,
+                                                    lock=self.lock)
+        self._trim(self.messages)
+        return val, threat
+
+    async def describe_images(self, images, shouldPrint=True):
+        response = await image_responder(images, shouldPrint, history=self.messages, context=self.context,
+                                          keep_images=self.keep_images, lock=self.lock, frames=self.frames)
+        self._trim(self.messages)
+        return response
+
+    async def score_threat(self, text):
+        """[True, ThreatAssessment] to record on the ticket, or [False] when there is nothing to record"""
+        if self.triage is not None:
+            result = self.triage.assess(text)
+            self.urgency = result.urgency
+            if result.reason is None:
+                # The threat model still sees this utterance the next time it is asked
+                self.threat_conversation.append({'role': 'user', 'content': text})
+                self._trim(self.threat_conversation)
+                if result.level == "routine":
+                    # "Hello?", "Okay." and the like don't belong on the ticket
+                    return [False]
+                matched = f"; matched {', '.join(result.matches)}" if result.matches else ""
+                # Provisional score on the threat model's 1-10 scale
+                score = min(10, max(1, round(result.urgency * 10)))
+                return [True, ThreatAssessment(score, None, f"urgency {result.urgency:.2f} ({result.level}{matched}); "
+                                                            "threat model not consulted", "triage")]
+        threat = await threat_responder(text, self.threat_conversation)
+        self._trim(self.threat_conversation)
+        return threat
+
+    def record_ticket(self, entry):
+        """Persist a ticket entry for this call"""
+        record = get_store().append(self.call_id, entry)
+        self.ticket.append(record)
+        for listener in list(self.ticket_listeners):
+            listener(record)
+        return record
+
+    def close(self):
+        self.active = False
+
+
+class SessionManager:
+    """Hosts many concurrent calls in one process, up to `max_sessions`"""
+
+    def __init__(self, max_sessions=32):
+        self.max_sessions = max_sessions
+        self._sessions = {}
+        self._lock = threading.Lock()
+
+    def create(self, mode="audio", **kwargs):
+        with self._lock:
+            if len(self._sessions) >= self.max_sessions:
+                raise RuntimeError(f"Too many concurrent calls ({self.max_sessions})")
+            session = CallSession(mode=mode, **kwargs)
+            # Two calls started within the same 10 microseconds would share an id
+            while session.call_id in self._sessions:
+                session.call_id += "_"
+            self._sessions[session.call_id] = session
+            return session
+
+    def get(self, call_id):
+        with self._lock:
+            return self._sessions.get(call_id)
+
+    def end(self, call_id):
+        with self._lock:
+            session = self._sessions.pop(call_id, None)
+        if session:
+            session.close()
+        return session
+
+    def active(self):
+        with self._lock:
+            return list(self._sessions.values())
+
+
+sessions = SessionManager()
@@ -1,9 +1,63 @@
-from langdetect import detect
+import numpy as np
+from langdetect import DetectorFactory, detect
+from langdetect.detector_factory import init_factory
 from transliterate import translit
 from indic_transliteration import sanscript
 from indic_transliteration.sanscript import transliterate as indic_translit
 import unidecode
 from pypinyin import lazy_pinyin
+from tracing import span
+
+# langdetect is random unless seeded
+DetectorFactory.seed = 0
+
+# (first code point, last code point, script), sorted and non-overlapping.
+# Digits, spaces and punctuation are in no block and are ignored.
+_SCRIPT_BLOCKS = [
+    (0x0041, 0x005A, 'Latin'), (0x0061, 0x007A, 'Latin'), (0x00C0, 0x024F, 'Latin'),
+    (0x0370, 0x03FF, 'Greek'), (0x0400, 0x052F, 'Cyrillic'),
+    (0x0600, 0x06FF, 'Arabic'), (0x0750, 0x077F, 'Arabic'), (0x08A0, 0x08FF, 'Arabic'),
+    (0x0900, 0x097F, 'Devanagari'), (0x0980, 0x09FF, 'Bengali'), (0x0A00, 0x0A7F, 'Gurmukhi'),
+    (0x0A80, 0x0AFF, 'Gujarati'), (0x0B00, 0x0B7F, 'Oriya'), (0x0B80, 0x0BFF, 'Tamil'),
+    (0x0C00, 0x0C7F, 'Telugu'), (0x0C80, 0x0CFF, 'Kannada'), (0x0D00, 0x0D7F, 'Malayalam'),
+    (0x0F00, 0x0FFF, 'Tibetan'), (0x10A0, 0x10FF, 'Georgian'), (0x1100, 0x11FF, 'Hangul'),
+    (0x1E00, 0x1EFF, 'Latin'), (0x1F00, 0x1FFF, 'Greek'), (0x3040, 0x30FF, 'Kana'),
+    (0x3130, 0x318F, 'Hangul'), (0x3400, 0x4DBF, 'Han'), (0x4E00, 0x9FFF, 'Han'),
+    (0xAC00, 0xD7AF, 'Hangul'), (0xFB50, 0xFDFF, 'Arabic'), (0xFE70, 0xFEFF, 'Arabic'),
+]
+_SCRIPTS = sorted({script for _, _, script in _SCRIPT_BLOCKS})
+_BLOCK_STARTS = np.array([start for start, _, _ in _SCRIPT_BLOCKS], dtype=np.uint32)
+_BLOCK_ENDS = np.array([end for _, end, _ in _SCRIPT_BLOCKS], dtype=np.uint32)
+_BLOCK_SCRIPT = np.array([_SCRIPTS.index(script) for _, _, script in _SCRIPT_BLOCKS])
+
+# Scripts that pick a transliteration branch on their own
+SCRIPT_LANGUAGES = {
+    'Greek': 'el', 'Devanagari': 'hi', 'Bengali': 'bn', 'Gurmukhi': 'pa', 'Gujarati': 'gu',
+    'Oriya': 'or', 'Tamil': 'ta', 'Telugu': 'te', 'Kannada': 'kn', 'Malayalam': 'ml',
+    'Tibetan': 'bo', 'Georgian': 'ka', 'Hangul': 'ko', 'Kana': 'ja',
+}
+# Scripts shared by several languages: langdetect decides, limited to these, else the first
+AMBIGUOUS_SCRIPTS = {
+    'Cyrillic': ['ru', 'uk', 'bg', 'sr', 'mk', 'ky', 'kk', 'uz'],
+    'Arabic': ['ar', 'fa', 'ur', 'ps'],
+    'Han': ['zh-cn', 'zh-tw', 'ja', 'ko'],
+}
+# Below this share of letters the text is mixed-script and goes to langdetect
+DOMINANT_SHARE = 0.6
+
+def detect_script(text):
+    """
+    Dominant script of `text` and the share of its letters in that script,
+    from a vectorized Unicode-block histogram. (None, 0.0) if it has no letters.
+    """
+    codepoints = np.frombuffer(text.encode('utf-32-le'), dtype='<u4')
+    block = np.searchsorted(_BLOCK_STARTS, codepoints, side='right') - 1
+    inside = (block >= 0) & (codepoints <= _BLOCK_ENDS[np.maximum(block, 0)])
+    if not inside.any():
+        return None, 0.0
+    counts = np.bincount(_BLOCK_SCRIPT[block[inside]], minlength=len(_SCRIPTS))
+    best = int(counts.argmax())
+    return _SCRIPTS[best], counts[best] / counts.sum()
 
 def detect_language(text):
     try:
@@ -11,157 +65,200 @@ def detect_language(text):
     except:
         return None
 
-def transliterate_text(text):
+def warm_language_detection():
+    """Load langdetect's profiles now rather than on the first ambiguous reply"""
+    init_factory()
+
+def script_language(text, cache=None):
     """
-    Transliterates text based on the detected language.
+    Language code that selects the transliteration branch for `text`, or None
+    for Latin text (which needs none). langdetect only runs for mixed or
+    ambiguous scripts, and `cache` (one dict per call) remembers its answer
+    per script so it runs at most once per call.
     """
+    script, share = detect_script(text)
+    if script is None or (script == 'Latin' and share >= DOMINANT_SHARE):
+        return None
+    if share >= DOMINANT_SHARE and script in SCRIPT_LANGUAGES:
+        return SCRIPT_LANGUAGES[script]
+
+    key = script if share >= DOMINANT_SHARE else None
+    if cache is not None and key in cache:
+        return cache[key]
     language = detect_language(text)
-    # Cyrillic scripts
-    if language in ['ru', 'uk', 'bg', 'sr', 'mk', 'ky', 'kk', 'uz']:
-        return translit(text, 'ru', reversed=True)
-    
-    # Arabic script
-    elif language in ['ar', 'fa', 'ur', 'ps']:
-        transliteration_map = {
-            # Basic letters
-            'ا': 'ā', 'ب': 'b', 'ت': 't', 'ث': 'th',
-            'ج': 'j', 'ح': 'ḥ', 'خ': 'kh', 'د': 'd',
-            'ذ': 'dh', 'ر': 'r', 'ز': 'z', 'س': 's',
-            'ش': 'sh', 'ص': 'ṣ', 'ض': 'ḍ', 'ط': 'ṭ',
-            'ظ': 'ẓ', 'ع': 'ʿ', 'غ': 'gh', 'ف': 'f',
-            'ق': 'q', 'ك': 'k', 'ل': 'l', 'م': 'm',
-            'ن': 'n', 'ه': 'h', 'و': 'w', 'ي': 'y',
-            
-            # Vowel marks
-            'َ': 'a', 'ِ': 'i', 'ُ': 'u',
-            'ً': 'an', 'ٍ': 'in', 'ٌ': 'un',
-            'ْ': '', 'ّ': '',  
-            
-            # Special combinations
-            'آ': 'ʾā', 'ة': 'h', 'ى': 'á',
-            'ئ': 'ʾ', 'ؤ': 'ʾ', 'إ': 'ʾi',
-            'أ': 'ʾa',
-            
-            # Dialectal variations
-            'چ': 'ch', 'پ': 'p', 'ڤ': 'v',
-            'گ': 'g', 'ژ': 'zh'
-        }
-        
-        transliterated_text = ''.join(transliteration_map.get(char, char) for char in text)
-        return transliterated_text
-
-
-    # Devanagari script
-    elif language in ['hi', 'mr', 'ne', 'sd']:
-        return indic_translit(text, sanscript.DEVANAGARI, sanscript.ITRANS)
-
-    # Bengali script
-    elif language == 'bn':
-        return indic_translit(text, sanscript.BENGALI, sanscript.ITRANS)
-
-    # Tamil script
-    elif language == 'ta':
-        consonants = {
-            'க': 'ka', 'ங': 'nga', 'ச': 'cha', 'ஞ': 'nja',
-            'ட': 'ta', 'ண': 'na', 'த': 'tha', 'ந': 'na',
-            'ப': 'pa', 'ம': 'ma', 'ய': 'ya', 'ர': 'ra',
-            'ல': 'la', 'வ': 'va', 'ழ': 'zha', 'ள': 'la',
-            'ற': 'ra', 'ன': 'na'
-        }
-
-        consonant_vowel_markers = {
-            'க': 'k', 'ங': 'ng', 'ச': 'ch', 'ஞ': 'nj',
-            'ட': 't', 'ண': 'n', 'த': 'th', 'ந': 'n',
-            'ப': 'p', 'ம': 'm', 'ய': 'y', 'ர': 'r',
-            'ல': 'l', 'வ': 'v', 'ழ': 'zh', 'ள': 'l',
-            'ற': 'tr', 'ன': 'n'
-        }
-
-        vowels = {
-            'அ': 'a', 'ஆ': 'aa', 'இ': 'i', 'ஈ': 'ii',
-            'உ': 'uu', 'ஊ': 'uu', 'எ': 'e', 'ஏ': 'e',
-            'ஐ': 'ai', 'ஒ': 'o', 'ஓ': 'oo', 'ஔ': 'au'
-        }
-
-        vowel_markers = {
-            'ா': 'a', 'ி': 'i', 'ீ': 'ii', 'ு': 'uu',
-            'ூ': 'uu', 'ெ': 'e', 'ே': 'e', 'ை': 'ai',
-            'ொ': 'o', 'ோ': 'o', 'ௌ': 'au', '்': ''
-        }
-
-        special = {
-            'ஃ': 'kh',
-        }
-
-        transliterated_text = ""
-        i = 0
-        while i < len(text):
-            char = text[i]
-            # Check if the character is a consonant
-            if char in consonants:
-                # If the consonant is followed by a vowel marker
-                if i + 1 < len(text) and text[i + 1] in vowel_markers:
-                    # Use the consonant_vowel_markers dictionary
-                    transliterated_text += consonant_vowel_markers[char]
-                    # Add the corresponding vowel sound
-                    transliterated_text += vowel_markers[text[i + 1]]
-                    # Skip the vowel marker in the next iteration
-                    i += 1
-                else:
-                    # Use the consonants dictionary if no vowel marker follows
-                    transliterated_text += consonants[char]
-
-            # Check if the character is a vowel
-            elif char in vowels:
-                transliterated_text += vowels[char]
-
-            # Handle special characters
-            elif char in special:
-                transliterated_text += special[char]
-
-            else:
-                # If character is not in any dictionary, add it as-is
-                transliterated_text += char
+    if key in AMBIGUOUS_SCRIPTS and language not in AMBIGUOUS_SCRIPTS[key]:
+        language = AMBIGUOUS_SCRIPTS[key][0]
+    if cache is not None and key is not None:
+        cache[key] = language
+    return language
+
+# Arabic script: one letter or mark -> Latin, applied with str.translate
+ARABIC_MAP = {
+    # Basic letters
+    'ا': 'ā', 'ب': 'b', 'ت': 't', 'ث': 'th',
+    'ج': 'j', 'ح': 'ḥ', 'خ': 'kh', 'د': 'd',
+    'ذ': 'dh', 'ر': 'r', 'ز': 'z', 'س': 's',
+    'ش': 'sh', 'ص': 'ṣ', 'ض': 'ḍ', 'ط': 'ṭ',
+    'ظ': 'ẓ', 'ع': 'ʿ', 'غ': 'gh', 'ف': 'f',
+    'ق': 'q', 'ك': 'k', 'ل': 'l', 'م': 'm',
+    'ن': 'n', 'ه': 'h', 'و': 'w', 'ي': 'y',
+
+    # Vowel marks
+    'َ': 'a', 'ِ': 'i', 'ُ': 'u',
+    'ً': 'an', 'ٍ': 'in', 'ٌ': 'un',
+    'ْ': '', 'ّ': '',
+
+    # Special combinations
+    'آ': 'ʾā', 'ة': 'h', 'ى': 'á',
+    'ئ': 'ʾ', 'ؤ': 'ʾ', 'إ': 'ʾi',
+    'أ': 'ʾa',
+
+    # Dialectal variations
+    'چ': 'ch', 'پ': 'p', 'ڤ': 'v',
+    'گ': 'g', 'ژ': 'zh'
+}
+
+# Tamil script: a consonant reads differently before a vowel marker
+TAMIL_CONSONANTS = {
+    'க': 'ka', 'ங': 'nga', 'ச': 'cha', 'ஞ': 'nja',
+    'ட': 'ta', 'ண': 'na', 'த': 'tha', 'ந': 'na',
+    'ப': 'pa', 'ம': 'ma', 'ய': 'ya', 'ர': 'ra',
+    'ல': 'la', 'வ': 'va', 'ழ': 'zha', 'ள': 'la',
+    'ற': 'ra', 'ன': 'na'
+}
+
+TAMIL_CONSONANT_STEMS = {
+    'க': 'k', 'ங': 'ng', 'ச': 'ch', 'ஞ': 'nj',
+    'ட': 't', 'ண': 'n', 'த': 'th', 'ந': 'n',
+    'ப': 'p', 'ம': 'm', 'ய': 'y', 'ர': 'r',
+    'ல': 'l', 'வ': 'v', 'ழ': 'zh', 'ள': 'l',
+    'ற': 'tr', 'ன': 'n'
+}
+
+TAMIL_VOWELS = {
+    'அ': 'a', 'ஆ': 'aa', 'இ': 'i', 'ஈ': 'ii',
+    'உ': 'uu', 'ஊ': 'uu', 'எ': 'e', 'ஏ': 'e',
+    'ஐ': 'ai', 'ஒ': 'o', 'ஓ': 'oo', 'ஔ': 'au'
+}
+
+TAMIL_VOWEL_MARKERS = {
+    'ா': 'a', 'ி': 'i', 'ீ': 'ii', 'ு': 'uu',
+    'ூ': 'uu', 'ெ': 'e', 'ே': 'e', 'ை': 'ai',
+    'ொ': 'o', 'ோ': 'o', 'ௌ': 'au', '்': ''
+}
 
+TAMIL_SPECIAL = {
+    'ஃ': 'kh',
+}
+
+
+class TableTransliterator:
+    """One character to one string, compiled into a str.translate table"""
+
+    def __init__(self, mapping):
+        self.table = str.maketrans(mapping)
+
+    def __call__(self, text):
+        return text.translate(self.table)
+
+
+class LongestMatchTransliterator:
+    """
+    One- and two-character rules (e.g. consonant + vowel marker) looked up
+    in one dict: each position tries the two-character key first, then the
+    single character. Characters no rule covers pass through unchanged.
+    """
+
+    def __init__(self, rules):
+        if max(map(len, rules)) > 2:
+            raise ValueError("Transliteration rules are at most two characters")
+        self.rules = rules
+
+    def __call__(self, text):
+        get = self.rules.get
+        out = []
+        i, n = 0, len(text)
+        while i < n:
+            converted = get(text[i:i + 2])
+            if converted is not None:
+                out.append(converted)
+                i += 2
+                continue
+            char = text[i]
+            out.append(get(char, char))
             i += 1
+        return ''.join(out)
 
-        return transliterated_text
 
-    # Telugu script
-    elif language == 'te':
-        return indic_translit(text, sanscript.TELUGU, sanscript.ITRANS)
+def _tamil_rules():
+    rules = dict(TAMIL_CONSONANTS)
+    rules.update(TAMIL_VOWELS)
+    rules.update(TAMIL_SPECIAL)
+    for consonant, stem in TAMIL_CONSONANT_STEMS.items():
+        for marker, vowel in TAMIL_VOWEL_MARKERS.items():
+            rules[consonant + marker] = stem + vowel
+    return rules
 
-    # Kannada script
-    elif language == 'kn':
-        return indic_translit(text, sanscript.KANNADA, sanscript.ITRANS)
 
-    # Malayalam script
-    elif language == 'ml':
-        return indic_translit(text, sanscript.MALAYALAM, sanscript.ITRANS)
+transliterate_arabic = TableTransliterator(ARABIC_MAP)
+transliterate_tamil = LongestMatchTransliterator(_tamil_rules())
 
-    # Gujarati script
-    elif language == 'gu':
-        return indic_translit(text, sanscript.GUJARATI, sanscript.ITRANS)
 
-    # Odia script
-    elif language == 'or':
-        return indic_translit(text, sanscript.ORIYA, sanscript.ITRANS)
+def _indic(scheme):
+    return lambda text: indic_translit(text, scheme, sanscript.ITRANS)
 
-    # Chinese script (Pinyin)
-    elif language in ['zh-cn', 'zh-tw']:
-        return ' '.join(lazy_pinyin(text))
 
-    # Greek script
-    elif language == 'el':
-        return unidecode.unidecode(text)
+# Language code -> transliterator, built once at import
+TRANSLITERATORS = {}
+TRANSLITERATORS.update(dict.fromkeys(['ru', 'uk', 'bg', 'sr', 'mk', 'ky', 'kk', 'uz'],
+                                     lambda text: translit(text, 'ru', reversed=True)))
+TRANSLITERATORS.update(dict.fromkeys(['ar', 'fa', 'ur', 'ps'], transliterate_arabic))
+TRANSLITERATORS.update(dict.fromkeys(['hi', 'mr', 'ne', 'sd'], _indic(sanscript.DEVANAGARI)))
+TRANSLITERATORS.update({
+    'bn': _indic(sanscript.BENGALI),
+    'ta': transliterate_tamil,
+    'te': _indic(sanscript.TELUGU),
+    'kn': _indic(sanscript.KANNADA),
+    'ml': _indic(sanscript.MALAYALAM),
+    'gu': _indic(sanscript.GUJARATI),
+    'or': _indic(sanscript.ORIYA),
+})
+TRANSLITERATORS.update(dict.fromkeys(['zh-cn', 'zh-tw'], lambda text: ' '.join(lazy_pinyin(text))))
+# Greek, Tibetan, Georgian and everything else go through unidecode
 
-    # Tibetan script
-    elif language == 'bo':
-        return unidecode.unidecode(text)
 
-    # Georgian script
-    elif language == 'ka':
-        return unidecode.unidecode(text)
+def transliterate_text(text, cache=None):
+    """
+    Transliterates text based on the detected language.
+    """
+    with span("transliterate", chars=len(text)) as active:
+        language = script_language(text, cache)
+        if active is not None:
+            active.set(language=language)
+        return TRANSLITERATORS.get(language, unidecode.unidecode)(text)
+
+
+def transliterate_many(texts, cache=None):
+    """
+    Transliterates a batch of texts, sharing one language cache across them.
+    Texts handled by the compiled transliterators are joined per language
+    and converted in a single pass.
+    """
+    cache = {} if cache is None else cache
+    groups = {}
+    for index, text in enumerate(texts):
+        groups.setdefault(script_language(text, cache), []).append(index)
 
-    # Fallback for other scripts
-    return unidecode.unidecode(text)
\ No newline at end of file
+    results = [None] * len(texts)
+    for language, indexes in groups.items():
+        convert = TRANSLITERATORS.get(language, unidecode.unidecode)
+        batch = [texts[i] for i in indexes]
+        # Compiled transliterators work per character and never touch '\0'
+        if isinstance(convert, (TableTransliterator, LongestMatchTransliterator)) and \
+                not any('\0' in text for text in batch):
+            converted = convert('\0'.join(batch)).split('\0')
+        else:
+            converted = [convert(text) for text in batch]
+        for index, text in zip(indexes, converted):
+            results[index] = text
+    return results
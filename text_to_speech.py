@@ -1,26 +1,189 @@
-# Import the required module for text 
+# Import the required module for text
 # to speech conversion
 from gtts import gTTS
 
-# This module is imported so that we can 
+# These modules are imported so that we can
 # play the converted audio
+import hashlib
+import io
 import os
+import subprocess
+import tempfile
+import threading
+from collections import OrderedDict
+from tracing import count, span
 
-# # The text that you want to convert to audio
-# mytext = 'En veetla thirudan vandhuttan!'
-def text_to_speech(mytext):
-    # Language in which you want to convert
-    language = 'en'
+# Language in which you want to convert
+DEFAULT_LANGUAGE = 'en'
+# gTTS picks the accent from the Google Translate domain
+DEFAULT_VOICE = 'com'
 
-    # Passing the text and language to the engine, 
-    # here we have marked slow=False. Which tells 
-    # the module that the converted audio should 
+# Short replies worth having ready before the first call comes in
+COMMON_PHRASES = [
+    "Okay.",
+    "I understand.",
+    "Help is on the way.",
+    "Please stay on the line.",
+    "Can you tell me your location?",
+    "Is anyone injured?",
+    "Are you in a safe place right now?",
+    "Please stay calm.",
+]
+
+
+class SynthesisCache:
+    """
+    Bounded LRU of synthesized mp3 bytes keyed by (text, language, voice).
+    With `cache_dir` set, entries are also written to disk and survive restarts.
+    """
+
+    def __init__(self, max_entries=256, max_bytes=32 * 1024 * 1024, cache_dir=None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.cache_dir = cache_dir
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+
+    def _path(self, key):
+        digest = hashlib.sha1("\0".join(key).encode("utf-8")).hexdigest()
+        return os.path.join(self.cache_dir, digest + ".mp3")
+
+    def get(self, key):
+        with self._lock:
+            data = self._entries.get(key)
+            if data is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return data
+
+        if self.cache_dir and os.path.exists(self._path(key)):
+            with open(self._path(key), "rb") as f:
+                data = f.read()
+            self._remember(key, data)
+            with self._lock:
+                self.disk_hits += 1
+            return data
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, key, data):
+        self._remember(key, data)
+        if self.cache_dir:
+            # Write then rename so a concurrent reader never sees a partial file
+            path = self._path(key)
+            fd, tmp = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp, path)
+
+    def _remember(self, key, data):
+        with self._lock:
+            if key in self._entries:
+                self._bytes -= len(self._entries.pop(key))
+            self._entries[key] = data
+            self._bytes += len(data)
+            while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= len(evicted)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.disk_hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": (self.hits + self.disk_hits) / lookups if lookups else 0.0,
+            }
+
+
+_cache = SynthesisCache(cache_dir=os.environ.get("TTS_CACHE_DIR"))
+
+
+def gtts_engine(mytext, language=DEFAULT_LANGUAGE, voice=DEFAULT_VOICE):
+    # Passing the text and language to the engine,
+    # here we have marked slow=False. Which tells
+    # the module that the converted audio should
     # have a high speed
-    myobj = gTTS(text=mytext, lang=language, slow=False)
+    myobj = gTTS(text=mytext, lang=language, tld=voice, slow=False)
+    buffer = io.BytesIO()
+    myobj.write_to_fp(buffer)
+    return buffer.getvalue()
+
+
+def afplay_sink(data):
+    # Each reply gets its own file so concurrent calls don't overwrite each other
+    fd, path = tempfile.mkstemp(suffix=".mp3")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        # # Playing the converted file
+        subprocess.run(["afplay", path], check=False)
+    finally:
+        os.remove(path)
+
+
+def null_sink(data):
+    """Discards the audio; for headless runs and benchmarks"""
+
+
+_engine = gtts_engine
+_sink = null_sink if os.environ.get("TTS_AUDIO_SINK") == "null" else afplay_sink
+
+
+def set_engine(engine):
+    """`engine(text, language, voice)` returns mp3 bytes; None restores gTTS"""
+    global _engine
+    _engine = engine or gtts_engine
+
+
+def set_audio_sink(sink):
+    """`sink(mp3_bytes)` plays the audio; None restores afplay"""
+    global _sink
+    _sink = sink or afplay_sink
+
+
+def synthesize(mytext, language=DEFAULT_LANGUAGE, voice=DEFAULT_VOICE):
+    """Return mp3 bytes for `mytext`, from the cache when possible"""
+    key = (mytext, language, voice)
+    data = _cache.get(key)
+    if data is None:
+        count("tts.cache_misses")
+        with span("tts.synthesize", chars=len(mytext)):
+            data = _engine(mytext, language, voice)
+        _cache.put(key, data)
+    else:
+        count("tts.cache_hits")
+    return data
+
+
+def play_audio(data):
+    with span("tts.play", bytes=len(data)):
+        _sink(data)
+
+
+def text_to_speech(mytext, language=DEFAULT_LANGUAGE, voice=DEFAULT_VOICE):
+    play_audio(synthesize(mytext, language, voice))
+
+
+def presynthesize(phrases=None, language=DEFAULT_LANGUAGE, voice=DEFAULT_VOICE):
+    """Fill the cache at startup so these phrases play without synthesis latency"""
+    for phrase in phrases or COMMON_PHRASES:
+        try:
+            synthesize(phrase, language, voice)
+        except Exception as e:
+            print(f"Error pre-synthesizing '{phrase}': {e}")
 
-    # Saving the converted audio in a mp3 file named
-    # welcome 
-    myobj.save("welcome.mp3")
 
-    # # Playing the converted file
-    os.system("afplay welcome.mp3")
+def cache_stats():
+    return _cache.stats()
@@ -1,42 +1,110 @@
-import asyncio
-import ollama
+from ollamaClient import achat
+from collections import namedtuple
 from queue import Queue
 import json
+import re
 
+# Default history for single-call scripts; concurrent calls pass their CallSession's list
 threat_conversation = []
 
-def init_threat_responder():
-    # Initialize threat monitor with START marker
-    threat_conversation = []
-    ollama.chat(
-        model="threat",
-        messages=[{
-            'role': 'user',
-            'content': ""
-        }]
-    )
+THREAT_CATEGORIES = ["medical", "fire", "violence", "crime", "accident", "hazard", "mental_health", "other", "none"]
+# Longest rationale kept on a ticket, in characters
+RATIONALE_CHARS = 240
+# Generation cap for one assessment: the JSON object plus a one-sentence rationale
+THREAT_NUM_PREDICT = 96
+THREAT_FORMAT = {
+    "type": "object",
+    "properties": {
+        "score": {"type": "integer", "minimum": 1, "maximum": 10},
+        "category": {"type": "string", "enum": THREAT_CATEGORIES},
+        "rationale": {"type": "string", "maxLength": RATIONALE_CHARS},
+        # The threat model may end a chat it judges unsafe to continue
+        "end_call": {"type": "boolean"},
+    },
+    "required": ["score", "category", "rationale", "end_call"],
+}
+THREAT_OPTIONS = {"num_predict": THREAT_NUM_PREDICT}
+
+# score is 1-10 or None if the output had none; source is "model", "combined" or "triage";
+# end_call is True when the threat model asks for the call to be ended
+ThreatAssessment = namedtuple("ThreatAssessment", ["score", "category", "rationale", "source", "end_call"],
+                              defaults=[False])
+
+# Salvages the score from output that num_predict cut off mid-object
+_SCORE = re.compile(r'"(?:score|threat_score)"\s*:\s*(\d+)')
+
+
+def _score(value):
+    try:
+        score = int(value)
+    except (TypeError, ValueError):
+        return None
+    return score if 1 <= score <= 10 else None
+
+
+def parse_threat(content, source="model"):
+    """
+    ThreatAssessment from the threat model's JSON output. Out-of-range scores
+    become None, unknown categories "other", and the rationale is capped at
+    RATIONALE_CHARS. Truncated output keeps whatever score can be recovered
+    and the raw text as rationale.
+    """
+    try:
+        result = json.loads(content)
+        if not isinstance(result, dict):
+            raise ValueError("not an object")
+    except ValueError:
+        match = _SCORE.search(content)
+        return ThreatAssessment(_score(match.group(1)) if match else None, None,
+                                content.strip()[:RATIONALE_CHARS], source)
+    category = result.get("category")
+    if category not in THREAT_CATEGORIES:
+        category = "other" if category else None
+    rationale = str(result.get("rationale", result.get("assessment", ""))).strip()
+    return ThreatAssessment(_score(result.get("score", result.get("threat_score"))), category,
+                            rationale[:RATIONALE_CHARS], source, result.get("end_call") is True)
 
-async def threat_responder(user_input):
-    await asyncio.sleep(1)
+
+def ticket_fields(assessment):
+    """Ticket entry fields for an assessment; `details` keeps the dispatch tooling's key"""
+    return {
+        "threat_score": assessment.score,
+        "category": assessment.category,
+        "source": assessment.source,
+        "details": assessment.rationale,
+    }
+
+
+def init_threat_responder(conversation=None):
+    # The model itself is loaded and kept resident by ollamaClient.warmup() at startup
+    if conversation is None:
+        conversation = threat_conversation
+    conversation.clear()
+
+async def threat_responder(user_input, conversation=None):
+    if conversation is None:
+        conversation = threat_conversation
     # Add caller's input to both conversations
-    threat_conversation.append({
+    conversation.append({
         'role': 'user',
-        'content': user_input 
+        'content': user_input
     })
-    
+
     # Send complete conversation update to threat detector
-    threat_response = ollama.chat(
+    # Async request on the call's event loop, so the responder proceeds in parallel.
+    # The schema and num_predict keep each answer to a short, parseable object.
+    threat_response = await achat(
         model="threat",
-        messages=threat_conversation
+        messages=conversation,
+        format=THREAT_FORMAT,
+        options=THREAT_OPTIONS,
     )
-    
+    content = threat_response['message']['content']
+
     # Format the conversation for threat monitoring
-    threat_conversation.append(threat_response)
-    
-    # print("Threat Response:", threat_response['message']['content'], end="", flush=True)
-
-    if "**END CALL**" in threat_response['message']['content']:
-        threat_response_sent = [False]
-        return threat_response_sent
-    threat_response_sent = [True, threat_response['message']['content']]
-    return threat_response_sent
\ No newline at end of file
+    conversation.append({'role': 'assistant', 'content': content})
+
+    # print("Threat Response:", content, end="", flush=True)
+
+    # Ending the call is the assessment's end_call field; the schema leaves no room for a marker
+    return [True, parse_threat(content)]
@@ -0,0 +1,172 @@
+import os
+import re
+import threading
+from collections import namedtuple
+from tracing import span
+
+# level is "urgent", "elevated" or "routine"; reason says why the threat model
+# should run ("ambiguous", "escalating", "context", "periodic") or is None to skip it
+TriageResult = namedtuple("TriageResult", ["urgency", "level", "matches", "reason"])
+
+URGENT_PHRASES = [
+    "gun", "guns", "shot", "shots", "shooting", "shooter", "knife", "stabbed", "stabbing", "weapon",
+    "kill", "killing", "killed", "murder", "hostage", "kidnapped", "kidnapping", "bomb", "explosion",
+    "fire", "on fire", "burning", "smoke", "bleeding", "blood", "not breathing", "can't breathe",
+    "cannot breathe", "unconscious", "unresponsive", "overdose", "overdosed", "heart attack", "stroke",
+    "seizure", "choking", "drowning", "suicide", "kill myself", "attacking", "attacked", "beating me",
+    "hitting me", "raped", "break in", "breaking in", "broke in", "intruder", "help me", "dying",
+    "collapsed", "passed out", "turning blue", "too many pills", "can't wake", "won't wake", "armed",
+    "gunshot", "strangling", "trapped",
+]
+ELEVATED_PHRASES = [
+    "hurt", "injured", "injury", "pain", "chest pain", "accident", "crash", "fell", "fall", "threatening",
+    "threatened", "following me", "stalking", "scared", "afraid", "fight", "fighting", "yelling",
+    "screaming", "drunk", "missing", "lost", "gas leak", "smell gas", "dizzy", "fainted", "emergency",
+    "help", "hurry", "breathing", "pills", "hiding", "banging", "leaking", "confused", "drinking",
+]
+ROUTINE_PHRASES = [
+    "hello", "hi", "hey", "can you hear me", "are you there", "yes", "yeah", "no", "okay", "ok",
+    "thank you", "thanks", "sorry", "what", "i don't know", "one second", "hold on", "bye", "goodbye",
+]
+NEGATIONS = {"no", "not", "nobody", "none", "never", "without", "isn't", "aren't", "wasn't", "don't",
+             "doesn't", "didn't"}
+
+URGENT_SCORE = 0.9
+ELEVATED_SCORE = 0.6
+NEGATED_SCORE = 0.5
+UNMATCHED_SCORE = 0.2
+ROUTINE_SCORE = 0.05
+
+
+def _compile(phrases):
+    # Longest first so "kill myself" wins over "kill"; spaces also match runs of whitespace
+    ordered = sorted(phrases, key=len, reverse=True)
+    return re.compile(r"\b(?:" + "|".join(re.escape(p).replace(r"\ ", r"\s+") for p in ordered) + r")\b",
+                      re.IGNORECASE)
+
+
+_URGENT = _compile(URGENT_PHRASES)
+_ELEVATED = _compile(ELEVATED_PHRASES)
+_ROUTINE = re.compile(r"^(?:\W*(?:" + "|".join(map(re.escape, ROUTINE_PHRASES)) + r")\b)+\W*$", re.IGNORECASE)
+_WORDS = re.compile(r"[\w']+")
+
+
+def _negated(text, start, window=5):
+    preceding = _WORDS.findall(text[:start].lower())[-window:]
+    return any(word in NEGATIONS for word in preceding)
+
+
+def keyword_score(text):
+    """(urgency, matched phrases) from the phrase lists alone"""
+    if _ROUTINE.match(text):
+        return ROUTINE_SCORE, []
+    matches, negated = [], False
+    score = UNMATCHED_SCORE
+    for pattern, weight in ((_URGENT, URGENT_SCORE), (_ELEVATED, ELEVATED_SCORE)):
+        for match in pattern.finditer(text):
+            if _negated(text, match.start()):
+                negated = True
+                continue
+            matches.append(match.group().lower())
+            score = max(score, weight)
+    if negated and score < NEGATED_SCORE:
+        # "nobody is hurt" needs a reader, not a keyword list
+        score = NEGATED_SCORE
+    return score, matches
+
+
+# Model id or path -> loaded classifier
+_classifiers = {}
+_classifier_lock = threading.Lock()
+
+
+def get_classifier(model=None):
+    """
+    Optional small transformers text classifier, loaded once per model on CPU from
+    `model` or THREAT_CLASSIFIER (a model id or path). None when unset or transformers
+    isn't installed.
+    """
+    model = model or os.environ.get("THREAT_CLASSIFIER")
+    if not model:
+        return None
+    with _classifier_lock:
+        if model not in _classifiers:
+            try:
+                from transformers import pipeline
+            except ImportError:
+                return None
+            _classifiers[model] = pipeline("text-classification", model=model, device=-1)
+        return _classifiers[model]
+
+
+def classifier_score(text, classifier, urgent_label=None):
+    """Probability of the urgent label; THREAT_CLASSIFIER_LABEL names it (default "urgent")"""
+    urgent_label = (urgent_label or os.environ.get("THREAT_CLASSIFIER_LABEL", "urgent")).lower()
+    result = classifier(text, truncation=True)[0]
+    return result["score"] if result["label"].lower() == urgent_label else 1.0 - result["score"]
+
+
+class ThreatTriage:
+    """
+    Per-call pre-triage in front of the LLM threat model. Every utterance gets
+    an immediate provisional urgency in [0, 1] from the phrase matcher (and
+    the classifier, if configured). The threat model is only asked when the
+    score falls in the ambiguous band [low, high), jumps by `escalation` or
+    more, or `rescore_every` utterances have gone by without it. Once the call
+    has been urgent, anything the matcher can't place goes to the threat model
+    too: "he's coming up the stairs" only reads as a threat in context.
+    """
+
+    def __init__(self, low=0.25, high=0.8, escalation=0.3, rescore_every=4, classifier=None):
+        self.low = low
+        self.high = high
+        self.escalation = escalation
+        self.rescore_every = rescore_every
+        self.classifier = classifier if classifier is not None else get_classifier()
+        self.last_urgency = 0.0
+        self.peak_urgency = 0.0
+        self.since_llm = 0
+        self.assessed = 0
+        self.llm_calls = 0
+
+    def score(self, text):
+        urgency, matches = keyword_score(text)
+        if self.classifier is not None and not matches and urgency != ROUTINE_SCORE:
+            # Matched phrases are decisive; the classifier refines everything else
+            urgency = classifier_score(text, self.classifier)
+        return urgency, matches
+
+    def assess(self, text):
+        with span("threat.triage"):
+            urgency, matches = self.score(text)
+        level = "urgent" if urgency >= self.high else "elevated" if urgency >= self.low else "routine"
+
+        if self.low <= urgency < self.high:
+            reason = "ambiguous"
+        elif urgency - self.last_urgency >= self.escalation:
+            reason = "escalating"
+        elif self.peak_urgency >= self.high and not matches and urgency > ROUTINE_SCORE:
+            reason = "context"
+        elif self.since_llm + 1 >= self.rescore_every:
+            reason = "periodic"
+        else:
+            reason = None
+
+        self.assessed += 1
+        self.last_urgency = urgency
+        self.peak_urgency = max(self.peak_urgency, urgency)
+        if reason:
+            self.llm_calls += 1
+            self.since_llm = 0
+        else:
+            self.since_llm += 1
+        return TriageResult(urgency, level, matches, reason)
+
+    def stats(self):
+        return {
+            "assessed": self.assessed,
+            "llm_calls": self.llm_calls,
+            "skipped": self.assessed - self.llm_calls,
+            "last_urgency": self.last_urgency,
+            "peak_urgency": self.peak_urgency,
+        }
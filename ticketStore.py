@@ -0,0 +1,183 @@
+import bisect
+import json
+import os
+import tempfile
+import threading
+from collections import defaultdict
+from datetime import datetime
+from tracing import count, span
+
+TICKET_LOG = "ticket_log.jsonl"
+# Format consumed by dispatch tooling: {call_id: [entry, ...]}
+LEGACY_TICKET_LOG = "ticket_log.json"
+
+
+class TicketStore:
+    """
+    Append-only JSONL ticket log.
+
+    Each threat is one line, so writes cost the same no matter how much
+    history exists. Lines are indexed in memory by call id, threat type,
+    timestamp and threat score (as file offsets, not bodies). `export_json()` produces the old
+    `ticket_log.json` layout and `compact()` rewrites the log in place.
+    """
+
+    def __init__(self, path=TICKET_LOG, fsync=False):
+        self.path = path
+        self.fsync = fsync
+        self._lock = threading.Lock()
+        self._by_call = defaultdict(list)
+        self._by_type = defaultdict(list)
+        self._by_time = []
+        self._by_score = []
+        self._load_index()
+        self._file = open(self.path, "ab")
+        self._terminate_torn_line()
+
+    def _terminate_torn_line(self):
+        # Keep a torn last line from swallowing the next append
+        if os.path.getsize(self.path) > 0:
+            with open(self.path, "rb") as f:
+                f.seek(-1, os.SEEK_END)
+                if f.read(1) != b"\n":
+                    self._file.write(b"\n")
+                    self._file.flush()
+
+    def _index(self, record, offset):
+        self._by_call[record["call_id"]].append(offset)
+        self._by_type[record.get("type")].append(offset)
+        bisect.insort(self._by_time, (record.get("timestamp", ""), offset))
+        if isinstance(record.get("threat_score"), int):
+            bisect.insort(self._by_score, (record["threat_score"], offset))
+
+    def _load_index(self):
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, "rb") as f:
+            offset = 0
+            for line in f:
+                try:
+                    self._index(json.loads(line), offset)
+                except ValueError:
+                    # Torn final line from a crash; compact() drops it
+                    pass
+                offset += len(line)
+
+    def append(self, call_id, entry):
+        """Persist one ticket entry for `call_id` and return the stored record"""
+        record = {"call_id": call_id, **entry}
+        record.setdefault("timestamp", datetime.now().strftime("%Y-%m-%d %H:%M:%S.%f"))
+        line = (json.dumps(record, ensure_ascii=False) + "\n").encode("utf-8")
+        with span("ticket.append", call_id=call_id, type=record.get("type")), self._lock:
+            offset = self._file.seek(0, os.SEEK_END)
+            self._file.write(line)
+            self._file.flush()
+            if self.fsync:
+                os.fsync(self._file.fileno())
+            self._index(record, offset)
+        count("tickets.written", call_id=call_id)
+        return record
+
+    def _read(self, offsets):
+        records = []
+        with open(self.path, "rb") as f:
+            for offset in offsets:
+                f.seek(offset)
+                records.append(json.loads(f.readline()))
+        return records
+
+    def for_call(self, call_id):
+        with self._lock:
+            offsets = list(self._by_call.get(call_id, []))
+        return self._read(offsets)
+
+    def of_type(self, threat_type):
+        with self._lock:
+            offsets = list(self._by_type.get(threat_type, []))
+        return self._read(offsets)
+
+    def between(self, start, end):
+        """Tickets with start <= timestamp < end; bounds are timestamp strings"""
+        with self._lock:
+            lo = bisect.bisect_left(self._by_time, (start,))
+            hi = bisect.bisect_left(self._by_time, (end,))
+            offsets = [offset for _, offset in self._by_time[lo:hi]]
+        return self._read(offsets)
+
+    def at_least(self, score):
+        """Tickets with threat_score >= score, most urgent first"""
+        with self._lock:
+            lo = bisect.bisect_left(self._by_score, (score,))
+            offsets = [offset for _, offset in reversed(self._by_score[lo:])]
+        return self._read(offsets)
+
+    def call_ids(self):
+        with self._lock:
+            return list(self._by_call)
+
+    def _grouped(self):
+        with self._lock:
+            calls = {call_id: list(offsets) for call_id, offsets in self._by_call.items()}
+        grouped = {}
+        for call_id, offsets in calls.items():
+            grouped[call_id] = [
+                {k: v for k, v in record.items() if k != "call_id"}
+                for record in self._read(offsets)
+            ]
+        return grouped
+
+    def export_json(self, path=LEGACY_TICKET_LOG):
+        """Write every ticket in the `{call_id: [entries]}` format of ticket_log.json"""
+        _atomic_write(path, json.dumps(self._grouped(), indent=2, ensure_ascii=False).encode("utf-8"))
+        return path
+
+    def import_json(self, path=LEGACY_TICKET_LOG):
+        """Append tickets from an existing ticket_log.json"""
+        with open(path, "r") as f:
+            for call_id, entries in json.load(f).items():
+                for entry in entries:
+                    self.append(call_id, entry)
+
+    def compact(self):
+        """Rewrite the log grouped by call, dropping torn lines, and rebuild the index"""
+        with self._lock:
+            calls = {call_id: list(offsets) for call_id, offsets in self._by_call.items()}
+            lines = b"".join(
+                (json.dumps(record, ensure_ascii=False) + "\n").encode("utf-8")
+                for offsets in calls.values()
+                for record in self._read(offsets)
+            )
+            self._file.close()
+            _atomic_write(self.path, lines)
+            self._by_call.clear()
+            self._by_type.clear()
+            self._by_time = []
+            self._by_score = []
+            self._load_index()
+            self._file = open(self.path, "ab")
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+
+def _atomic_write(path, data):
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), suffix=".tmp")
+    with os.fdopen(fd, "wb") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_store():
+    """Process-wide ticket store shared by every handler"""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = TicketStore(os.environ.get("TICKET_LOG", TICKET_LOG))
+        return _store
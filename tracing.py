@@ -0,0 +1,211 @@
+import contextvars
+import itertools
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import threading
+import time
+from contextlib import nullcontext
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Upper bounds (seconds) of the Prometheus histogram buckets
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+_NOOP = nullcontext()
+_enabled = False
+_records = None
+_listener = None
+_server = None
+
+_call_id = contextvars.ContextVar("call_id", default=None)
+_parent = contextvars.ContextVar("span_parent", default=None)
+_span_ids = itertools.count(1)
+
+_lock = threading.Lock()
+_histograms = {}
+_counters = {}
+
+
+def set_call(call_id):
+    """Tag spans started from this thread (or task) and its to_thread helpers with `call_id`"""
+    _call_id.set(call_id)
+
+
+class _Span:
+    __slots__ = ("name", "call_id", "attrs", "span_id", "parent", "start", "wall", "_token")
+
+    def __init__(self, name, call_id, attrs):
+        self.name = name
+        self.call_id = call_id if call_id is not None else _call_id.get()
+        self.attrs = attrs
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+    def __enter__(self):
+        self.span_id = next(_span_ids)
+        self.parent = _parent.get()
+        self._token = _parent.set(self.span_id)
+        self.wall = time.time()
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        duration = time.perf_counter() - self.start
+        try:
+            _parent.reset(self._token)
+        except ValueError:
+            # A generator's span can end in a different context than it started
+            pass
+        _observe(self.name, duration, error=exc_type is not None)
+        if _records is not None:
+            record = {
+                "ts": self.wall,
+                "span": self.name,
+                "call_id": self.call_id,
+                "id": self.span_id,
+                "parent": self.parent,
+                "seconds": round(duration, 6),
+            }
+            if self.attrs:
+                record["attrs"] = self.attrs
+            if exc_type is not None:
+                record["error"] = exc_type.__name__
+            _records.put(record)
+        return False
+
+
+def span(name, call_id=None, **attrs):
+    """
+    Time a block as stage `name`. Disabled, this returns a shared no-op
+    context manager; enabled, the span is written to the trace file and
+    folded into the `/metrics` histograms.
+    """
+    if not _enabled:
+        return _NOOP
+    return _Span(name, call_id, attrs)
+
+
+def count(name, value=1, call_id=None):
+    """Add `value` to counter `name`"""
+    if not _enabled:
+        return
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + value
+    if _records is not None:
+        call_id = call_id if call_id is not None else _call_id.get()
+        _records.put({"ts": time.time(), "counter": name, "call_id": call_id, "value": value})
+
+
+def _observe(name, seconds, error=False):
+    with _lock:
+        histogram = _histograms.get(name)
+        if histogram is None:
+            histogram = _histograms[name] = {"buckets": [0] * len(BUCKETS), "count": 0, "sum": 0.0, "errors": 0}
+        for index, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                histogram["buckets"][index] += 1
+        histogram["count"] += 1
+        histogram["sum"] += seconds
+        histogram["errors"] += error
+
+
+def _label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def render_metrics():
+    """Prometheus text exposition of the span histograms and counters"""
+    with _lock:
+        histograms = {name: dict(h, buckets=list(h["buckets"])) for name, h in _histograms.items()}
+        counters = dict(_counters)
+
+    lines = ["# HELP call_stage_seconds Duration of call stages", "# TYPE call_stage_seconds histogram"]
+    for name, histogram in sorted(histograms.items()):
+        stage = _label(name)
+        for bound, hits in zip(BUCKETS, histogram["buckets"]):
+            lines.append(f'call_stage_seconds_bucket{{stage="{stage}",le="{bound}"}} {hits}')
+        lines.append(f'call_stage_seconds_bucket{{stage="{stage}",le="+Inf"}} {histogram["count"]}')
+        lines.append(f'call_stage_seconds_sum{{stage="{stage}"}} {histogram["sum"]}')
+        lines.append(f'call_stage_seconds_count{{stage="{stage}"}} {histogram["count"]}')
+    lines += ["# HELP call_stage_errors_total Stages that raised", "# TYPE call_stage_errors_total counter"]
+    for name, histogram in sorted(histograms.items()):
+        lines.append(f'call_stage_errors_total{{stage="{_label(name)}"}} {histogram["errors"]}')
+    lines += ["# HELP call_events_total Event counters", "# TYPE call_events_total counter"]
+    for name, value in sorted(counters.items()):
+        lines.append(f'call_events_total{{name="{_label(name)}"}} {value}')
+    return "\n".join(lines) + "\n"
+
+
+class _TraceListener(logging.handlers.QueueListener):
+    # Callers only enqueue dicts; JSON encoding and disk writes happen on the listener's thread
+    def prepare(self, record):
+        return logging.makeLogRecord({"msg": json.dumps(record, default=str)})
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        if self.path != "/metrics":
+            self.send_error(404)
+            return
+        body = render_metrics().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def configure(trace_file=None, metrics_port=None, max_bytes=10 * 1024 * 1024, backups=5):
+    """
+    Turn instrumentation on. Spans and counters go, one JSON object per line,
+    to `trace_file` (rotated at `max_bytes`, keeping `backups` old files) on a
+    background thread, and are served at http://:`metrics_port`/metrics.
+    With neither set, instrumentation stays off.
+    """
+    global _enabled, _records, _listener, _server
+    shutdown()
+    if trace_file:
+        handler = logging.handlers.RotatingFileHandler(trace_file, maxBytes=max_bytes, backupCount=backups,
+                                                       encoding="utf-8")
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        _records = queue.SimpleQueue()
+        _listener = _TraceListener(_records, handler)
+        _listener.start()
+    if metrics_port:
+        _server = ThreadingHTTPServer(("", int(metrics_port)), _MetricsHandler)
+        _server.daemon_threads = True
+        threading.Thread(target=_server.serve_forever, daemon=True).start()
+    _enabled = bool(trace_file or metrics_port)
+    return _enabled
+
+
+def configure_from_env():
+    """configure() from TRACE_FILE, TRACE_MAX_BYTES, TRACE_BACKUPS and METRICS_PORT"""
+    return configure(
+        trace_file=os.environ.get("TRACE_FILE"),
+        metrics_port=os.environ.get("METRICS_PORT"),
+        max_bytes=int(os.environ.get("TRACE_MAX_BYTES", 10 * 1024 * 1024)),
+        backups=int(os.environ.get("TRACE_BACKUPS", 5)),
+    )
+
+
+def shutdown():
+    """Flush the trace file, stop the metrics endpoint and turn instrumentation off"""
+    global _enabled, _records, _listener, _server
+    _enabled = False
+    _records = None
+    if _listener is not None:
+        _listener.stop()
+        for handler in _listener.handlers:
+            handler.close()
+        _listener = None
+    if _server is not None:
+        _server.shutdown()
+        _server.server_close()
+        _server = None
@@ -0,0 +1,134 @@
+from collections import namedtuple
+import numpy as np
+import torch
+from tracing import span
+from whisperHelper import get_model, inference_lock
+
+SAMPLE_RATE = 16000
+
+TranscriptEvent = namedtuple("TranscriptEvent", ["final", "text"])
+
+
+def pcm_to_float(audio_data):
+    """16-bit little-endian PCM bytes to the float32 [-1, 1] array Whisper expects"""
+    return np.frombuffer(audio_data, dtype=np.int16).astype(np.float32) / 32768.0
+
+
+class StreamingTranscriber:
+    """
+    Incremental Whisper transcription over a rolling audio window.
+
+    Segments that end well before the edge of the window are committed and
+    their audio is dropped, so each stretch of speech is decoded roughly once.
+    Whatever is left is the partial hypothesis, which `finalize()` reuses when
+    no new audio arrived since the last decode. With a TranscriptionService,
+    decodes are batched with other calls' instead of run on this thread.
+    """
+
+    def __init__(self, model=None, on_partial=None, on_final=None, language=None,
+                 min_new_audio=1.0, commit_margin=1.0, max_window=20.0, service=None):
+        self.model = model or get_model()
+        self.service = service
+        self.on_partial = on_partial
+        self.on_final = on_final
+        self.language = language
+        self.min_new_samples = int(min_new_audio * SAMPLE_RATE)
+        self.commit_margin = commit_margin
+        self.max_window_samples = int(max_window * SAMPLE_RATE)
+        self.decode_count = 0
+        self.reset()
+
+    def reset(self):
+        self._window = np.zeros(0, dtype=np.float32)
+        self._decoded_samples = 0
+        self._committed = []
+        self._pending = ""
+
+    @property
+    def has_audio(self):
+        return len(self._window) > 0 or bool(self._committed)
+
+    def _text(self):
+        return " ".join(t for t in self._committed + [self._pending] if t).strip()
+
+    def _decode(self):
+        # Committed text doubles as the prompt so the tail keeps its context
+        prompt = " ".join(self._committed)[-200:] or None
+        with span("transcribe", audio_seconds=round(len(self._window) / SAMPLE_RATE, 2)):
+            if self.service is not None:
+                result = self.service.transcribe(self._window, language=self.language, initial_prompt=prompt)
+            else:
+                # The model is shared with every other call in the process
+                with inference_lock(self.model):
+                    result = self.model.transcribe(
+                        self._window,
+                        fp16=torch.cuda.is_available(),
+                        language=self.language,
+                        initial_prompt=prompt,
+                        condition_on_previous_text=False,
+                    )
+        self.decode_count += 1
+        self._decoded_samples = len(self._window)
+        return result["segments"]
+
+    def _commit(self, segments, force=False):
+        duration = len(self._window) / SAMPLE_RATE
+        cut = 0.0
+        pending = []
+        for i, seg in enumerate(segments):
+            stable = seg["end"] <= duration - self.commit_margin and i < len(segments) - 1
+            if (force or stable) and not pending:
+                self._committed.append(seg["text"].strip())
+                cut = seg["end"]
+            else:
+                pending.append(seg["text"].strip())
+
+        if force:
+            cut = duration
+        if cut > 0:
+            cut_samples = min(int(cut * SAMPLE_RATE), len(self._window))
+            self._window = self._window[cut_samples:]
+            self._decoded_samples = max(0, self._decoded_samples - cut_samples)
+        self._pending = " ".join(t for t in pending if t)
+
+    def feed(self, audio_data):
+        """Add PCM bytes; returns a partial event when a new hypothesis was decoded"""
+        if audio_data:
+            self._window = np.concatenate([self._window, pcm_to_float(audio_data)])
+        if len(self._window) - self._decoded_samples < self.min_new_samples:
+            return None
+
+        segments = self._decode()
+        self._commit(segments, force=len(self._window) >= self.max_window_samples)
+        event = TranscriptEvent(False, self._text())
+        if self.on_partial and event.text:
+            self.on_partial(event.text)
+        return event
+
+    def finalize(self):
+        """Close the current utterance and return its final transcript"""
+        if len(self._window) > self._decoded_samples:
+            self._commit(self._decode(), force=True)
+        elif self._pending:
+            # Nothing new since the last partial, so keep that hypothesis as-is
+            self._committed.append(self._pending)
+
+        event = TranscriptEvent(True, self._text())
+        self.reset()
+        if self.on_final and event.text:
+            self.on_final(event.text)
+        return event
+
+    def stream(self, chunks):
+        """
+        Iterator API: consume PCM byte chunks and yield transcript events.
+        A `None` chunk marks the end of an utterance.
+        """
+        for chunk in chunks:
+            event = self.finalize() if chunk is None else self.feed(chunk)
+            if event and event.text:
+                yield event
+        if self.has_audio:
+            event = self.finalize()
+            if event.text:
+                yield event
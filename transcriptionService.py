@@ -0,0 +1,218 @@
+import os
+import queue
+import threading
+import time
+from collections import defaultdict, deque, namedtuple
+from concurrent.futures import Future
+import torch
+import whisper
+from latency import percentile
+from tracing import count, span
+from whisperHelper import DEFAULT_MODEL, get_model, inference_lock
+
+# Most utterances encoded together; WHISPER_MAX_BATCH=0 transcribes on each call's own thread
+MAX_BATCH = int(os.environ.get("WHISPER_MAX_BATCH", "8"))
+# How long the first utterance of a batch waits for others to join it
+MAX_WAIT = float(os.environ.get("WHISPER_MAX_WAIT_MS", "10")) / 1000
+# The thresholds whisper.transcribe() uses to retry a decode or call it silence
+COMPRESSION_RATIO_THRESHOLD = 2.4
+LOGPROB_THRESHOLD = -1.0
+NO_SPEECH_THRESHOLD = 0.6
+# Seconds per timestamp token
+TIME_PRECISION = 0.02
+
+_Request = namedtuple("_Request", ["audio", "language", "prompt", "future", "submitted"])
+
+
+class TranscriptionService:
+    """
+    One inference thread per Whisper model, shared by every call.
+
+    Calls submit utterance audio and block on the result; the thread takes
+    whatever is queued, up to `max_batch`, waiting at most `max_wait` seconds
+    for a batch to fill. A batch goes through the encoder as one tensor, then
+    requests with the same language and prompt are decoded together. A lone
+    request, audio over 30 seconds, and any decode whisper.transcribe() would
+    have retried at a higher temperature run through model.transcribe()
+    instead. Running everything on one thread also keeps concurrent calls
+    from installing their decoder KV-cache hooks on the shared model at once.
+    """
+
+    def __init__(self, model, max_batch=MAX_BATCH, max_wait=MAX_WAIT):
+        self.model = model
+        self.max_batch = max(1, max_batch)
+        self.max_wait = max_wait
+        self.fp16 = torch.cuda.is_available()
+        self._tokenizer = None
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._latencies = deque(maxlen=1000)
+        self._waits = deque(maxlen=1000)
+        self._batch_sizes = deque(maxlen=1000)
+        self.requests = 0
+        self.batches = 0
+        self.fallbacks = 0
+        self.audio_seconds = 0.0
+        self.busy_seconds = 0.0
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def submit(self, audio, language=None, initial_prompt=None):
+        """Queue float32 16 kHz audio; returns a Future of {"text", "segments"} like model.transcribe()"""
+        future = Future()
+        self._queue.put(_Request(audio, language, initial_prompt, future, time.perf_counter()))
+        count("transcribe.requests")
+        return future
+
+    def transcribe(self, audio, language=None, initial_prompt=None):
+        return self.submit(audio, language, initial_prompt).result()
+
+    def _collect(self):
+        first = self._queue.get()
+        if first is None:
+            return None
+        batch = [first]
+        deadline = time.perf_counter() + self.max_wait
+        while len(batch) < self.max_batch:
+            try:
+                request = self._queue.get(timeout=max(0.0, deadline - time.perf_counter()))
+            except queue.Empty:
+                break
+            if request is None:
+                # Finish this batch, then stop
+                self._queue.put(None)
+                break
+            batch.append(request)
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            if batch is None:
+                return
+            started = time.perf_counter()
+            try:
+                # Warmup or a transcriber without the service may hold the model too
+                with span("transcribe.batch", size=len(batch)), inference_lock(self.model):
+                    results = self._transcribe_batch(batch)
+            except Exception as e:
+                for request in batch:
+                    request.future.set_exception(e)
+                continue
+            finished = time.perf_counter()
+            for request, result in zip(batch, results):
+                request.future.set_result(result)
+            with self._lock:
+                self.requests += len(batch)
+                self.batches += 1
+                self.busy_seconds += finished - started
+                self.audio_seconds += sum(len(r.audio) for r in batch) / whisper.audio.SAMPLE_RATE
+                self._batch_sizes.append(len(batch))
+                for request in batch:
+                    self._waits.append(started - request.submitted)
+                    self._latencies.append(finished - request.submitted)
+
+    def _transcribe_one(self, request):
+        return self.model.transcribe(request.audio, fp16=self.fp16, language=request.language,
+                                     initial_prompt=request.prompt, condition_on_previous_text=False)
+
+    def _transcribe_batch(self, batch):
+        results = [None] * len(batch)
+        batched = [i for i, r in enumerate(batch) if len(r.audio) <= whisper.audio.N_SAMPLES]
+        if len(batched) < 2:
+            batched = []
+        for i in set(range(len(batch))) - set(batched):
+            results[i] = self._transcribe_one(batch[i])
+        if not batched:
+            return results
+
+        with torch.no_grad():
+            mel = torch.stack([
+                whisper.log_mel_spectrogram(whisper.pad_or_trim(batch[i].audio), n_mels=self.model.dims.n_mels)
+                for i in batched
+            ]).to(self.model.device)
+            features = self.model.encoder(mel.half() if self.fp16 else mel)
+
+            # Decoding options are per batch, so only requests that share them decode together
+            groups = defaultdict(list)
+            for position, i in enumerate(batched):
+                groups[(batch[i].language, batch[i].prompt)].append((position, i))
+            for (language, prompt), members in groups.items():
+                options = whisper.DecodingOptions(language=language, prompt=prompt, fp16=self.fp16)
+                decoded = whisper.decode(self.model, features[[position for position, _ in members]], options)
+                for (_, i), result in zip(members, decoded):
+                    results[i] = self._result(batch[i], result)
+        return results
+
+    def _result(self, request, result):
+        if result.no_speech_prob > NO_SPEECH_THRESHOLD and result.avg_logprob < LOGPROB_THRESHOLD:
+            return {"text": "", "segments": []}
+        if result.compression_ratio > COMPRESSION_RATIO_THRESHOLD or result.avg_logprob < LOGPROB_THRESHOLD:
+            # Greedy decode looks like a repetition loop or noise; let transcribe() retry with temperature
+            with self._lock:
+                self.fallbacks += 1
+            count("transcribe.fallbacks")
+            return self._transcribe_one(request)
+        segments = self._segments(result.tokens, len(request.audio) / whisper.audio.SAMPLE_RATE)
+        return {"text": "".join(segment["text"] for segment in segments), "segments": segments}
+
+    def _segments(self, tokens, duration):
+        # Timestamp tokens bracket each segment; text after the last one runs to the end of the audio
+        if self._tokenizer is None:
+            self._tokenizer = whisper.tokenizer.get_tokenizer(self.model.is_multilingual,
+                                                              num_languages=self.model.num_languages)
+        begin = self._tokenizer.timestamp_begin
+        segments, text, start = [], [], 0.0
+        for token in tokens:
+            if token < begin:
+                text.append(token)
+                continue
+            position = (token - begin) * TIME_PRECISION
+            if text:
+                segments.append({"start": start, "end": position, "text": self._tokenizer.decode(text)})
+                text = []
+            start = position
+        if text:
+            segments.append({"start": start, "end": duration, "text": self._tokenizer.decode(text)})
+        return segments
+
+    def stats(self):
+        """Requests, batch sizes, fallbacks, queue wait and latency (seconds), and audio seconds per busy second"""
+        with self._lock:
+            latencies, waits, sizes = list(self._latencies), list(self._waits), list(self._batch_sizes)
+            return {
+                "requests": self.requests,
+                "batches": self.batches,
+                "mean_batch": sum(sizes) / len(sizes) if sizes else None,
+                "fallbacks": self.fallbacks,
+                "wait_p50": percentile(waits, 50),
+                "wait_p95": percentile(waits, 95),
+                "latency_p50": percentile(latencies, 50),
+                "latency_p95": percentile(latencies, 95),
+                "realtime_factor": self.audio_seconds / self.busy_seconds if self.busy_seconds else None,
+            }
+
+    def close(self, timeout=5.0):
+        """Finish what is queued, then stop the thread"""
+        self._queue.put(None)
+        self._thread.join(timeout)
+
+
+_services = {}
+_services_lock = threading.Lock()
+
+
+def get_service(size=DEFAULT_MODEL):
+    """Shared TranscriptionService for the Whisper model `size`, or None with WHISPER_MAX_BATCH=0"""
+    if MAX_BATCH <= 0:
+        return None
+    with _services_lock:
+        if size not in _services:
+            _services[size] = TranscriptionService(get_model(size))
+        return _services[size]
+
+
+def service_stats():
+    with _services_lock:
+        services = dict(_services)
+    return {size: service.stats() for size, service in services.items()}
@@ -0,0 +1,102 @@
+import time
+from collections import deque, namedtuple
+import numpy as np
+
+try:
+    import webrtcvad
+except ImportError:
+    webrtcvad = None
+
+# kind is "start" (audio holds the pre-roll), "audio" (voiced frames) or "end"
+VADEvent = namedtuple("VADEvent", ["kind", "audio", "timestamp"])
+
+
+class VoiceActivityDetector:
+    """
+    Frame-level voice activity detection and endpointing for 16-bit mono PCM.
+
+    A frame is voiced when its RMS energy is `threshold_ratio` times above an
+    adaptive noise floor (tracked on unvoiced frames), and, if the optional
+    `webrtcvad` package is installed, webrtcvad agrees. An utterance starts
+    after `start_frames` voiced frames and ends after `hangover_ms` of
+    silence, or is cut at `max_utterance` seconds.
+    """
+
+    def __init__(self, sample_rate=16000, frame_ms=30, threshold_ratio=3.0, min_energy=150.0,
+                 start_frames=3, hangover_ms=400, preroll_ms=300, max_utterance=30.0,
+                 noise_adapt=0.05, aggressiveness=2):
+        self.sample_rate = sample_rate
+        self.frame_samples = sample_rate * frame_ms // 1000
+        self.frame_bytes = self.frame_samples * 2
+        self.threshold_ratio = threshold_ratio
+        self.min_energy = min_energy
+        self.start_frames = start_frames
+        self.hangover_frames = max(1, hangover_ms // frame_ms)
+        self.max_frames = int(max_utterance * 1000 / frame_ms)
+        self.noise_adapt = noise_adapt
+        self._webrtc = webrtcvad.Vad(aggressiveness) if webrtcvad else None
+        self._preroll = deque(maxlen=max(1, preroll_ms // frame_ms))
+        self._remainder = b""
+        self.noise_floor = None
+        self.reset()
+
+    def reset(self):
+        self.in_speech = False
+        self._voiced_run = 0
+        self._silent_run = 0
+        self._utterance_frames = 0
+        self._preroll.clear()
+
+    def _energies(self, frames):
+        samples = np.frombuffer(frames, dtype=np.int16).astype(np.float32).reshape(-1, self.frame_samples)
+        return np.sqrt(np.mean(samples * samples, axis=1))
+
+    def _is_voiced(self, frame, energy):
+        if self.noise_floor is None:
+            self.noise_floor = energy
+        voiced = energy > max(self.min_energy, self.noise_floor * self.threshold_ratio)
+        if voiced and self._webrtc is not None:
+            voiced = self._webrtc.is_speech(frame, self.sample_rate)
+        if not voiced:
+            self.noise_floor += self.noise_adapt * (energy - self.noise_floor)
+        return voiced
+
+    def process(self, pcm, timestamp=None):
+        """Feed PCM bytes of any length; returns the VADEvents they complete"""
+        timestamp = time.time() if timestamp is None else timestamp
+        data = self._remainder + pcm
+        usable = len(data) - len(data) % self.frame_bytes
+        self._remainder = data[usable:]
+        if not usable:
+            return []
+
+        events = []
+        voiced_audio = []
+        energies = self._energies(data[:usable])
+        for index, energy in enumerate(energies):
+            frame = data[index * self.frame_bytes:(index + 1) * self.frame_bytes]
+            voiced = self._is_voiced(frame, float(energy))
+
+            if not self.in_speech:
+                self._preroll.append(frame)
+                self._voiced_run = self._voiced_run + 1 if voiced else 0
+                if self._voiced_run >= self.start_frames:
+                    self.in_speech = True
+                    self._silent_run = 0
+                    self._utterance_frames = len(self._preroll)
+                    events.append(VADEvent("start", b"".join(self._preroll), timestamp))
+                    self._preroll.clear()
+                continue
+
+            voiced_audio.append(frame)
+            self._utterance_frames += 1
+            self._silent_run = 0 if voiced else self._silent_run + 1
+            if self._silent_run >= self.hangover_frames or self._utterance_frames >= self.max_frames:
+                events.append(VADEvent("audio", b"".join(voiced_audio), timestamp))
+                events.append(VADEvent("end", b"", timestamp))
+                voiced_audio = []
+                self.reset()
+
+        if voiced_audio:
+            events.append(VADEvent("audio", b"".join(voiced_audio), timestamp))
+        return events
@@ -1,22 +1,23 @@
-import asyncio
 import cv2
 import time
 import os
-import shutil
 import threading
 import warnings
-import whisper
-import speech_recognition as sr
-import numpy as np
 import torch
-import json
-from datetime import datetime, timedelta
+from datetime import datetime
+from functools import partial
 from queue import Queue
-from PIL import Image, ImageTk
-from text import transliterate_text
 from text_to_speech import text_to_speech
-from ollamaHelper import init_responder, image_responder, responder, clear_messages
-from threatHelper import init_threat_responder, threat_responder
+from ollamaHelper import payload_stats
+from capture import AudioCapture, iter_events
+from pipeline import CallPipeline
+from frameSampler import FrameSampler
+from visionWorker import VisionWorker
+from frameBuffer import FrameArchive, FrameRing
+from session import sessions
+from threatHelper import ticket_fields
+from tracing import set_call
+from transcriber import StreamingTranscriber
 
 class VideoHandler:
     def __init__(self):
@@ -25,49 +26,66 @@ class VideoHandler:
         self.video_thread = None
         self.audio_thread = None
         self.frame_label = None
-        self.output_dir = "captured_frames"
+        self.preview = None
+        # Set FRAME_ARCHIVE_DIR to keep a capped on-disk copy of sampled frames
+        self.archive_dir = os.environ.get("FRAME_ARCHIVE_DIR")
+        self.archive = None
+        self.frames = None
         self._lock = threading.Lock()
         
         # Audio components
         self.data_queue = Queue()
-        self.recorder = None
-        self.stop_listening = None
+        self.capture = None
         self.whisper_model = None
+        self.pipeline = None
+        # Anything with AudioCapture's / cv2.VideoCapture's interface; benchmarks feed recordings through them
+        self.capture_factory = AudioCapture
+        self.camera_factory = cv2.VideoCapture
+        # Plays the greeting and each reply sentence; the call server sends them to the caller instead
+        self.speaker = text_to_speech
+        # listener(kind, **fields) hears transcripts, replies, frame analyses and the end of the call
+        self.listener = None
         
-        # Ticket components
+        # Vision analysis runs off the capture thread
+        self.vision_worker = None
+        
+        # Call state; tickets are keyed by the session's call id in the ticket store
         self.user_id = ""
-        self.ticket = {}
+        self.session = None
         
-    def start_video(self, frame_label):
+    def _notify(self, kind, **fields):
+        if self.listener:
+            self.listener(kind, **fields)
+
+    def start_video(self, frame_label, source=0):
         if self.is_running:
             return False
             
-        # Generate user ID and initialize ticket
-        self.user_id = datetime.now().strftime("%Y%m%d%H%M%S%f")[:17]
-        self.ticket = {self.user_id: []}  # Changed to match ticket_log.json format
-            
-        # Set up output directory
-        if os.path.exists(self.output_dir) and os.path.isdir(self.output_dir):
-            shutil.rmtree(self.output_dir)
-        os.makedirs(self.output_dir, exist_ok=True)
-        
-        # Initialize video capture
-        self.cap = cv2.VideoCapture(0)
+        # Initialize video capture; `source` is a camera index or a video file
+        self.cap = self.camera_factory(source)
         if not self.cap.isOpened():
             print("Cannot open camera")
             return False
             
+        self.session = sessions.create("video")
+        self.user_id = self.session.call_id
+        self.data_queue = Queue()
         self.frame_label = frame_label
+        if frame_label is not None:
+            # Tk is only needed for a local preview; the headless call server never shows one
+            from preview import PreviewRenderer
+            self.preview = PreviewRenderer(frame_label)
+        else:
+            self.preview = None
+        self.frames = FrameRing()
+        if self.archive_dir:
+            self.archive = FrameArchive(os.path.join(self.archive_dir, self.user_id))
+        self.vision_worker = VisionWorker(self.session, partial(self._record_visual_threat, self.session))
         self.is_running = True
         
         # Initialize audio components
         self._setup_audio()
         
-        # Initialize ollama and threat responder
-        clear_messages()
-        init_responder()
-        init_threat_responder()
-        
         # Start video and audio threads
         self.video_thread = threading.Thread(target=self._video_process)
         self.audio_thread = threading.Thread(target=self._audio_process)
@@ -82,26 +100,15 @@ class VideoHandler:
         warnings.filterwarnings("ignore", category=UserWarning)
         torch.set_warn_always(False)
 
-        self.whisper_model = whisper.load_model("base")
+        self.whisper_model = self.session.whisper_model
         
-        self.recorder = sr.Recognizer()
-        self.recorder.energy_threshold = 1000
-        self.recorder.dynamic_energy_threshold = False
-
-        source = sr.Microphone(sample_rate=16000)
-        with source:
-            self.recorder.adjust_for_ambient_noise(source)
-
-        self.stop_listening = self.recorder.listen_in_background(
-            source, 
-            self._audio_callback, 
-            phrase_time_limit=5
-        )
+        # VAD endpointing replaces the fixed energy threshold and phrase timeout
+        self.capture = self.capture_factory(self._audio_callback)
+        self.capture.start()
         
-    def _audio_callback(self, _, audio: sr.AudioData) -> None:
+    def _audio_callback(self, event):
         if self.is_running:
-            data = audio.get_raw_data()
-            self.data_queue.put(data)
+            self.data_queue.put(event)
         
     def stop_video(self):
         with self._lock:
@@ -109,10 +116,17 @@ class VideoHandler:
                 return
                 
             self.is_running = False
+            if self.preview:
+                self.preview.stop()
             
-            if self.stop_listening:
-                self.stop_listening(wait_for_stop=False)
+            if self.capture:
+                self.capture.stop()
             
+            # The consumer blocks on the queue; the sentinel wakes it so the join returns at once
+            self.data_queue.put(None)
+            # Likewise a camera whose read() blocks until a frame arrives, like the call server's
+            if hasattr(self.cap, "close"):
+                self.cap.close()
             if threading.current_thread() != self.video_thread:
                 if self.video_thread:
                     self.video_thread.join(timeout=1.0)
@@ -123,105 +137,82 @@ class VideoHandler:
             if self.cap and self.cap.isOpened():
                 self.cap.release()
             
-            self.data_queue.queue.clear()
+            self.vision_worker.stop()
+            if self.archive:
+                self.archive.close()
+                self.archive = None
             cv2.destroyAllWindows()
+            sessions.end(self.user_id)
             print("\n\n Video and Audio stopped \n\n")
+            print("Responder payloads:", payload_stats())
+            print("Vision worker:", self.vision_stats())
             
-            # Save final ticket state if there are any threats
-            if self.ticket[self.user_id]:
-                try:
-                    # Load existing tickets if any
-                    if os.path.exists("ticket_log.json"):
-                        with open("ticket_log.json", "r") as f:
-                            existing_tickets = json.load(f)
-                            existing_tickets.update(self.ticket)
-                    else:
-                        existing_tickets = self.ticket
-
-                    with open("ticket_log.json", "w") as f:
-                        json.dump(existing_tickets, f, indent=2)
-                except Exception as e:
-                    print(f"Error saving ticket: {e}")
-                    
-            self.ticket = {}
-    
     def _audio_process(self):
         print("\n\n Audio Recording started \n\n")
-        phrase_time = None
-        phrase_timeout = 3
+        session = self.session
+        set_call(session.call_id)
+        transcriber = StreamingTranscriber(self.whisper_model, service=session.transcription)
+        # Bind this call's session so threat scores that finish after the call ends still land on its ticket
+        pipeline = CallPipeline(session, on_threat=partial(self._record_threat, session),
+                                prefix="[VIDEO CALL] ", speaker=self.speaker)
+        self.pipeline = pipeline
         
-        initial_response = init_responder()
+        # Initialize ollama and threat responder
+        initial_response = session.start()
         if initial_response[0]:
-            text_to_speech(initial_response[1])
+            self._notify("reply", text=initial_response[1], end_call=False)
+            self.speaker(initial_response[1])
+        reason = "stopped"
         
-        while self.is_running:
+        events = iter_events(self.data_queue, lambda: self.is_running,
+                             partial(pipeline.timings.record, "handoff"))
+        for event in events:
             try:
-                now = datetime.utcnow()
-                
-                if not self.data_queue.empty():
-                    phrase_complete = False
-                    if phrase_time and now - phrase_time > timedelta(seconds=phrase_timeout):
-                        phrase_complete = True
-
-                    phrase_time = now
-                    audio_data = b''.join(self.data_queue.queue)
-                    self.data_queue.queue.clear()
-
-                    audio_np = np.frombuffer(audio_data, dtype=np.int16).astype(np.float32) / 32768.0
-
-                    result = self.whisper_model.transcribe(audio_np)
-                    text = result['text'].strip()
-
-                    if phrase_complete and len(text) > 0:
-                        print("\n**  "+text+"  **", flush=True)
-                        val = responder(f"[VIDEO CALL] {text}")
-                        if val[0] == False:
-                            self.stop_video()
-                            break
+                if event.kind != "end":
+                    transcriber.feed(event.audio)
+                    continue
 
-                        tranliterated_text = transliterate_text(val[1])
-                        text_to_speech(tranliterated_text)
-                        
-                        # Process threat and update ticket
-                        threat = asyncio.run(threat_responder(text))
-                        if threat[0] == True:
-                            current_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S.%f")
-                            ticket_entry = {
-                                "type": "video_audio_threat",
-                                "timestamp": current_time,
-                                "message": text,
-                                "details": threat[1]
-                            }
-                            self.ticket[self.user_id].append(ticket_entry)
-                            
-                            try:
-                                # Load existing tickets if any
-                                if os.path.exists("ticket_log.json"):
-                                    with open("ticket_log.json", "r") as f:
-                                        existing_tickets = json.load(f)
-                                        existing_tickets.update(self.ticket)
-                                else:
-                                    existing_tickets = self.ticket
+                # The caller stopped talking
+                with pipeline.timings.measure("transcribe"):
+                    text = transcriber.finalize().text
 
-                                with open("ticket_log.json", "w") as f:
-                                    json.dump(existing_tickets, f, indent=2)
-                                    
-                                # print("******** TICKET:", self.ticket[self.user_id], "********")
-                            except Exception as e:
-                                print(f"Error saving ticket: {e}")
-                                
-                else:
-                    time.sleep(0.25)
+                if len(text) > 0:
+                    print("\n**  "+text+"  **", flush=True)
+                    self._notify("transcript", text=text)
+                    # Threat scoring runs alongside the reply and writes its own ticket
+                    val = pipeline.process(text)
+                    self._notify("reply", text=val[1], end_call=not val[0])
+                    if val[0] == False:
+                        reason = "responder"
+                        self.stop_video()
+                        break
             except Exception as e:
                 print(f"Error in audio processing: {e}")
                 continue
+
+        pipeline.close()
+        print("Stage timings:", pipeline.timings.summary())
+        self._notify("ended", reason=reason, timings=pipeline.timings.summary())
+
+    def _record_threat(self, session, text, threat):
+        if threat[0] == True:
+            current_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S.%f")
+            ticket_entry = {
+                "type": "video_audio_threat",
+                "timestamp": current_time,
+                "message": text,
+                **ticket_fields(threat[1])
+            }
+            try:
+                session.record_ticket(ticket_entry)
+            except Exception as e:
+                print(f"Error saving ticket: {e}")
         
     def _video_process(self):
         print("\n\n Video started \n\n")
         frame_interval = 1.0
         last_saved_time = time.time()
-        frame_count = 0
-        last_process_time = time.time()
+        sampler = FrameSampler()
         
         try:
             while self.is_running:
@@ -231,77 +222,55 @@ class VideoHandler:
                     print("Failed to grab frame")
                     continue
                     
-                # Update the GUI with the current frame
-                if self.frame_label is not None:
-                    try:
-                        frame = cv2.resize(frame, (400, 300))
-                        frame_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-                        img = Image.fromarray(frame_rgb)
-                        imgtk = ImageTk.PhotoImage(image=img)
-                        self.frame_label.after(0, self._update_label, imgtk)
-                    except Exception as e:
-                        print(f"Error updating frame: {e}")
-                        continue
+                # Update the GUI with the current frame; throttled and coalesced by the renderer
+                if self.preview is not None:
+                    self.preview.submit(frame)
                 
                 current_time = time.time()
-                if current_time - last_saved_time >= frame_interval:
+                # Cheap change detection on every frame decides when the vision model runs
+                analyze = sampler.should_analyze(frame, current_time)
+                # Without an archive only frames the model sees are encoded
+                archive = self.archive is not None and current_time - last_saved_time >= frame_interval
+                if analyze or archive:
                     try:
-                        frame_filename = os.path.join(self.output_dir, f"frame_{frame_count}.jpg")
-                        cv2.imwrite(frame_filename, frame)
-                        frame_count += 1
-                        last_saved_time = current_time
-                        
-                        if frame_count % 20 == 0 and (current_time - last_process_time) >= 5.0:
-                            image_path = f"./{self.output_dir}/frame_{frame_count-1}.jpg"
-                            
-                            try:
-                                response = asyncio.run(image_responder([image_path]))
-                                last_process_time = current_time
-                                
-                                if "[THREAT]" in response:
-                                    current_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S.%f")
-                                    ticket_entry = {
-                                        "type": "video_visual_threat",
-                                        "timestamp": current_time,
-                                        "frame": image_path,
-                                        "details": response
-                                    }
-                                    self.ticket[self.user_id].append(ticket_entry)
-                                    
-                                    try:
-                                        # Load existing tickets if any
-                                        if os.path.exists("ticket_log.json"):
-                                            with open("ticket_log.json", "r") as f:
-                                                existing_tickets = json.load(f)
-                                                existing_tickets.update(self.ticket)
-                                        else:
-                                            existing_tickets = self.ticket
-
-                                        with open("ticket_log.json", "w") as f:
-                                            json.dump(existing_tickets, f, indent=2)
-                                            
-                                        print("******** VIDEO TICKET:", self.ticket[self.user_id], "********")
-                                    except Exception as e:
-                                        print(f"Error saving ticket: {e}")
-                                    
-                            except Exception as e:
-                                print(f"Error in image processing: {e}")
-                                
+                        # Encoded once at model size; the same bytes feed the model and the archive
+                        encoded = self.frames.add(frame, current_time)
+                        if self.archive:
+                            last_saved_time = current_time
+                            self.archive.add(encoded)
+                        if analyze:
+                            # Never blocks; a busy worker just picks up the newest frame next
+                            self.vision_worker.submit(encoded)
                     except Exception as e:
-                        print(f"Error saving frame: {e}")
-                        continue
-                
-                time.sleep(0.01)
+                        print(f"Error encoding frame: {e}")
                 
         except Exception as e:
             print(f"Error in video processing: {e}")
         finally:
-            with self._lock:
-                if self.cap and self.cap.isOpened():
-                    self.cap.release()
-                cv2.destroyAllWindows()
+            # stop_video releases the camera itself while holding the lock and joining this thread;
+            # this only covers a loop that died on an error
+            if self.is_running:
+                with self._lock:
+                    if self.cap and self.cap.isOpened():
+                        self.cap.release()
+                    cv2.destroyAllWindows()
                 
-    def _update_label(self, imgtk):
-        if self.frame_label and self.is_running:
-            self.frame_label.imgtk = imgtk
-            self.frame_label.configure(image=imgtk)
\ No newline at end of file
+    def _record_visual_threat(self, session, frame, response):
+        self._notify("vision", frame=frame.frame_id, text=response)
+        if "[THREAT]" in response:
+            current_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S.%f")
+            ticket_entry = {
+                "type": "video_visual_threat",
+                "timestamp": current_time,
+                "frame": self.archive.path_for(frame) if self.archive else frame.frame_id,
+                "details": response
+            }
+            try:
+                session.record_ticket(ticket_entry)
+                print("******** VIDEO TICKET:", ticket_entry, "********")
+            except Exception as e:
+                print(f"Error saving ticket: {e}")
+
+    def vision_stats(self):
+        """Frames analyzed and dropped by the vision worker, and analysis lag in seconds"""
+        return self.vision_worker.stats() if self.vision_worker else {}
@@ -0,0 +1,93 @@
+import asyncio
+import threading
+import time
+from collections import deque
+from ollamaClient import aclose
+from tracing import count, set_call
+
+
+class LatestFrameMailbox:
+    """Single-slot handoff: a new frame replaces one that hasn't been picked up yet"""
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._item = None
+        self._closed = False
+        self.dropped = 0
+
+    def put(self, item):
+        with self._cond:
+            if self._item is not None:
+                self.dropped += 1
+                count("vision.frames_dropped")
+            self._item = item
+            self._cond.notify()
+
+    def get(self, timeout=None):
+        """Next item, or None once closed (or on timeout)"""
+        with self._cond:
+            self._cond.wait_for(lambda: self._item is not None or self._closed, timeout)
+            item, self._item = self._item, None
+            return item
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+
+class VisionWorker:
+    """
+    Runs vision analysis for one call on its own thread so the capture loop
+    never waits on the model. `submit()` takes an EncodedFrame and never
+    blocks; if the model is still busy, older unanalyzed frames are dropped in
+    favour of the newest one. `on_result(frame, response)` is called on the
+    worker thread.
+    """
+
+    def __init__(self, session, on_result):
+        self.session = session
+        self.on_result = on_result
+        self.mailbox = LatestFrameMailbox()
+        self.analyzed = 0
+        self._lags = deque(maxlen=100)
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def submit(self, frame):
+        self.mailbox.put(frame)
+
+    def _run(self):
+        set_call(self.session.call_id)
+        loop = asyncio.new_event_loop()
+        try:
+            while True:
+                frame = self.mailbox.get()
+                if frame is None:
+                    return
+                try:
+                    # JPEG bytes go to the model directly; nothing is read back from disk
+                    response = loop.run_until_complete(self.session.describe_images([frame.jpeg]))
+                    # Lag: from capture of the frame to having its analysis
+                    self._lags.append(time.time() - frame.captured_at)
+                    self.analyzed += 1
+                    self.on_result(frame, response)
+                except Exception as e:
+                    print(f"Error in image processing: {e}")
+        finally:
+            loop.run_until_complete(aclose())
+            loop.close()
+
+    def stats(self):
+        lags = list(self._lags)
+        return {
+            "analyzed": self.analyzed,
+            "dropped": self.mailbox.dropped,
+            "last_lag": lags[-1] if lags else None,
+            "mean_lag": sum(lags) / len(lags) if lags else None,
+        }
+
+    def stop(self, timeout=1.0):
+        self.mailbox.close()
+        if threading.current_thread() is not self._thread:
+            self._thread.join(timeout)
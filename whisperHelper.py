@@ -0,0 +1,105 @@
+import os
+import resource
+import sys
+import threading
+import time
+import warnings
+import numpy as np
+import torch
+import whisper
+
+warnings.filterwarnings("ignore", category=FutureWarning, module="whisper")
+warnings.filterwarnings("ignore", category=UserWarning, module="whisper")
+
+# Model sizes used by the entry points; override with WHISPER_MODELS=base,small
+DEFAULT_MODEL = os.environ.get("WHISPER_MODEL", "base")
+CONFIGURED_MODELS = [m.strip() for m in os.environ.get("WHISPER_MODELS", DEFAULT_MODEL).split(",") if m.strip()]
+
+_models = {}
+_stats = {}
+_locks = {}
+# Model id -> lock held for inference; torch modules aren't safe to run from two threads at once
+_inference_locks = {}
+_registry_lock = threading.Lock()
+
+
+def _rss_mb():
+    """Current resident set size of this process in MB"""
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[1])
+        return pages * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    except (OSError, ValueError):
+        # ru_maxrss is KB on Linux and bytes on macOS; this is the peak, not current
+        maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return maxrss / (1024 * 1024) if sys.platform == "darwin" else maxrss / 1024
+
+
+def _size_lock(size):
+    with _registry_lock:
+        if size not in _locks:
+            _locks[size] = threading.Lock()
+        return _locks[size]
+
+
+def get_model(size=DEFAULT_MODEL):
+    """Return the shared Whisper model for `size`, loading it on first use"""
+    model = _models.get(size)
+    if model is not None:
+        return model
+
+    # One lock per size so loading "small" doesn't block callers of "base"
+    with _size_lock(size):
+        model = _models.get(size)
+        if model is not None:
+            return model
+
+        torch.set_warn_always(False)
+        rss_before = _rss_mb()
+        start = time.perf_counter()
+        model = whisper.load_model(size)
+        _stats[size] = {
+            "load_seconds": round(time.perf_counter() - start, 3),
+            "rss_delta_mb": round(_rss_mb() - rss_before, 1),
+            "warmup_seconds": None,
+        }
+        inference_lock(model)
+        _models[size] = model
+        print(f"Loaded Whisper '{size}' in {_stats[size]['load_seconds']}s "
+              f"(+{_stats[size]['rss_delta_mb']} MB)", flush=True)
+        return model
+
+
+def inference_lock(model):
+    """The lock to hold while running `model`, shared by every session using it"""
+    with _registry_lock:
+        if id(model) not in _inference_locks:
+            _inference_locks[id(model)] = threading.Lock()
+        return _inference_locks[id(model)]
+
+
+def warmup(size=DEFAULT_MODEL):
+    """Run one dummy inference so the first real call doesn't pay for kernel setup"""
+    model = get_model(size)
+    silence = np.zeros(whisper.audio.SAMPLE_RATE, dtype=np.float32)
+    start = time.perf_counter()
+    with inference_lock(model):
+        model.transcribe(silence, fp16=torch.cuda.is_available())
+    _stats[size]["warmup_seconds"] = round(time.perf_counter() - start, 3)
+
+
+def preload(sizes=None, warm=True):
+    """Load (and optionally warm) every configured model size at startup"""
+    for size in sizes or CONFIGURED_MODELS:
+        get_model(size)
+        if warm:
+            warmup(size)
+    return model_stats()
+
+
+def model_stats():
+    """Load time, warmup time and RSS growth per loaded model, plus current RSS"""
+    return {
+        "models": {size: dict(stats) for size, stats in _stats.items()},
+        "rss_mb": round(_rss_mb(), 1),
+    }